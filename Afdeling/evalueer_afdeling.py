@@ -0,0 +1,246 @@
+"""
+Evaluatie van STOPP/START, ACB en dubbelmedicatie voor een hele afdeling tegelijk.
+
+Alle patiënten worden gecodeerd als incidentiematrices (NumPy, bool):
+    middelen  patiënt × token   (token = middelnaam of groepsnaam)
+    groepen   patiënt × token
+Criteria worden via de inverted indexes van de regels als token × criterium matrices
+opgebouwd, alleen voor tokens die op de afdeling voorkomen. Welke criteria bij welke
+patiënt afgaan volgt dan uit een paar matrixproducten; alleen voor die treffers wordt
+de tekst ('Getriggerd door') per patiënt samengesteld.
+
+De uitvoer is per patiënt gelijk aan check_stopp_criteria, check_start_criteria,
+bereken_acb_score en check_dubbelmedicatie. Daarnaast de dagdosis in mg per middel, uit de
+doseringen van de hele afdeling als arrays (DoseringTabel), als basis voor dosisregels.
+"""
+
+import numpy as np
+from collections import defaultdict
+from Database import referentie_db
+from START_STOP.regel_engine import groepeer, formatteer_trigger, formatteer_start_trigger, EGFR_OPERATOREN
+from Anticholinerge_Score.check_acb import interpreteer_acb_score
+from Parsers.dosering import DoseringTabel
+
+
+def _incidentie(rijen, kolommen, vorm):
+    matrix = np.zeros(vorm, dtype=bool)
+    if rijen:
+        matrix[rijen, kolommen] = True
+    return matrix
+
+
+def _context_masker(regels, leeftijden, egfrs):
+    """
+    patiënt × criterium: voldoet de patiënt aan leeftijd- en eGFR-eisen (zie maak_predicaat).
+    """
+    criteria = regels.criteria
+    leeftijd = np.array([np.nan if l is None else l for l in leeftijden], dtype=float)[:, None]
+    egfr = np.array([np.nan if e is None else e for e in egfrs], dtype=float)[:, None]
+
+    age_min = np.array([np.nan if c.age_min is None else c.age_min for c in criteria], dtype=float)[None, :]
+    # Onbekende leeftijd of geen leeftijdseis → leeftijd telt niet mee
+    with np.errstate(invalid="ignore"):
+        masker = np.isnan(age_min) | np.isnan(leeftijd) | (leeftijd >= age_min)
+
+    for op, test in EGFR_OPERATOREN.items():
+        kolommen = [c.volgnummer for c in criteria if c.egfr_operator == op]
+        if not kolommen:
+            continue
+        waarden = np.array([criteria[k].egfr_waarde for k in kolommen], dtype=float)[None, :]
+        # Onbekende eGFR → criterium vervalt (NaN-vergelijkingen zijn False)
+        with np.errstate(invalid="ignore"):
+            masker[:, kolommen] &= ~np.isnan(egfr) & test(egfr, waarden)
+    return masker
+
+
+def _evalueer_regels(regels, per_patiënt, leeftijden, egfrs):
+    """
+    per_patiënt: lijst van (alle_middelen, alle_groepen, groep_to_middelen)
+    Returns: (stopp per patiënt, start per patiënt)
+    """
+    P, K = len(per_patiënt), len(regels.criteria)
+    tokens = {}
+    mid_r, mid_k, grp_r, grp_k = [], [], [], []
+    for p, (alle_middelen, alle_groepen, _) in enumerate(per_patiënt):
+        for middel in alle_middelen:
+            mid_r.append(p)
+            mid_k.append(tokens.setdefault(middel, len(tokens)))
+        for groep in alle_groepen:
+            grp_r.append(p)
+            grp_k.append(tokens.setdefault(groep, len(tokens)))
+    T = len(tokens)
+    M_mid = _incidentie(mid_r, mid_k, (P, T))
+    M_grp = _incidentie(grp_r, grp_k, (P, T))
+    M_tok = M_mid | M_grp
+
+    # Token × criterium, gevuld vanuit de inverted indexes (onafhankelijk van het aantal criteria)
+    C_stof = np.zeros((T, K), dtype=bool)
+    C_groep = np.zeros((T, K), dtype=bool)
+    C_combi = {bit: np.zeros((T, K), dtype=bool) for bit in (1, 2, 4)}
+    for token, t in tokens.items():
+        C_stof[t, regels.stof_index.get(token, [])] = True
+        C_groep[t, regels.groep_index.get(token, [])] = True
+        for volgnummer, bit in regels.combi_index.get(token, ()):
+            C_combi[bit][t, volgnummer] = True
+
+    stof_hit = M_mid @ C_stof
+    groep_hit = M_grp @ C_groep
+    combi_masker = np.zeros((P, K), dtype=np.int8)
+    for bit, C in C_combi.items():
+        combi_masker |= (M_tok @ C).astype(np.int8) * bit
+
+    type_ = np.array([c.type for c in regels.criteria])
+    vereist = np.array([c.combi_vereist for c in regels.criteria], dtype=np.int8)[None, :]
+    context = _context_masker(regels, leeftijden, egfrs)
+
+    combi_match = (vereist > 0) & (combi_masker == vereist)
+    stop_hit = (type_ == "STOP")[None, :] & context & (stof_hit | groep_hit | combi_match)
+    start_hit = ((type_ == "START")[None, :] & context & ((combi_masker & vereist) == vereist)
+                 & ~(stof_hit | groep_hit))
+
+    stopp = [[] for _ in range(P)]
+    for p, k in np.argwhere(stop_hit):
+        crit = regels.criteria[k]
+        matched = crit.gematchte_middelen(*per_patiënt[p], bool(combi_match[p, k]))
+        stopp[p].append(formatteer_trigger(crit, matched))
+
+    start = [[] for _ in range(P)]
+    for p, k in np.argwhere(start_hit):
+        crit = regels.criteria[k]
+        start[p].append(formatteer_start_trigger(crit, crit.indicatie_middelen(*per_patiënt[p])))
+    return stopp, start
+
+
+def _evalueer_acb(acb_tabel, medicatielijsten, spkodes_per_patiënt):
+    P = len(medicatielijsten)
+    entries = {}
+    rijen, kolommen = [], []
+    for p, (medicatielijst, spkodes) in enumerate(zip(medicatielijsten, spkodes_per_patiënt)):
+        for middel, spkode in zip(medicatielijst, spkodes):
+            entry = acb_tabel.zoek(middel, spkode)
+            if entry:
+                rijen.append(p)
+                kolommen.append(entries.setdefault(entry, len(entries)))
+
+    # Kolommen op volgorde in acb.json, zodat de bijdragende middelen al gesorteerd zijn
+    volgorde = sorted(entries, key=lambda entry: entry[0])
+    herschik = np.empty(len(volgorde), dtype=int)
+    for nieuw, entry in enumerate(volgorde):
+        herschik[entries[entry]] = nieuw
+    A = _incidentie(rijen, list(herschik[kolommen]) if kolommen else [], (P, len(volgorde)))
+    scores = np.array([entry[2] for entry in volgorde], dtype=int)
+    totalen = A.astype(int) @ scores
+
+    resultaten = []
+    for p in range(P):
+        totaal = int(totalen[p])
+        bijdrage = [{"middel": volgorde[e][1], "score": volgorde[e][2]} for e in np.flatnonzero(A[p])]
+        resultaten.append((totaal, interpreteer_acb_score(totaal), bijdrage))
+    return resultaten
+
+
+def _evalueer_dubbelmedicatie(medicatielijsten, groepen):
+    P = len(medicatielijsten)
+    groep_kolom = {}
+    rijen, kolommen = [], []
+    regels_per_patiënt = []
+    for p, medicatielijst in enumerate(medicatielijsten):
+        regels = []
+        for middel in medicatielijst:
+            if middel.lower() in groepen:
+                groep = groepen[middel.lower()]
+                rijen.append(p)
+                kolommen.append(groep_kolom.setdefault(groep, len(groep_kolom)))
+                regels.append((groep, middel))
+            else:
+                print(f"Waarschuwing: '{middel}' niet gevonden in database.")
+        regels_per_patiënt.append(regels)
+
+    # patiënt × groep: aantal regels per groep; ≥2 is dubbelmedicatie
+    aantallen = np.zeros((P, len(groep_kolom)), dtype=int)
+    if rijen:
+        np.add.at(aantallen, (rijen, kolommen), 1)
+    dubbel = aantallen >= 2
+
+    resultaten = []
+    for p, regels in enumerate(regels_per_patiënt):
+        if not dubbel[p].any():
+            resultaten.append([])
+            continue
+        groep_dict = defaultdict(list)
+        for groep, middel in regels:
+            if dubbel[p, groep_kolom[groep]]:
+                groep_dict[groep].append(middel)
+        resultaten.append([{'groep': groep, 'middelen': middelen} for groep, middelen in groep_dict.items()])
+    return resultaten
+
+
+def _evalueer_doseringen(medicatielijsten, doseringen_per_patiënt):
+    """
+    Per patiënt {middel: vaste mg per dag}, opgeteld over de continue regels van dat middel.
+    Zo-nodigregels tellen niet mee (het schema is een maximum, geen dagdosis); een middel met
+    alleen zo-nodigregels staat er niet in. Alleen middelen waarvan elke continue regel een
+    bekende dagdosis in mg heeft (stuks met sterkte, of mg na het samenvoegen van verschillende
+    sterktes).
+    """
+    P = len(medicatielijsten)
+    tabel = DoseringTabel(doseringen_per_patiënt)
+    middel_kolom = {}
+    kolommen = [middel_kolom.setdefault(middel, len(middel_kolom)) for lijst in medicatielijsten for middel in lijst]
+
+    # patiënt × middel; een NaN-regel maakt het totaal van dat middel NaN
+    totalen = np.zeros((P, len(middel_kolom)), dtype=np.float64)
+    aanwezig = np.zeros((P, len(middel_kolom)), dtype=bool)
+    if kolommen:
+        continu = ~tabel.zo_nodig
+        kolommen = np.asarray(kolommen)[continu]
+        np.add.at(totalen, (tabel.patiënt[continu], kolommen), tabel.dagdosis_mg[continu])
+        aanwezig[tabel.patiënt[continu], kolommen] = True
+
+    middelen = list(middel_kolom)
+    resultaten = []
+    for p in range(P):
+        kolom = np.flatnonzero(aanwezig[p] & ~np.isnan(totalen[p]))
+        resultaten.append({middelen[k]: round(float(totalen[p, k]), 3) for k in kolom})
+    return resultaten
+
+
+def evalueer_afdeling(patiënten, regels, acb_tabel, db_path='geneesmiddelen.db'):
+    """
+    patiënten: lijst van dicts met
+        'medicatielijst' (namen), 'spkodes' (per regel, of None), 'leeftijd', 'egfr',
+        optioneel 'doseringen' (Dosering per regel, of None)
+    regels: gecompileerde STOPP/START-regels (regel_engine.laad_regels)
+    acb_tabel: AcbTabel (check_acb.laad_acb_tabel)
+
+    Returns: per patiënt een dict met 'stopp', 'start', 'acb', 'dubbelmedicatie' en 'dagdosis_mg'.
+    """
+    if not patiënten:
+        return []
+
+    medicatielijsten = [p["medicatielijst"] for p in patiënten]
+    # Eén gebatchte groep-lookup voor de hele afdeling
+    groepen = referentie_db.zoek_groepen({m.lower() for lijst in medicatielijsten for m in lijst}, db_path)
+
+    per_patiënt = []
+    for medicatielijst in medicatielijsten:
+        middel_to_groep = {middel.lower(): groepen.get(middel.lower()) for middel in medicatielijst}
+        per_patiënt.append(groepeer(middel_to_groep))
+
+    stopp, start = _evalueer_regels(
+        regels, per_patiënt, [p.get("leeftijd") for p in patiënten], [p.get("egfr") for p in patiënten]
+    )
+    acb = _evalueer_acb(
+        acb_tabel, medicatielijsten,
+        [p.get("spkodes") or [None] * len(p["medicatielijst"]) for p in patiënten]
+    )
+    dubbel = _evalueer_dubbelmedicatie(medicatielijsten, groepen)
+    dagdosis = _evalueer_doseringen(
+        medicatielijsten, [p.get("doseringen") or [None] * len(p["medicatielijst"]) for p in patiënten]
+    )
+
+    return [
+        {"stopp": stopp[p], "start": start[p], "acb": acb[p], "dubbelmedicatie": dubbel[p],
+         "dagdosis_mg": dagdosis[p]}
+        for p in range(len(patiënten))
+    ]
@@ -1,30 +1,252 @@
+import os
+import re
 import json
+import threading
+from collections import defaultdict
+from Database import referentie_db
+from Parsers.gstandaard import normaliseer_naam
 
-def bereken_acb_score(medicatielijst, json_path="Anticholinerge_Score/acb.json"):
+def laad_acb_scores(json_path="Anticholinerge_Score/acb.json"):
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return data["scores"]
+
+# ---------------------------
+# Gecompileerde opzoektabel
+# ---------------------------
+
+_MAX_MEMO = 10000
+
+_TOELICHTING_RE = re.compile(r"\(([^)]*)\)")
+
+_WOORD_RE = re.compile(r"[a-z]+")
+
+# Toedieningsvormen zoals ze als heel woord in Medimo-/G-Standaard-namen staan (afkortingen inbegrepen)
+_INHALATIE = frozenset({"aerosol", "inhalator", "inhpdr", "inhalatiepoeder", "inhcaps", "inhalatiecapsule",
+                        "vernevelvloeistof", "verneveloplossing", "diskus", "ellipta", "turbuhaler", "autohaler",
+                        "spiromax", "easyhaler", "novolizer", "respimat"})
+_NASAAL = frozenset({"neusspray", "neusdruppels", "neusdr", "neusgel", "neuszalf", "nasaal"})
+_RECTAAL = frozenset({"zetpil", "klysma", "rectiole", "rectaalschuim", "rectaal"})
+_PARENTERAAL = frozenset({"injvlst", "injpdr", "injsusp", "injemuls", "infvlst", "infopl", "infpdr", "injectie",
+                          "amp", "ampul", "wwsp", "parenteraal"})
+# Lokale toedieningsvormen: nooit 'systemisch'
+_LOKAAL = _INHALATIE | _NASAAL | frozenset({
+    "oogdruppels", "oogdr", "ooggel", "oogzalf", "oordruppels", "oordr", "creme", "zalf", "gel", "lotion",
+    "smeersel", "shampoo", "spray", "huidspray", "vaginaalcreme", "vaginaaltablet", "ovule", "pleister",
+    "klysma", "rectaalschuim", "tandpasta", "cutaan",
+})
+
+# Toelichting in acb.json → (vormwoorden waarvan er één in de naam moet staan, vormwoorden die hem uitsluiten,
+# ATC-prefixen). Alleen hele woorden tellen: 'retinol' is geen 'retard', 'ampicilline' geen 'amp'.
+# Is de ATC-code bekend en hier opgegeven, dan beslist die; vormen=None: geldt voor elke vorm.
+_ROUTES = {
+    "systemisch": (frozenset({"tablet", "tabl", "kauwtablet", "bruistablet", "smelttablet", "dragee", "capsule",
+                              "caps", "drank", "druppels", "stroop", "suspensie", "granulaat", "poeder", "pdr",
+                              "zetpil"}) | _PARENTERAAL, _LOKAAL, ("A03", "H02")),
+    "inhalatie": (_INHALATIE, frozenset(), ("R03",)),
+    "nasaal": (_NASAAL, frozenset(), ("R01",)),
+    "rectaal": (_RECTAAL, frozenset(), ("A07EA",)),
+    "transdermaal": (frozenset({"pleister", "matrixpleister", "transdermaal", "tts"}), frozenset(), None),
+    "parenteraal": (_PARENTERAAL, frozenset(), None),
+    "bij doorbraakpijn": (frozenset({"neusspray", "zuigtablet", "buccaaltablet", "buccaal", "sublinguaal",
+                                     "oromucosale", "smelttablet", "tongtablet"}), frozenset(), None),
+    "retard": (frozenset({"retard", "mga", "mr", "sr", "xl", "xr", "cr"}), frozenset(), None),
+    "bij cardiovasculaire aandoening": (None, frozenset(), None),
+}
+
+
+def _route_klopt(toelichting, woorden, atc=None):
+    """
+    Past een medicatieregel (genormaliseerde woorden, optioneel ATC-code) bij de toelichting?
+    Onbekende toelichtingen passen nooit.
+
+    >>> _route_klopt("retard", ["morfine", "drank", "retinol"])
+    False
+    >>> _route_klopt("systemisch", ["prednisolon", "capsule", "gelatine"])
+    True
+    >>> _route_klopt("systemisch", ["atropine", "oogdr.", "10mg/ml"])
+    False
+    """
+    if toelichting not in _ROUTES:
+        return False
+    vormen, uitgesloten, atc_prefixen = _ROUTES[toelichting]
+    if atc and atc_prefixen:
+        return atc.startswith(atc_prefixen)
+    if vormen is None:
+        return True
+    vormwoorden = {deel for woord in woorden for deel in _WOORD_RE.findall(woord)}
+    return not vormwoorden & uitgesloten and bool(vormwoorden & vormen)
+
+
+class AcbTabel:
+    """
+    Eenmalig opgebouwde lookup: medicatieregel → (volgorde, middel, score).
+    volgorde is de positie in acb.json (per niveau, in bestandsvolgorde), zodat de
+    uitvoer dezelfde volgorde houdt als de oorspronkelijke scan.
+
+    Opzoekvolgorde per regel:
+        1. SPKode → geneesmiddel/ATC-code in geneesmiddelen.db → ACB-middel
+        2. exacte naam (lowercase), daarna genormaliseerde naam zonder (..)
+        3. kortere prefixen van woorden: 'clozapine tablet 6,25mg' → 'clozapine'
+    Middelen met een toedieningsweg tussen haakjes ('atropine (systemisch)', 'beclometason
+    (inhalatie)') tellen alleen mee als de vorm in de Medimo-naam of de ATC-code bij die weg
+    past (zie _ROUTES); 'atropine oogdruppels' krijgt dus geen score. Past geen enkele weg,
+    dan valt de regel terug op een vermelding zonder haakjes ('morfine') of blijft ongematcht.
+    """
+
+    def __init__(self, scores, db_path=None):
+        self.exact = {}
+        self.namen = {}
+        volgorde = 0
+        for level, middelen in scores.items():
+            for middel in middelen:
+                entry = (volgorde, middel, int(level))
+                self.exact.setdefault(middel.lower(), entry)
+                volgorde += 1
+
+        # Namen zonder haakjes direct; met haakjes per basisnaam, alleen bij een passende toedieningsweg
+        self.met_toelichting = defaultdict(list)  # basisnaam → [(toelichting, entry)]
+        for sleutel, entry in self.exact.items():
+            toelichting = _TOELICHTING_RE.search(sleutel)
+            if toelichting:
+                self.met_toelichting[normaliseer_naam(sleutel)].append((toelichting.group(1).strip(), entry))
+            else:
+                self.namen.setdefault(normaliseer_naam(sleutel), entry)
+        self.met_toelichting.default_factory = None
+        self.atc_per_spkode = {}
+
+        # Resultaat per naam; namen op een afdeling herhalen zich sterk
+        self._memo = {}
+
+        self.spkodes = self._bouw_spkode_index(db_path) if db_path else {}
+
+    def _bouw_spkode_index(self, db_path):
+        """
+        SPKode → ACB-middel via het geneesmiddel in geneesmiddelen.db; producten met een andere
+        naam maar dezelfde ATC-code tellen mee als die ATC-code maar naar één ACB-middel wijst.
+        """
+        rijen = referentie_db.get_connection(db_path).execute(
+            "SELECT SPKode, geneesmiddel, ATCcode FROM geneesmiddelen ORDER BY rowid"
+        ).fetchall()
+
+        spkodes = {}
+        atc_to_entries = defaultdict(set)
+        for spkode, geneesmiddel, atc_code in rijen:
+            if spkode and atc_code:
+                self.atc_per_spkode.setdefault(spkode, atc_code)
+            entry = self._zoek_basisnaam(normaliseer_naam(geneesmiddel), [], atc_code) if geneesmiddel else None
+            if entry is None:
+                continue
+            if spkode:
+                spkodes.setdefault(spkode, entry)
+            if atc_code:
+                atc_to_entries[atc_code].add(entry)
+
+        atc = {code: next(iter(entries)) for code, entries in atc_to_entries.items() if len(entries) == 1}
+        for spkode, _, atc_code in rijen:
+            if spkode and spkode not in spkodes and atc_code in atc:
+                spkodes[spkode] = atc[atc_code]
+        return spkodes
+
+    def zoek(self, naam, spkode=None):
+        """
+        Geeft (volgorde, middel, score) terug, of None als het middel geen ACB-score heeft.
+        """
+        if spkode and spkode in self.spkodes:
+            return self.spkodes[spkode]
+        if not naam:
+            return None
+        atc = self.atc_per_spkode.get(spkode) if spkode else None
+        try:
+            return self._memo[(naam, atc)]
+        except KeyError:
+            pass
+        entry = self._zoek_naam(naam, atc)
+        if len(self._memo) >= _MAX_MEMO:
+            self._memo.clear()
+        self._memo[(naam, atc)] = entry
+        return entry
+
+    def _zoek_basisnaam(self, basis, woorden, atc=None):
+        """
+        ACB-middel voor een basisnaam: eerst een vermelding met passende toedieningsweg,
+        dan een vermelding zonder haakjes.
+        """
+        for toelichting, entry in self.met_toelichting.get(basis, ()):
+            if _route_klopt(toelichting, woorden, atc):
+                return entry
+        return self.namen.get(basis)
+
+    def _zoek_naam(self, naam, atc=None):
+        entry = self.exact.get(naam.lower())
+        if entry:
+            return entry
+        woorden = normaliseer_naam(naam).split()
+        for n in range(len(woorden), 0, -1):
+            basis = " ".join(woorden[:n])
+            entry = self._zoek_basisnaam(basis, woorden, atc)
+            if entry:
+                return entry
+            if basis in self.met_toelichting:
+                return None  # bekend middel, maar met een andere toedieningsweg: telt niet mee
+        return None
+
+
+# Tabel per (acb.json, geneesmiddelen.db); opnieuw opbouwen als een van beide wijzigt
+_tabel_cache = {}
+_tabel_lock = threading.Lock()
+
+def _versie(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+def laad_acb_tabel(json_path="Anticholinerge_Score/acb.json", db_path="geneesmiddelen.db"):
+    sleutel = (os.path.abspath(json_path), os.path.abspath(db_path) if db_path else None)
+    versie = (_versie(json_path), _versie(db_path) if db_path else None)
+    with _tabel_lock:
+        gecached = _tabel_cache.get(sleutel)
+        if gecached is None or gecached[0] != versie:
+            gecached = (versie, AcbTabel(laad_acb_scores(json_path), db_path))
+            _tabel_cache[sleutel] = gecached
+    return gecached[1]
+
+
+def bereken_acb_score(medicatielijst, json_path="Anticholinerge_Score/acb.json", scores=None, tabel=None, spkodes=None):
     """
     Berekent de totale ACB-score en geeft interpretatie + lijst van middelen die bijdragen inclusief hun score.
 
     Args:
         medicatielijst (list of str): Lijst met geneesmiddelennamen
         json_path (str): Pad naar JSON met ACB-scores
+        scores (dict): Vooraf geladen scores (zie laad_acb_scores); wordt dan ter plekke gecompileerd
+        tabel (AcbTabel): Vooraf gecompileerde tabel (zie laad_acb_tabel); heeft voorrang op scores
+        spkodes (list): Optioneel, SPKode per regel in medicatielijst (None als onbekend)
 
     Returns:
         tuple: (totale ACB-score, interpretatie string, lijst van dicts met 'middel' en 'score')
     """
-    with open(json_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    if tabel is None:
+        tabel = AcbTabel(scores) if scores is not None else laad_acb_tabel(json_path, None)
+    if spkodes is None:
+        spkodes = [None] * len(medicatielijst)
+
+    # Eén lookup per regel; elk ACB-middel telt één keer mee
+    gevonden = {}
+    for middel, spkode in zip(medicatielijst, spkodes):
+        entry = tabel.zoek(middel, spkode)
+        if entry:
+            gevonden[entry[0]] = entry
 
-    scores = data["scores"]
     totaal = 0
     middelen_met_bijdrage = []
-    medicatielijst_norm = [m.lower() for m in medicatielijst]
+    for _, middel, score in sorted(gevonden.values()):
+        totaal += score
+        middelen_met_bijdrage.append({"middel": middel, "score": score})
 
-    for level, middelen in scores.items():
-        for middel in middelen:
-            if middel.lower() in medicatielijst_norm:
-                totaal += int(level)
-                middelen_met_bijdrage.append({"middel": middel, "score": int(level)})
+    return totaal, interpreteer_acb_score(totaal), middelen_met_bijdrage
 
+
+def interpreteer_acb_score(totaal):
     # Interpretatie op basis van score
     if totaal == 0:
         interpretatie = "Geen anticholinerge belasting (score = 0)."
@@ -34,5 +256,4 @@ def bereken_acb_score(medicatielijst, json_path="Anticholinerge_Score/acb.json")
         interpretatie = "Matige anticholinerge belasting (score = 2)."
     else:
         interpretatie = "Hoge anticholinerge belasting (score ≥ 3)."
-
-    return totaal, interpretatie, middelen_met_bijdrage
\ No newline at end of file
+    return interpretatie
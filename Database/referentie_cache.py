@@ -0,0 +1,127 @@
+"""
+Optionele in-memory cache van geneesmiddelen.db en ATC_groepen.db.
+
+Beide tabellen zijn klein (~1.7k en ~80 rijen) en worden bij het laden in onveranderlijke
+dicts gezet. Bij elke lookup wordt (goedkoop) gecontroleerd of grootte of mtime van een
+databasebestand is veranderd; zo ja, dan wordt de cache opnieuw geladen.
+
+Gebruik:
+    from Database import referentie_cache
+    referentie_cache.laad_referentie_cache()   # daarna gaan alle referentie_db-lookups via het geheugen
+"""
+
+import os
+import pathlib
+import sqlite3
+import threading
+from types import MappingProxyType
+
+from Database import referentie_db
+from Database.referentie_db import FK_DB_PATH, ATC_DB_PATH
+
+
+def _bestand_status(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+class ReferentieCache:
+    """
+    SPKode → (geneesmiddel, groep, ATC_groep), geneesmiddel → groep en
+    ATC_groep → (ATC_omschrijving, Jansen_omschrijving), volledig in het geheugen.
+    Bij dubbele sleutels wint de eerste rij (rowid), net als bij de SQL-lookups.
+    """
+
+    def __init__(self, db_path=FK_DB_PATH, atc_db_path=ATC_DB_PATH):
+        self.db_path = os.path.abspath(db_path)
+        self.atc_db_path = os.path.abspath(atc_db_path)
+        self._lock = threading.Lock()
+        self._status = None
+        self._laad()
+
+    # ---------------------------
+    # Laden en verversen
+    # ---------------------------
+
+    def _laad(self):
+        status = (_bestand_status(self.db_path), _bestand_status(self.atc_db_path))
+
+        fk, groepen, spkodes_in_db = {}, {}, set()
+        conn = sqlite3.connect(pathlib.Path(self.db_path).as_uri() + "?mode=ro", uri=True)
+        try:
+            for spkode, geneesmiddel, groep, atc_groep in conn.execute(
+                "SELECT SPKode, geneesmiddel, groep, ATC_groep FROM geneesmiddelen ORDER BY rowid"
+            ):
+                spkodes_in_db.add(spkode)
+                # NULL matcht in SQL nooit (WHERE x = NULL), dus ook niet in de cache
+                if spkode is not None:
+                    fk.setdefault(spkode, (geneesmiddel, groep, atc_groep))
+                if geneesmiddel is not None:
+                    groepen.setdefault(geneesmiddel, groep)
+        finally:
+            conn.close()
+
+        atc = {}
+        conn = sqlite3.connect(pathlib.Path(self.atc_db_path).as_uri() + "?mode=ro", uri=True)
+        try:
+            for atc_groep, atc_omschrijving, jansen_omschrijving in conn.execute(
+                "SELECT ATC_groep, ATC_omschrijving, Jansen_omschrijving FROM ATC_groepen ORDER BY rowid"
+            ):
+                if atc_groep is not None:
+                    atc.setdefault(atc_groep, (atc_omschrijving, jansen_omschrijving))
+        finally:
+            conn.close()
+
+        # Referenties in één keer omzetten; lopende lezers zien oud óf nieuw, nooit half
+        self.fk = MappingProxyType(fk)
+        self.groepen = MappingProxyType(groepen)
+        self.atc = MappingProxyType(atc)
+        self.spkodes = frozenset(spkodes_in_db)
+        self._status = status
+
+    def ververs_indien_gewijzigd(self):
+        """
+        Laadt opnieuw als grootte of mtime van een van de databases is veranderd.
+        """
+        status = (_bestand_status(self.db_path), _bestand_status(self.atc_db_path))
+        if status == self._status:
+            return False
+        with self._lock:
+            if status != self._status:
+                self._laad()
+        return True
+
+    def dekt(self, db_path):
+        return os.path.abspath(db_path) in (self.db_path, self.atc_db_path)
+
+    # ---------------------------
+    # Lookups (zelfde vorm als referentie_db)
+    # ---------------------------
+
+    def zoek_fk_gegevens(self, spkodes):
+        self.ververs_indien_gewijzigd()
+        fk = self.fk
+        return {spk: fk[spk] for spk in spkodes if spk in fk}
+
+    def zoek_groepen(self, geneesmiddelen):
+        self.ververs_indien_gewijzigd()
+        groepen = self.groepen
+        return {naam: groepen[naam] for naam in geneesmiddelen if naam in groepen}
+
+    def zoek_atc_gegevens(self, atc_groepen):
+        self.ververs_indien_gewijzigd()
+        atc = self.atc
+        return {code: atc[code] for code in atc_groepen if code in atc}
+
+    def zoek_alle_spkodes(self):
+        self.ververs_indien_gewijzigd()
+        return set(self.spkodes)
+
+
+def laad_referentie_cache(db_path=FK_DB_PATH, atc_db_path=ATC_DB_PATH):
+    """
+    Laadt beide tabellen in het geheugen en laat referentie_db voortaan daaruit lezen.
+    """
+    cache = ReferentieCache(db_path, atc_db_path)
+    referentie_db.activeer_cache(cache)
+    return cache
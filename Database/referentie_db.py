@@ -0,0 +1,150 @@
+"""
+Gedeelde toegang tot geneesmiddelen.db en ATC_groepen.db.
+
+- Eén langlevende read-only verbinding per database per thread (veilig onder Flask)
+- Vaste SQL-teksten zodat sqlite3 de gecompileerde statements hergebruikt
+- Gebatchte lookups (WHERE ... IN (...)), zodat één patiënt één query per tabel kost
+- Optioneel: een actieve ReferentieCache (zie referentie_cache.py) beantwoordt lookups uit het geheugen
+"""
+
+import os
+import pathlib
+import sqlite3
+import threading
+
+FK_DB_PATH = "geneesmiddelen.db"
+ATC_DB_PATH = "ATC_groepen.db"
+
+# Ruim onder de SQLite-limiet voor het aantal parameters per statement
+_MAX_PARAMS = 512
+
+_SQL_FK_PER_SPKODE = "SELECT SPKode, geneesmiddel, groep, ATC_groep FROM geneesmiddelen WHERE SPKode IN ({}) ORDER BY rowid"
+_SQL_GROEP_PER_GENEESMIDDEL = "SELECT geneesmiddel, groep FROM geneesmiddelen WHERE geneesmiddel IN ({}) ORDER BY rowid"
+_SQL_ATC_PER_GROEP = "SELECT ATC_groep, ATC_omschrijving, Jansen_omschrijving FROM ATC_groepen WHERE ATC_groep IN ({}) ORDER BY rowid"
+_SQL_ALLE_SPKODES = "SELECT DISTINCT SPKode FROM geneesmiddelen"
+
+_lokaal = threading.local()
+_actieve_cache = None
+
+
+# ---------------------------
+# Verbindingen
+# ---------------------------
+
+def get_connection(db_path):
+    """
+    Geeft de read-only verbinding van deze thread voor db_path terug (en opent hem zo nodig).
+    Na een fork (procespool) worden geërfde verbindingen niet hergebruikt.
+    """
+    pid = os.getpid()
+    if getattr(_lokaal, "pid", None) != pid:
+        _lokaal.pid = pid
+        _lokaal.verbindingen = {}
+
+    sleutel = os.path.abspath(db_path)
+    conn = _lokaal.verbindingen.get(sleutel)
+    if conn is None:
+        if not os.path.exists(sleutel):
+            raise FileNotFoundError(f"Database niet gevonden: {sleutel}")
+        uri = pathlib.Path(sleutel).as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, cached_statements=64)
+        _lokaal.verbindingen[sleutel] = conn
+    return conn
+
+def sluit_connecties():
+    """
+    Sluit alle verbindingen van de huidige thread.
+    """
+    if getattr(_lokaal, "pid", None) != os.getpid():
+        return
+    for conn in _lokaal.verbindingen.values():
+        conn.close()
+    _lokaal.verbindingen = {}
+
+
+# ---------------------------
+# In-memory cache (optioneel)
+# ---------------------------
+
+def activeer_cache(cache):
+    global _actieve_cache
+    _actieve_cache = cache
+
+def deactiveer_cache():
+    global _actieve_cache
+    _actieve_cache = None
+
+def _cache_voor(db_path):
+    cache = _actieve_cache
+    if cache is not None and cache.dekt(db_path):
+        return cache
+    return None
+
+
+# ---------------------------
+# Gebatchte queries
+# ---------------------------
+
+def _bucket(n):
+    # Afronden op een macht van 2, zodat er maar een handvol verschillende statements bestaan
+    grootte = 1
+    while grootte < n:
+        grootte *= 2
+    return grootte
+
+def _in_query(db_path, sql, waarden):
+    """
+    Voert sql (met één '{}' voor de IN-lijst) uit voor alle unieke waarden en levert de rijen.
+    De IN-lijst wordt aangevuld met NULL tot een vaste grootte; NULL matcht nooit.
+    """
+    uniek = list(dict.fromkeys(w for w in waarden if w is not None))
+    if not uniek:
+        return
+    conn = get_connection(db_path)
+    for start in range(0, len(uniek), _MAX_PARAMS):
+        deel = uniek[start:start + _MAX_PARAMS]
+        grootte = _bucket(len(deel))
+        params = deel + [None] * (grootte - len(deel))
+        yield from conn.execute(sql.format(", ".join("?" * grootte)), params)
+
+def zoek_fk_gegevens(spkodes, db_path=FK_DB_PATH):
+    """
+    SPKode → (geneesmiddel, groep, ATC_groep). Bij meerdere rijen wint de eerste (rowid).
+    """
+    cache = _cache_voor(db_path)
+    if cache:
+        return cache.zoek_fk_gegevens(spkodes)
+    resultaat = {}
+    for spkode, geneesmiddel, groep, atc_groep in _in_query(db_path, _SQL_FK_PER_SPKODE, spkodes):
+        resultaat.setdefault(spkode, (geneesmiddel, groep, atc_groep))
+    return resultaat
+
+def zoek_groepen(geneesmiddelen, db_path=FK_DB_PATH):
+    """
+    geneesmiddel (lowercase) → groep. Bij meerdere rijen wint de eerste (rowid).
+    """
+    cache = _cache_voor(db_path)
+    if cache:
+        return cache.zoek_groepen(geneesmiddelen)
+    resultaat = {}
+    for geneesmiddel, groep in _in_query(db_path, _SQL_GROEP_PER_GENEESMIDDEL, geneesmiddelen):
+        resultaat.setdefault(geneesmiddel, groep)
+    return resultaat
+
+def zoek_atc_gegevens(atc_groepen, db_path=ATC_DB_PATH):
+    """
+    ATC_groep → (ATC_omschrijving, Jansen_omschrijving).
+    """
+    cache = _cache_voor(db_path)
+    if cache:
+        return cache.zoek_atc_gegevens(atc_groepen)
+    resultaat = {}
+    for atc_groep, atc_omschrijving, jansen_omschrijving in _in_query(db_path, _SQL_ATC_PER_GROEP, atc_groepen):
+        resultaat.setdefault(atc_groep, (atc_omschrijving, jansen_omschrijving))
+    return resultaat
+
+def zoek_alle_spkodes(db_path=FK_DB_PATH):
+    cache = _cache_voor(db_path)
+    if cache:
+        return cache.zoek_alle_spkodes()
+    return {row[0] for row in get_connection(db_path).execute(_SQL_ALLE_SPKODES)}
@@ -1,5 +1,5 @@
-import sqlite3
 from collections import defaultdict
+from Database import referentie_db
 
 def check_dubbelmedicatie(medicatielijst, db_path='geneesmiddelen.db'):
     """
@@ -9,24 +9,19 @@ def check_dubbelmedicatie(medicatielijst, db_path='geneesmiddelen.db'):
     Returns:
         List van dicts met 'groep' en 'middelen'
     """
-    # Maak verbinding met database
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
+    # Eén gebatchte query voor alle middelen
+    middel_to_groep = referentie_db.zoek_groepen([middel.lower() for middel in medicatielijst], db_path)
 
     # Map: groep → lijst van middelen
     groep_dict = defaultdict(list)
 
     for middel in medicatielijst:
-        c.execute("SELECT groep FROM geneesmiddelen WHERE geneesmiddel = ?", (middel.lower(),))
-        result = c.fetchone()
-        if result:
-            groep = result[0]
+        if middel.lower() in middel_to_groep:
+            groep = middel_to_groep[middel.lower()]
             groep_dict[groep].append(middel)
         else:
             print(f"Waarschuwing: '{middel}' niet gevonden in database.")
 
-    conn.close()
-
     # Filter groepen met dubbelmedicatie (≥2 middelen)
     dubbelmedicatie = []
     for groep, middelen in groep_dict.items():
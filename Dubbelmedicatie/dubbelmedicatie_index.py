@@ -0,0 +1,206 @@
+"""
+Dubbelmedicatie volgens de G-Standaard (BST671T/672T/922T).
+
+BST671T koppelt paren PRK-codes aan een dubbelmedicatiecode (DMCODE); BST672T en BST922T
+leveren de bijbehorende tekst. De paren worden eenmalig per G-Standaard snapshot
+weggeschreven naar een binair indexbestand:
+
+    kop      : magic (8 bytes) + snapshot-id (16 bytes ASCII) + aantal paren (uint64)
+    sleutels : uint64[aantal], gesorteerd; sleutel = (min(PRK) << 32) | max(PRK)
+    codes    : uint32[aantal], DMCODE per sleutel
+
+Bij het starten wordt het bestand met mmap geopend (geen parsen, gedeeld tussen processen).
+Per patiënt worden alle PRK-paren van zijn regels in één keer opgezocht in de sleutels.
+
+Gebruik vanaf de projectroot:
+    python -m Dubbelmedicatie.dubbelmedicatie_index   # bouw index indien nodig
+"""
+
+import os
+import re
+import mmap
+import struct
+import tempfile
+import numpy as np
+from Parsers import gstandaard
+
+INDEX_PATH = "gstandaard_dubbelmedicatie.idx"
+
+_MAGIC = b"DMIDX1\0\0"
+_KOP = struct.Struct("<8s16sQ")
+_HTML_RE = re.compile(r"<[^>]+>")
+
+
+def _sleutel(prk_a, prk_b):
+    a, b = (prk_a, prk_b) if prk_a <= prk_b else (prk_b, prk_a)
+    return (a << 32) | b
+
+
+# ---------------------------
+# Bouwen
+# ---------------------------
+
+def bouw_index(conn, index_path=INDEX_PATH, snapshot_id=None):
+    """
+    Schrijft de PRK-paar → DMCODE index uit de snapshot (BST671T) naar index_path.
+    """
+    paren = {}
+    for prk_a, prk_b, dmcode in conn.execute("SELECT DMPRKA, DMPRKB, DMCODE FROM BST671T ORDER BY rij"):
+        if not (prk_a and prk_b and dmcode):
+            continue
+        paren.setdefault(_sleutel(int(prk_a), int(prk_b)), set()).add(int(dmcode))
+
+    sleutels = np.array(
+        [sleutel for sleutel in sorted(paren) for _ in paren[sleutel]], dtype="<u8"
+    )
+    codes = np.array(
+        [code for sleutel in sorted(paren) for code in sorted(paren[sleutel])], dtype="<u4"
+    )
+
+    doel_dir = os.path.dirname(os.path.abspath(index_path))
+    fd, tmp_path = tempfile.mkstemp(suffix=".idx", dir=doel_dir)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_KOP.pack(_MAGIC, (snapshot_id or "").encode("ascii").ljust(16, b"\0"), len(sleutels)))
+            f.write(sleutels.tobytes())
+            f.write(codes.tobytes())
+        os.replace(tmp_path, index_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return len(sleutels)
+
+
+def _lees_snapshot_id(index_path):
+    try:
+        with open(index_path, "rb") as f:
+            magic, snapshot_id, _ = _KOP.unpack(f.read(_KOP.size))
+    except (OSError, struct.error):
+        return None
+    if magic != _MAGIC:
+        return None
+    return snapshot_id.rstrip(b"\0").decode("ascii")
+
+
+def laad_teksten(conn):
+    """
+    DMCODE → leesbare tekst (BST672T → BST922T, tekstblokken in volgorde, zonder HTML).
+    """
+    regels = {}
+    for dmcode, tekst in conn.execute("""
+        SELECT d.DMCODE, t.TXTEXT
+        FROM BST672T d
+        JOIN BST922T t
+          ON t.TXKODE = d.TXKODE
+         AND CAST(t.TXMODU AS INTEGER) = CAST(d.TXMOD AS INTEGER)
+         AND CAST(t.TXTSRT AS INTEGER) = CAST(d.TXSRTT AS INTEGER)
+        ORDER BY d.rij, CAST(t.TXBLNR AS INTEGER), CAST(t.TXRGLN AS INTEGER)
+    """):
+        regels.setdefault(int(dmcode), []).append(tekst)
+
+    teksten = {}
+    for dmcode, delen in regels.items():
+        tekst = _HTML_RE.sub(" ", " ".join(delen))
+        teksten[dmcode] = " ".join(tekst.split())
+    return teksten
+
+
+# ---------------------------
+# Lezen
+# ---------------------------
+
+class DubbelmedicatieIndex:
+    """
+    Read-only weergave van het indexbestand via mmap.
+    """
+
+    def __init__(self, index_path=INDEX_PATH, teksten=None):
+        self.index_path = index_path
+        self.teksten = teksten or {}
+        with open(index_path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, snapshot_id, aantal = _KOP.unpack_from(self._mmap, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"Geen dubbelmedicatie-index: {index_path}")
+        self.snapshot_id = snapshot_id.rstrip(b"\0").decode("ascii")
+        self.sleutels = np.frombuffer(self._mmap, dtype="<u8", count=aantal, offset=_KOP.size)
+        self.codes = np.frombuffer(self._mmap, dtype="<u4", count=aantal, offset=_KOP.size + 8 * aantal)
+
+    def __len__(self):
+        return len(self.sleutels)
+
+    def zoek_paren(self, prkodes_per_regel):
+        """
+        prkodes_per_regel: per medicatieregel een verzameling PRK-codes.
+        Returns: lijst van (regel_i, regel_j, dmcode) met i < j, in regelvolgorde.
+        """
+        if not len(self.sleutels):
+            return []
+
+        regel_i, regel_j, sleutels = [], [], []
+        prks = [sorted({int(prk) for prk in regel if prk}) for regel in prkodes_per_regel]
+        for i in range(len(prks)):
+            for j in range(i + 1, len(prks)):
+                for a in prks[i]:
+                    for b in prks[j]:
+                        if a != b:
+                            regel_i.append(i)
+                            regel_j.append(j)
+                            sleutels.append(_sleutel(a, b))
+        if not sleutels:
+            return []
+
+        gezocht = np.array(sleutels, dtype="<u8")
+        links = np.searchsorted(self.sleutels, gezocht, side="left")
+        rechts = np.searchsorted(self.sleutels, gezocht, side="right")
+
+        gevonden = []
+        for k in np.flatnonzero(rechts > links):
+            for code in self.codes[links[k]:rechts[k]]:
+                gevonden.append((regel_i[k], regel_j[k], int(code)))
+        return sorted(set(gevonden))
+
+
+def laad_dubbelmedicatie_index(bst_dir=gstandaard.BST_DIR, snapshot_path=gstandaard.SNAPSHOT_PATH,
+                               index_path=INDEX_PATH):
+    """
+    Compileert zo nodig de snapshot, bouwt de index opnieuw als die bij een andere snapshot
+    hoort en opent hem via mmap (inclusief DMCODE-teksten).
+    """
+    conn = gstandaard.open_snapshot(bst_dir, snapshot_path)
+    try:
+        snapshot_id = gstandaard.get_snapshot_id(snapshot_path)
+        if _lees_snapshot_id(index_path) != snapshot_id:
+            aantal = bouw_index(conn, index_path, snapshot_id)
+            print(f"Dubbelmedicatie-index gebouwd: {index_path} ({aantal} paren)")
+        teksten = laad_teksten(conn)
+    finally:
+        conn.close()
+    return DubbelmedicatieIndex(index_path, teksten)
+
+
+def check_dubbelmedicatie_gstandaard(medicatielijst, prkodes_per_regel, index):
+    """
+    Dubbelmedicatie volgens de G-Standaard, in hetzelfde formaat als check_dubbelmedicatie:
+    per DMCODE één dict met 'groep' (tekst of code) en 'middelen' (in regelvolgorde).
+    """
+    per_code = {}
+    for i, j, dmcode in index.zoek_paren(prkodes_per_regel):
+        regels = per_code.setdefault(dmcode, set())
+        regels.update((i, j))
+
+    dubbelmedicatie = []
+    for dmcode, regels in per_code.items():
+        tekst = index.teksten.get(dmcode) or f"dubbelmedicatiecode {dmcode}"
+        dubbelmedicatie.append({
+            'groep': f"G-Standaard: {tekst}",
+            'middelen': [medicatielijst[i] for i in sorted(regels)]
+        })
+    return dubbelmedicatie
+
+
+if __name__ == "__main__":
+    index = laad_dubbelmedicatie_index()
+    print(f"{len(index)} PRK-paren in {index.index_path}")
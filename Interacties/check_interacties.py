@@ -0,0 +1,165 @@
+"""
+Interacties tussen geneesmiddelen volgens de G-Standaard.
+
+De interactietabellen uit de snapshot worden één keer per snapshot omgezet naar een
+hashtabel (niveau, code_a, code_b) → interactieteksten, met code_a <= code_b. Een patiënt
+controleren is daarna per paar regels alleen een paar dict-lookups.
+
+Beperking: de huidige G-Standaard levering bevat de interactiemodule niet (BST001T beschrijft
+geen interactiebestanden), dus de echte tabeldefinities en kolomposities zijn hier niet bekend
+en INTERACTIE_TABELLEN is leeg. De hashtabel blijft dan leeg, evalueer zet 'interacties' op
+None en het rapport meldt dat de interactiecontrole niet beschikbaar is.
+
+Inschakelen bij een levering met de interactiemodule kost twee aanpassingen:
+    - de bestanden in INTERACTIE_TABELLEN hieronder
+    - hun kolomposities (uit de rubriekbeschrijving in BST001T) in gstandaard.BST_KOLOMMEN en
+      BST_INDEXEN, zodat de snapshot ze meeneemt
+"""
+
+import re
+import threading
+from itertools import combinations
+from Parsers import gstandaard
+
+# niveau ("HPK"/"PRK") → (snapshot-tabel, kolom code A, kolom code B, kolom tekstcode (TXKODE in BST922T))
+INTERACTIE_TABELLEN = {}
+
+_HTML_RE = re.compile(r"<[^>]+>")
+# Maximaal aantal parameters per IN-lijst (ruim onder de SQLite-limiet), zoals in referentie_db
+_MAX_PARAMS = 512
+
+
+def _tabel_bestaat(conn, tabel):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (tabel,)).fetchone() is not None
+
+
+def _laad_teksten(conn, txkodes):
+    """
+    TXKODE → leesbare tekst uit BST922T (tekstblokken in volgorde, zonder HTML).
+    """
+    if not txkodes or not _tabel_bestaat(conn, "BST922T"):
+        return {}
+    txkodes = list(txkodes)
+    regels = {}
+    for start in range(0, len(txkodes), _MAX_PARAMS):
+        deel = txkodes[start:start + _MAX_PARAMS]
+        for txkode, tekst in conn.execute(
+            f"SELECT TXKODE, TXTEXT FROM BST922T WHERE TXKODE IN ({', '.join('?' * len(deel))}) "
+            "ORDER BY TXKODE, CAST(TXBLNR AS INTEGER), CAST(TXRGLN AS INTEGER)",
+            deel
+        ):
+            regels.setdefault(txkode, []).append(tekst)
+    return {txkode: " ".join(_HTML_RE.sub(" ", " ".join(delen)).split()) for txkode, delen in regels.items()}
+
+
+class InteractieTabel:
+    """
+    Hashtabel (niveau, code_a, code_b) → tuple van interactieteksten.
+    """
+
+    def __init__(self, paren=None, snapshot_id=None):
+        self.paren = paren or {}
+        self.snapshot_id = snapshot_id
+
+    def __len__(self):
+        return len(self.paren)
+
+    @classmethod
+    def uit_snapshot(cls, conn, snapshot_id=None, tabellen=None):
+        tabellen = INTERACTIE_TABELLEN if tabellen is None else tabellen
+        rijen = []
+        for niveau, (tabel, kolom_a, kolom_b, kolom_tekst) in tabellen.items():
+            if not _tabel_bestaat(conn, tabel):
+                print(f"Waarschuwing: interactietabel {tabel} ontbreekt in de snapshot.")
+                continue
+            for code_a, code_b, txkode in conn.execute(f"SELECT {kolom_a}, {kolom_b}, {kolom_tekst} FROM {tabel} ORDER BY rij"):
+                if code_a and code_b:
+                    rijen.append((niveau, int(code_a), int(code_b), txkode))
+
+        teksten = _laad_teksten(conn, {txkode for _, _, _, txkode in rijen if txkode})
+        paren = {}
+        for niveau, code_a, code_b, txkode in rijen:
+            a, b = sorted((code_a, code_b))
+            tekst = teksten.get(txkode) or f"Interactie (tekstcode {txkode})"
+            bestaand = paren.setdefault((niveau, a, b), ())
+            if tekst not in bestaand:
+                paren[(niveau, a, b)] = bestaand + (tekst,)
+        return cls(paren, snapshot_id)
+
+    def zoek(self, codes_a, codes_b):
+        """
+        codes_a, codes_b: iterables van (niveau, code) van twee regels.
+        Returns: tuple van interactieteksten (leeg als er geen interactie is).
+        """
+        gevonden = ()
+        for niveau_a, code_a in codes_a:
+            for niveau_b, code_b in codes_b:
+                if niveau_a != niveau_b:
+                    continue
+                sleutel = (niveau_a, code_a, code_b) if code_a <= code_b else (niveau_a, code_b, code_a)
+                for tekst in self.paren.get(sleutel, ()):
+                    if tekst not in gevonden:
+                        gevonden += (tekst,)
+        return gevonden
+
+
+# Hashtabel per snapshot; opnieuw opbouwen als de snapshot verandert
+_tabel_cache = {}
+_tabel_lock = threading.Lock()
+
+def laad_interactie_tabel(bst_dir=gstandaard.BST_DIR, snapshot_path=gstandaard.SNAPSHOT_PATH):
+    conn = gstandaard.open_snapshot(bst_dir, snapshot_path)
+    try:
+        snapshot_id = gstandaard.get_snapshot_id(snapshot_path)
+        with _tabel_lock:
+            tabel = _tabel_cache.get(snapshot_id)
+            if tabel is None:
+                tabel = InteractieTabel.uit_snapshot(conn, snapshot_id)
+                _tabel_cache[snapshot_id] = tabel
+    finally:
+        conn.close()
+    return tabel
+
+
+def regel_codes(hpkode=None, prkodes=()):
+    """
+    Codes van één medicatieregel in de vorm die InteractieTabel.zoek verwacht
+    (als getal, zodat voorloopnullen geen verschil maken).
+    """
+    codes = [("PRK", int(prk)) for prk in prkodes if prk]
+    if hpkode:
+        codes.append(("HPK", int(hpkode)))
+    return codes
+
+
+def check_interacties(medicatielijst, codes_per_regel, tabel):
+    """
+    Controleert alle paren regels op interacties.
+
+    Args:
+        medicatielijst (list of str): naam per regel
+        codes_per_regel (list): per regel een lijst (niveau, code), zie regel_codes
+        tabel (InteractieTabel)
+
+    Returns:
+        List van dicts met 'middel_a', 'middel_b' en 'tekst'
+    """
+    if not tabel.paren:
+        return []
+
+    interacties = []
+    gezien = set()
+    for i, j in combinations(range(len(medicatielijst)), 2):
+        if not codes_per_regel[i] or not codes_per_regel[j]:
+            continue
+        for tekst in tabel.zoek(codes_per_regel[i], codes_per_regel[j]):
+            sleutel = (medicatielijst[i], medicatielijst[j], tekst)
+            if medicatielijst[i] == medicatielijst[j] or sleutel in gezien:
+                continue
+            gezien.add(sleutel)
+            interacties.append({
+                'middel_a': medicatielijst[i],
+                'middel_b': medicatielijst[j],
+                'tekst': tekst
+            })
+    return interacties
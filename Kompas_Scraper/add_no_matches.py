@@ -1,9 +1,13 @@
 import json
 import os
 import re
+import sys
 import sqlite3
 import unicodedata
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Parsers import gstandaard
+
 BST_PATH = "G-Standaard/"
 DB_PATH = "geneesmiddelen.db"
 JSON_PATH = "Kompas_Scraper/SPK_match.json"
@@ -21,53 +25,36 @@ def clean_name(name: str) -> str:
     name = name.replace("\u200b", "")
     return name.strip().lower()
 
-def load_bst020t(filepath: str):
+def load_bst020t(conn):
     """
     Maak mapping: NMNAAM (clean, lower) -> NMNR
-    Posities: NMNR [5:12], NMNAAM [85:135]
+    Leest uit de G-Standaard snapshot (tabel BST020T).
     """
     mapping = {}
-    with open(filepath, encoding="utf-8") as f:
-        for line in f:
-            nmnr = line[5:12].strip()
-            nmnaam = line[85:135].strip()
-            nmnaam = clean_name(nmnaam)
-            if nmnaam and nmnr:
-                mapping[nmnaam] = nmnr
+    for nmnr, nmnaam in conn.execute("SELECT NMNR, NMNAAM FROM BST020T ORDER BY rij"):
+        nmnaam = clean_name(nmnaam)
+        if nmnaam and nmnr:
+            mapping[nmnaam] = nmnr
     return mapping
 
-def load_bst711t(filepath: str):
+def load_bst711t(conn):
     """
-    Lees BST711T in: we hebben GPNMNR [33:40], GPSTNR [40:47], SPKODE [104:112], ATCODE [118:126]
-    (0-based slicing; ATCODE pos 119-126 -> slice [118:126])
+    Lees BST711T uit de snapshot: GPNMNR, GPSTNR, SPKODE, ATCODE
     Return list of dicts
     """
-    rows = []
-    with open(filepath, encoding="utf-8") as f:
-        for line in f:
-            rows.append({
-                "GPNMNR": line[33:40].strip(),
-                "GPSTNR": line[40:47].strip(),
-                "SPKODE": line[104:112].strip(),
-                "ATCODE": line[118:126].strip(),
-            })
-    return rows
-
-def load_bst801t(filepath: str):
+    return gstandaard.load_table(conn, "BST711T", ["GPNMNR", "GPSTNR", "SPKODE", "ATCODE"])
+
+def load_bst801t(conn):
     """
     ATC-groep (eerste 3 tekens) -> NL omschrijving
-    Posities: ATC-code [5:13], Omschrijving [13:93]
     Neem alleen entries waar de rest leeg is (pure 3-lettergroep).
     """
     mapping = {}
-    with open(filepath, encoding="utf-8") as f:
-        for line in f:
-            atc_code = line[5:13]
-            atc_grp = atc_code[:3].strip()
-            rest = atc_code[3:].strip()
-            oms = line[13:93].strip()
-            if atc_grp and (not rest) and oms:
-                mapping[atc_grp] = oms
+    for atc_code, oms in conn.execute("SELECT ATCODE, ATOMS FROM BST801T ORDER BY rij"):
+        atc_grp = atc_code[:3].strip()
+        rest = atc_code[3:].strip()
+        if atc_grp and (not rest) and oms:
+            mapping[atc_grp] = oms
     return mapping
 
 def pick_spk_atc(candidates):
@@ -121,10 +108,12 @@ def update_db_for_geneesmiddel(conn, geneesmiddel, spk, atc, atc3_to_omschrijvin
 # ---------------------------
 
 def main():
-    # 1) Laad G-Standaard
-    nmnaam_to_nmnr = load_bst020t(os.path.join(BST_PATH, "BST020T"))
-    bst711 = load_bst711t(os.path.join(BST_PATH, "BST711T"))
-    atc3_to_omschrijving = load_bst801t(os.path.join(BST_PATH, "BST801T"))
+    # 1) Laad G-Standaard (gecompileerde snapshot)
+    bst_conn = gstandaard.open_snapshot(BST_PATH)
+    nmnaam_to_nmnr = load_bst020t(bst_conn)
+    bst711 = load_bst711t(bst_conn)
+    atc3_to_omschrijving = load_bst801t(bst_conn)
+    bst_conn.close()
 
     # 2) Laad JSON mappings
     with open(JSON_PATH, "r", encoding="utf-8") as f:
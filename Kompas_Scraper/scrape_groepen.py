@@ -4,8 +4,13 @@ import sqlite3
 import time
 import random
 import re
+import os
+import sys
 import unicodedata
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Parsers import gstandaard
+
 BASE_URL = "https://www.farmacotherapeutischkompas.nl"
 BST_PATH = "G-Standaard/"
 
@@ -26,54 +31,47 @@ def clean_name(name):
 # ===============================
 # BST020T inlezen en naam → NMNR dictionary maken
 # ===============================
-def load_bst020t(filepath):
+def load_bst020t(conn):
     nmnaam_to_nmnr = {}
-    with open(filepath, encoding="utf-8") as f:
-        for line in f:
-            nmnr = line[5:12].strip()
-            nmnaam = line[85:135].strip().lower()
-            nmnaam = unicodedata.normalize('NFKD', nmnaam).encode('ASCII', 'ignore').decode('ASCII')
-            nmnaam_to_nmnr[nmnaam] = nmnr
+    for nmnr, nmnaam in conn.execute("SELECT NMNR, NMNAAM FROM BST020T ORDER BY rij"):
+        nmnaam = nmnaam.lower()
+        nmnaam = unicodedata.normalize('NFKD', nmnaam).encode('ASCII', 'ignore').decode('ASCII')
+        nmnaam_to_nmnr[nmnaam] = nmnr
     return nmnaam_to_nmnr
 
 # ===============================
 # BST711T inlezen en NMNR → (SPKode, ATC-code) dictionary maken
 # ===============================
-def load_bst711t(filepath):
+def load_bst711t(conn):
     nmnr_to_spk_atc = {}
-    with open(filepath, encoding="utf-8") as f:
-        for line in f:
-            nmnr = line[40:47].strip()
-            spkode = line[104:112].strip()
-            atc_code = line[118:126].strip()
-            if nmnr:
-                nmnr_to_spk_atc[nmnr] = (spkode, atc_code)
+    for nmnr, spkode, atc_code in conn.execute("SELECT GPSTNR, SPKODE, ATCODE FROM BST711T ORDER BY rij"):
+        if nmnr:
+            nmnr_to_spk_atc[nmnr] = (spkode, atc_code)
     return nmnr_to_spk_atc
 
 # ===============================
 # BST801T inlezen en ATC_groep → Nederlandse omschrijving dictionary maken
 # ===============================
-def load_bst801t(filepath):
+def load_bst801t(conn):
     atc3_to_omschrijving = {}
-    with open(filepath, encoding="utf-8") as f:
-        for line in f:
-            atc_code = line[5:13]
-            atc_groep = atc_code[:3].strip()
-            rest = atc_code[3:].strip()
-            omschrijving = line[13:93].strip()
-            
-            # We nemen alleen ATC-groep op als de eerste 3 tekens gevuld zijn
-            # én de rest van het veld leeg is
-            if atc_groep and not rest and omschrijving:
-                atc3_to_omschrijving[atc_groep] = omschrijving
+    for atc_code, omschrijving in conn.execute("SELECT ATCODE, ATOMS FROM BST801T ORDER BY rij"):
+        atc_groep = atc_code[:3].strip()
+        rest = atc_code[3:].strip()
+
+        # We nemen alleen ATC-groep op als de eerste 3 tekens gevuld zijn
+        # én de rest van het veld leeg is
+        if atc_groep and not rest and omschrijving:
+            atc3_to_omschrijving[atc_groep] = omschrijving
     return atc3_to_omschrijving
 
 # ===============================
-# Load BST data
+# Load BST data (uit de gecompileerde snapshot)
 # ===============================
-nmnaam_to_nmnr = load_bst020t(BST_PATH + "BST020T")
-nmnr_to_spk_atc = load_bst711t(BST_PATH + "BST711T")
-atc3_to_omschrijving = load_bst801t(BST_PATH + "BST801T")
+bst_conn = gstandaard.open_snapshot(BST_PATH)
+nmnaam_to_nmnr = load_bst020t(bst_conn)
+nmnr_to_spk_atc = load_bst711t(bst_conn)
+atc3_to_omschrijving = load_bst801t(bst_conn)
+bst_conn.close()
 
 # ===============================
 # Haal groep-links op uit het Kompas
@@ -0,0 +1,289 @@
+"""
+Gestructureerde dosering uit de Medimo-gebruikskolom.
+
+Vormen die Medimo levert:
+    '1-0-0 stuks, dagelijks, Continu'
+    '0-0-x gram, dagelijks, Continu'                       (x = hoeveelheid niet opgegeven)
+    '2-0-0 stuks, 1x per week op maandag, Continu'
+    '08:00u 2-12:00u 2-17:00u 2 stuks, dagelijks, Continu'  (tijden per moment)
+    '1-0-0 stuks, dagelijks, Continu (Stop: 24-01-2025 18:59)'
+
+Per regel wordt een Dosering gemaakt (hoeveelheid per moment, eenheid, frequentie, continu
+of zo nodig). Voor een hele afdeling zet DoseringTabel die om naar NumPy-arrays, zodat
+dagdoses (en via de sterkte uit de productnaam: mg per dag) gevectoriseerd te berekenen zijn.
+Onbekende hoeveelheden en frequenties zijn NaN en werken zo door in de dagdosis.
+"""
+
+import re
+from dataclasses import dataclass, replace
+import numpy as np
+
+_GETAL = r"[\dx.,/½]+"
+_SCHEMA_RE = re.compile(rf"^({_GETAL}(?:-{_GETAL})*)\s+")
+_TIJDEN_RE = re.compile(rf"^(\d{{1,2}}:\d{{2}}u\s+{_GETAL}(?:-\d{{1,2}}:\d{{2}}u\s+{_GETAL})*)\s+")
+_TIJD_MOMENT_RE = re.compile(rf"(\d{{1,2}}:\d{{2}})u\s+({_GETAL})")
+_REST_RE = re.compile(r"^(?P<eenheid>[^,]+),\s*(?P<frequentie>.+?),\s*(?P<soort>Continu|Zo nodig)"
+                      r"(?:\s*\(Stop:\s*(?P<stop>[^)]*)\))?\s*$")
+_PER_WEEK_RE = re.compile(r"^(\d+)x per week\b")
+_PER_DAG_RE = re.compile(r"^(\d+)x per dag\b")
+_OM_DE_DAGEN_RE = re.compile(r"^om de (\d+) dagen\b")
+# Eén sterkte in de productnaam, bv. 'tablet 500mg' of '6,25mg'; niet '2mg/ml' of '200/6ug'
+_STERKTE_RE = re.compile(r"(?<![/\d.,])(\d+(?:[.,]\d+)?)\s*(mg|g|mcg|ug|microgram)(?![/\w])", re.IGNORECASE)
+_NAAR_MG = {"mg": 1.0, "g": 1000.0, "mcg": 0.001, "ug": 0.001, "microgram": 0.001}
+
+# Vaste codes voor de eenheid in DoseringTabel.eenheid (-1 = overig/onbekend);
+# 'mg' alleen voor samengevoegde regels met verschillende sterktes (combineer_doseringen)
+EENHEDEN = ("stuks", "milliliter", "gram", "druppels", "doses", "smeren", "mg")
+STUKS = EENHEDEN.index("stuks")
+MG = EENHEDEN.index("mg")
+
+
+@dataclass(slots=True)
+class Dosering:
+    momenten: tuple             # hoeveelheid per toedienmoment; NaN als 'x'
+    tijden: tuple | None        # tijd per moment ('08:00') bij een schema met tijden
+    eenheid: str                # 'stuks', 'milliliter', ...
+    frequentie: str             # 'dagelijks', '1x per week op maandag', ...
+    per_dag: float              # toedieningsdagen per dag: 1 (dagelijks), 1/7 (1x per week); NaN als onbekend
+    zo_nodig: bool
+    stop: str | None = None     # stopmoment zoals Medimo het geeft
+    sterkte_mg: float = float("nan")  # sterkte per stuk uit de productnaam
+    zo_nodig_schema: "Dosering | None" = None  # zo-nodigdeel naast een continue dosering (samengevoegd)
+
+    @property
+    def dagdosis(self):
+        """
+        Gemiddelde hoeveelheid per dag in de eigen eenheid (NaN als een deel onbekend is).
+        """
+        return sum(self.momenten) * self.per_dag
+
+
+def _getal(tekst):
+    if tekst == "x":
+        return float("nan")
+    if tekst == "½":
+        return 0.5
+    if "/" in tekst:
+        teller, _, noemer = tekst.partition("/")
+        try:
+            return float(teller.replace(",", ".")) / float(noemer.replace(",", "."))
+        except (ValueError, ZeroDivisionError):
+            return float("nan")
+    try:
+        return float(tekst.replace(",", "."))
+    except ValueError:
+        return float("nan")
+
+
+def _per_dag(frequentie):
+    frequentie = frequentie.strip().lower()
+    if frequentie.startswith("dagelijks"):
+        return 1.0
+    if frequentie.startswith("om de dag"):
+        return 0.5
+    # 'Nx per dag' naast een schema: de momenten staan al in het schema, dus elke dag
+    if _PER_DAG_RE.match(frequentie):
+        return 1.0
+    match = _PER_WEEK_RE.match(frequentie)
+    if match:
+        return int(match.group(1)) / 7
+    match = _OM_DE_DAGEN_RE.match(frequentie)
+    if match and int(match.group(1)):
+        return 1.0 / int(match.group(1))
+    return float("nan")
+
+
+def parse_sterkte_mg(naam):
+    """
+    Sterkte per stuk in mg uit de productnaam; NaN als er geen of meer dan één sterkte staat.
+    """
+    if not naam:
+        return float("nan")
+    treffers = _STERKTE_RE.findall(naam)
+    if len(treffers) != 1:
+        return float("nan")
+    waarde, eenheid = treffers[0]
+    return float(waarde.replace(",", ".")) * _NAAR_MG[eenheid.lower()]
+
+
+def parse_dosering(gebruik, naam=None):
+    """
+    Medimo-gebruikskolom → Dosering, of None als de tekst niet in een bekende vorm staat.
+    naam: optioneel de productnaam, voor de sterkte per stuk.
+    """
+    if not gebruik:
+        return None
+    tijden = None
+    match = _TIJDEN_RE.match(gebruik)
+    if match:
+        paren = _TIJD_MOMENT_RE.findall(match.group(1))
+        tijden = tuple(tijd for tijd, _ in paren)
+        momenten = tuple(_getal(hoeveelheid) for _, hoeveelheid in paren)
+    else:
+        match = _SCHEMA_RE.match(gebruik)
+        if not match:
+            return None
+        momenten = tuple(_getal(deel) for deel in match.group(1).split("-"))
+
+    rest = _REST_RE.match(gebruik[match.end():])
+    if not rest:
+        return None
+    return Dosering(
+        momenten=momenten,
+        tijden=tijden,
+        eenheid=rest.group("eenheid").strip(),
+        frequentie=rest.group("frequentie").strip(),
+        per_dag=_per_dag(rest.group("frequentie")),
+        zo_nodig=rest.group("soort") == "Zo nodig",
+        stop=rest.group("stop").strip() if rest.group("stop") else None,
+        sterkte_mg=parse_sterkte_mg(naam),
+    )
+
+
+class DoseringTabel:
+    """
+    Doseringen van een afdeling als arrays, één rij per medicatieregel:
+        patiënt    int32  (n,)     index van de patiënt
+        momenten   float32(n, m)   hoeveelheid per moment, 0 = geen moment, NaN = onbekend
+        per_dag    float32(n,)
+        zo_nodig   bool   (n,)
+        eenheid    int8   (n,)     index in EENHEDEN, -1 = overig
+        sterkte_mg float32(n,)
+    Regels zonder herkenbare dosering hebben NaN als per_dag.
+    """
+
+    def __init__(self, doseringen_per_patiënt):
+        doseringen = [d for lijst in doseringen_per_patiënt for d in lijst]
+        n = len(doseringen)
+        breedte = max((len(d.momenten) for d in doseringen if d is not None), default=1)
+
+        self.aantal_patiënten = len(doseringen_per_patiënt)
+        self.patiënt = np.repeat(
+            np.arange(len(doseringen_per_patiënt), dtype=np.int32),
+            [len(lijst) for lijst in doseringen_per_patiënt]
+        )
+        self.momenten = np.zeros((n, breedte), dtype=np.float32)
+        self.per_dag = np.full(n, np.nan, dtype=np.float32)
+        self.zo_nodig = np.zeros(n, dtype=bool)
+        self.eenheid = np.full(n, -1, dtype=np.int8)
+        self.sterkte_mg = np.full(n, np.nan, dtype=np.float32)
+
+        for i, d in enumerate(doseringen):
+            if d is None:
+                continue
+            self.momenten[i, :len(d.momenten)] = d.momenten
+            self.per_dag[i] = d.per_dag
+            self.zo_nodig[i] = d.zo_nodig
+            self.eenheid[i] = EENHEDEN.index(d.eenheid) if d.eenheid in EENHEDEN else -1
+            self.sterkte_mg[i] = d.sterkte_mg
+
+    @property
+    def dagdosis(self):
+        """
+        Gemiddelde hoeveelheid per dag per regel, in de eigen eenheid.
+        """
+        return self.momenten.sum(axis=1) * self.per_dag
+
+    @property
+    def dagdosis_mg(self):
+        """
+        Vaste mg per dag per regel; alleen voor 'stuks' met een bekende sterkte en voor 'mg',
+        anders NaN. Zo-nodigregels zijn geen vaste dosis en zijn ook NaN (zie zo_nodig).
+        """
+        dagdosis = self.dagdosis
+        mg = np.where(
+            self.eenheid == STUKS, dagdosis * self.sterkte_mg, np.where(self.eenheid == MG, dagdosis, np.nan)
+        )
+        return np.where(self.zo_nodig, np.nan, mg).astype(np.float32)
+
+    def totaal_per_patiënt(self, waarden, selectie=None):
+        """
+        Som van waarden (één per regel) per patiënt, over de regels in selectie (bool-masker).
+        Een NaN in de selectie maakt het totaal van die patiënt NaN.
+        """
+        if selectie is None:
+            selectie = np.ones(len(waarden), dtype=bool)
+        totalen = np.zeros(self.aantal_patiënten, dtype=np.float64)
+        np.add.at(totalen, self.patiënt[selectie], waarden[selectie])
+        return totalen
+
+
+def combineer_doseringen(doseringen):
+    """
+    Eén Dosering voor meerdere regels van hetzelfde product (bv. 1-0-0 en 0-4-0 → 1-4-0).
+    Gelijke frequentie: hoeveelheden per moment (of per tijd) opgeteld. Verschillende
+    frequenties: omgerekend naar een gemiddelde per dag, zodat de dagdosis klopt.
+    Stuks van verschillende (bekende) sterktes worden eerst omgerekend naar mg, zodat
+    250mg 1-0-0 en 500mg 0-0-1 samen 250-0-500 mg worden.
+    Continue en zo-nodigregels worden niet bij elkaar opgeteld: de momenten zijn die van de
+    continue regels, het zo-nodigdeel staat apart in zo_nodig_schema.
+    None als een regel geen dosering heeft, de eenheden verschillen of twee regels precies
+    gelijk zijn (dubbel ingevoerd of bewust twee keer: niet te zeggen, dus niet optellen).
+    """
+    if not doseringen or any(d is None for d in doseringen):
+        return None
+    if len(doseringen) == 1:
+        return doseringen[0]
+    # repr: NaN-hoeveelheden ('x') tellen zo ook als gelijk
+    if len({repr(d) for d in doseringen}) < len(doseringen):
+        return None
+    continu = [d for d in doseringen if not d.zo_nodig]
+    zo_nodig = [d for d in doseringen if d.zo_nodig]
+    if continu and zo_nodig:
+        basis = _tel_op(continu)
+        return replace(basis, zo_nodig_schema=_tel_op(zo_nodig)) if basis is not None else None
+    return _tel_op(doseringen)
+
+
+def _tel_op(doseringen):
+    """
+    Som van doseringen die allemaal continu of allemaal zo nodig zijn (zie combineer_doseringen).
+    """
+    if len(doseringen) == 1:
+        return doseringen[0]
+    if (len({d.sterkte_mg for d in doseringen}) > 1
+            and all(d.eenheid == "stuks" and d.sterkte_mg == d.sterkte_mg for d in doseringen)):
+        doseringen = [
+            replace(d, momenten=tuple(m * d.sterkte_mg for m in d.momenten), eenheid="mg", sterkte_mg=float("nan"))
+            for d in doseringen
+        ]
+    eerste = doseringen[0]
+    if any(d.eenheid != eerste.eenheid for d in doseringen):
+        return None
+
+    frequenties = list(dict.fromkeys(d.frequentie for d in doseringen))
+    gelijk = len(frequenties) == 1
+    # Bij verschillende frequenties telt elke regel mee naar rato van zijn dagen per dag
+    gewichten = [1.0 if gelijk else d.per_dag for d in doseringen]
+
+    if all(d.tijden for d in doseringen):
+        per_tijd = {}
+        for d, gewicht in zip(doseringen, gewichten):
+            for tijd, hoeveelheid in zip(d.tijden, d.momenten):
+                per_tijd[tijd] = per_tijd.get(tijd, 0.0) + hoeveelheid * gewicht
+        tijden = tuple(sorted(per_tijd, key=lambda t: tuple(int(x) for x in t.split(":"))))
+        momenten = tuple(per_tijd[tijd] for tijd in tijden)
+    elif any(d.tijden for d in doseringen):
+        # Schema met en zonder tijden: momenten zijn niet te koppelen, alleen de dagtotalen
+        tijden = None
+        momenten = (sum(sum(d.momenten) * gewicht for d, gewicht in zip(doseringen, gewichten)),)
+    else:
+        tijden = None
+        breedte = max(len(d.momenten) for d in doseringen)
+        momenten = tuple(
+            sum((d.momenten[i] if i < len(d.momenten) else 0.0) * gewicht for d, gewicht in zip(doseringen, gewichten))
+            for i in range(breedte)
+        )
+
+    sterktes = {d.sterkte_mg for d in doseringen if d.sterkte_mg == d.sterkte_mg}  # zonder NaN
+    stops = {d.stop for d in doseringen}
+    return Dosering(
+        momenten=momenten,
+        tijden=tijden,
+        eenheid=eerste.eenheid,
+        frequentie=" + ".join(frequenties),
+        per_dag=eerste.per_dag if gelijk else 1.0,
+        zo_nodig=all(d.zo_nodig for d in doseringen),
+        stop=stops.pop() if len(stops) == 1 else None,
+        sterkte_mg=sterktes.pop() if len(sterktes) == 1 else float("nan"),
+    )
@@ -0,0 +1,276 @@
+"""
+Compileert de G-Standaard (vaste-breedte BST-bestanden) naar één SQLite-snapshot.
+
+De snapshot wordt alleen opnieuw opgebouwd als een van de BST-bestanden is gewijzigd
+(controle op grootte/mtime, daarna checksum). Alle loaders lezen daarna uit de
+snapshot in plaats van telkens ~40 MB tekst te parsen.
+
+Gebruik vanaf de projectroot:
+    python -m Parsers.gstandaard          # compileer indien nodig
+    python -m Parsers.gstandaard --force  # altijd opnieuw compileren
+"""
+
+import os
+import re
+import sys
+import hashlib
+import sqlite3
+import tempfile
+import unicodedata
+
+BST_DIR = "G-Standaard"
+SNAPSHOT_PATH = "gstandaard_snapshot.db"
+
+# Verhogen bij een wijziging in de opbouw van de snapshot, dwingt een rebuild af
+SCHEMA_VERSIE = "3"
+
+# Kolomposities (0-based slicing) per BST-bestand, volgens de rubriekbeschrijving in BST001T
+BST_KOLOMMEN = {
+    "BST020T": [("NMNR", 5, 12), ("NMNAAM", 85, 135)],
+    "BST004T": [("HPKODE", 13, 21), ("ATNMNR", 21, 28)],
+    "BST052T": [("PRKODE", 5, 13), ("PRNMNR", 13, 20), ("GPKODE", 20, 28)],
+    "BST070T": [("HPKODE", 5, 13), ("GPKODE", 29, 37)],
+    "BST711T": [
+        ("GPKODE", 5, 13), ("GSKODE", 13, 21),
+        ("GPNMNR", 33, 40), ("GPSTNR", 40, 47),
+        ("SPKODE", 104, 112), ("ATCODE", 118, 126)
+    ],
+    "BST801T": [("ATCODE", 5, 13), ("ATOMS", 13, 93)],
+    # Dubbelmedicatie: PRK-paar → DMCODE → tekstverwijzing → tekstblok
+    "BST671T": [("DMPRKA", 5, 13), ("DMPRKB", 13, 21), ("DMCODE", 21, 29)],
+    "BST672T": [("DMCODE", 5, 13), ("TXMOD", 13, 16), ("TXSRTT", 16, 19), ("TXKODE", 19, 27)],
+    "BST922T": [
+        ("TXMODU", 9, 15), ("TXTSRT", 19, 25), ("TXKODE", 25, 33),
+        ("TXBLNR", 33, 41), ("TXRGLN", 41, 47), ("TXTEXT", 47, 179)
+    ],
+}
+
+# Kolommen waarop in de snapshot een index komt
+BST_INDEXEN = {
+    "BST020T": ["NMNR"],
+    "BST004T": ["HPKODE", "ATNMNR"],
+    "BST052T": ["PRKODE", "PRNMNR", "GPKODE"],
+    "BST070T": ["HPKODE", "GPKODE"],
+    "BST711T": ["GPKODE", "GSKODE", "GPNMNR", "GPSTNR", "SPKODE"],
+    "BST801T": ["ATCODE"],
+    "BST671T": ["DMPRKA", "DMPRKB"],
+    "BST672T": ["DMCODE"],
+    "BST922T": ["TXKODE"],
+}
+
+
+# ---------------------------
+# Naam-normalisatie
+# ---------------------------
+
+_HAAKJES_RE = re.compile(r"\(.*?\)")
+
+def normaliseer_naam(naam):
+    """
+    Zelfde normalisatie als parse_medimo.clean_name(...).lower():
+    ASCII, (..) weg, zero-width space weg, trim, lower.
+    """
+    naam = unicodedata.normalize('NFKD', naam).encode('ASCII', 'ignore').decode('ASCII')
+    naam = _HAAKJES_RE.sub("", naam)
+    naam = naam.replace("\u200b", "")
+    return naam.strip().lower()
+
+
+# ---------------------------
+# Checksums
+# ---------------------------
+
+def _checksum(file_path):
+    h = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for blok in iter(lambda: f.read(1 << 20), b""):
+            h.update(blok)
+    return h.hexdigest()
+
+def _bestand_status(bst_dir):
+    """
+    Geeft per BST-bestand (grootte, mtime_ns) terug, of None als het bestand ontbreekt.
+    """
+    status = {}
+    for tabel in BST_KOLOMMEN:
+        pad = os.path.join(bst_dir, tabel)
+        try:
+            st = os.stat(pad)
+            status[tabel] = (st.st_size, st.st_mtime_ns)
+        except FileNotFoundError:
+            status[tabel] = None
+    return status
+
+def _snapshot_id(checksums):
+    h = hashlib.sha1(f"schema:{SCHEMA_VERSIE};".encode("ascii"))
+    for tabel in sorted(checksums):
+        h.update(f"{tabel}:{checksums[tabel] or '-'};".encode("ascii"))
+    return h.hexdigest()[:16]
+
+
+# ---------------------------
+# Meta-informatie
+# ---------------------------
+
+def _lees_meta(snapshot_path):
+    """
+    Leest {tabel: (grootte, mtime_ns, checksum)} uit een bestaande snapshot, of None.
+    """
+    if not os.path.exists(snapshot_path):
+        return None
+    try:
+        conn = sqlite3.connect(f"file:{snapshot_path}?mode=ro", uri=True)
+        try:
+            rows = conn.execute("SELECT tabel, grootte, mtime_ns, checksum FROM bestanden").fetchall()
+            versie = conn.execute("SELECT waarde FROM meta WHERE sleutel = 'schema_versie'").fetchone()
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError:
+        return None
+    if not versie or versie[0] != SCHEMA_VERSIE:
+        return None
+    return {tabel: (grootte, mtime_ns, checksum) for tabel, grootte, mtime_ns, checksum in rows}
+
+def _is_actueel(bst_dir, snapshot_path):
+    """
+    True als de snapshot bij de huidige BST-bestanden hoort.
+    Snel pad: grootte en mtime gelijk → geen checksum nodig.
+    """
+    meta = _lees_meta(snapshot_path)
+    if meta is None or set(meta) != set(BST_KOLOMMEN):
+        return False
+
+    for tabel, stat in _bestand_status(bst_dir).items():
+        grootte, mtime_ns, checksum = meta[tabel]
+        if stat is None or checksum is None:
+            if stat is not None or checksum is not None:
+                return False
+            continue
+        if stat == (grootte, mtime_ns):
+            continue
+        # Bestand aangeraakt: alleen opnieuw bouwen als de inhoud echt anders is
+        if _checksum(os.path.join(bst_dir, tabel)) != checksum:
+            return False
+    return True
+
+
+# ---------------------------
+# Compileren
+# ---------------------------
+
+def _lees_bst(file_path, columns):
+    with open(file_path, "r", encoding="latin-1") as f:
+        for line in f:
+            yield tuple(line[start:eind].strip() for _, start, eind in columns)
+
+def _bouw_naam_index(c):
+    """
+    Genormaliseerde NMNAAM → NMNR. Bij gelijke namen wint de eerste rij in bestandsvolgorde,
+    net als de oorspronkelijke lineaire scan in lichte_fuzzy_match.
+    """
+    c.execute("CREATE TABLE BST020T_NAMEN (naam TEXT PRIMARY KEY, NMNR TEXT)")
+    rows = c.execute("SELECT NMNR, NMNAAM FROM BST020T ORDER BY rij").fetchall()
+    c.executemany(
+        "INSERT OR IGNORE INTO BST020T_NAMEN (naam, NMNR) VALUES (?, ?)",
+        ((normaliseer_naam(nmnaam), nmnr) for nmnr, nmnaam in rows)
+    )
+
+def compile_snapshot(bst_dir=BST_DIR, snapshot_path=SNAPSHOT_PATH, force=False):
+    """
+    Bouwt de snapshot opnieuw op als dat nodig is en geeft het snapshot-id terug.
+    Het nieuwe bestand wordt eerst naast de oude snapshot geschreven en daarna
+    atomisch vervangen, zodat lopende lezers niet gestoord worden.
+    """
+    if not force and _is_actueel(bst_dir, snapshot_path):
+        return get_snapshot_id(snapshot_path)
+
+    doel_dir = os.path.dirname(os.path.abspath(snapshot_path))
+    fd, tmp_path = tempfile.mkstemp(suffix=".db", dir=doel_dir)
+    os.close(fd)
+
+    checksums = {}
+    try:
+        conn = sqlite3.connect(tmp_path)
+        c = conn.cursor()
+        c.execute("PRAGMA journal_mode = OFF")
+        c.execute("PRAGMA synchronous = OFF")
+        c.execute("CREATE TABLE bestanden (tabel TEXT PRIMARY KEY, grootte INTEGER, mtime_ns INTEGER, checksum TEXT)")
+        c.execute("CREATE TABLE meta (sleutel TEXT PRIMARY KEY, waarde TEXT)")
+
+        for tabel, columns in BST_KOLOMMEN.items():
+            kolommen = ", ".join(f"{naam} TEXT" for naam, _, _ in columns)
+            c.execute(f"CREATE TABLE {tabel} (rij INTEGER PRIMARY KEY, {kolommen})")
+
+            pad = os.path.join(bst_dir, tabel)
+            if not os.path.exists(pad):
+                print(f"Waarschuwing: {pad} niet gevonden; tabel {tabel} blijft leeg.")
+                checksums[tabel] = None
+                c.execute("INSERT INTO bestanden VALUES (?, NULL, NULL, NULL)", (tabel,))
+                continue
+
+            st = os.stat(pad)
+            checksums[tabel] = _checksum(pad)
+            placeholders = ", ".join("?" for _ in columns)
+            namen = ", ".join(naam for naam, _, _ in columns)
+            c.executemany(f"INSERT INTO {tabel} ({namen}) VALUES ({placeholders})", _lees_bst(pad, columns))
+            c.execute("INSERT INTO bestanden VALUES (?, ?, ?, ?)", (tabel, st.st_size, st.st_mtime_ns, checksums[tabel]))
+
+            for kolom in BST_INDEXEN.get(tabel, []):
+                c.execute(f"CREATE INDEX idx_{tabel}_{kolom} ON {tabel} ({kolom})")
+
+        _bouw_naam_index(c)
+
+        snapshot_id = _snapshot_id(checksums)
+        c.execute("INSERT INTO meta VALUES ('snapshot_id', ?)", (snapshot_id,))
+        c.execute("INSERT INTO meta VALUES ('schema_versie', ?)", (SCHEMA_VERSIE,))
+        conn.commit()
+        conn.close()
+        os.replace(tmp_path, snapshot_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    print(f"G-Standaard snapshot gecompileerd: {snapshot_path} (id {snapshot_id})")
+    return snapshot_id
+
+
+# ---------------------------
+# Lezen
+# ---------------------------
+
+def open_snapshot(bst_dir=BST_DIR, snapshot_path=SNAPSHOT_PATH):
+    """
+    Compileert indien nodig en geeft een read-only verbinding met de snapshot terug.
+    """
+    compile_snapshot(bst_dir, snapshot_path)
+    return sqlite3.connect(f"file:{snapshot_path}?mode=ro", uri=True, check_same_thread=False)
+
+def get_snapshot_id(snapshot_path=SNAPSHOT_PATH):
+    conn = sqlite3.connect(f"file:{snapshot_path}?mode=ro", uri=True)
+    try:
+        row = conn.execute("SELECT waarde FROM meta WHERE sleutel = 'snapshot_id'").fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+def load_naam_index(conn):
+    """
+    Leest de vooraf genormaliseerde naam → NMNR mapping uit de snapshot.
+    """
+    return dict(conn.execute("SELECT naam, NMNR FROM BST020T_NAMEN"))
+
+def load_table(conn, tabel, kolommen=None):
+    """
+    Leest een BST-tabel uit de snapshot als lijst van dicts (in bestandsvolgorde),
+    in hetzelfde formaat als parse_medimo.load_fixed_width_file.
+    """
+    if tabel not in BST_KOLOMMEN:
+        raise ValueError(f"Onbekende G-Standaard tabel: {tabel}")
+    kolommen = kolommen or [naam for naam, _, _ in BST_KOLOMMEN[tabel]]
+    c = conn.execute(f"SELECT {', '.join(kolommen)} FROM {tabel} ORDER BY rij")
+    return [dict(zip(kolommen, row)) for row in c]
+
+
+if __name__ == "__main__":
+    compile_snapshot(force="--force" in sys.argv)
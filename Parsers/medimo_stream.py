@@ -0,0 +1,148 @@
+"""
+Medimo-export in één doorgang, regel voor regel.
+
+Werkt op elke bron die regels oplevert: een geopend bestand, str.splitlines(), of een
+binaire stroom zoals de body van een Flask-request (regels worden dan als UTF-8 gelezen).
+Patiënten komen als Patient-records vrij zodra de volgende kop ('Dhr. ' / 'Mevr. ') of het
+einde van de invoer gelezen is; de afdelingsnaam wordt onderweg uit de inleiding gehaald.
+
+De regels voor medicatieregels zijn gelijk aan parse_medimo_block:
+    - regel begint met C (continu) of Z (zo nodig), gevolgd door witruimte
+    - kolommen gescheiden door twee of meer spaties of een tab: naam, gebruik
+    - de eerstvolgende niet-lege regel die geen nieuwe medicatieregel of patiënt is,
+      is de opmerking bij die regel
+"""
+
+import re
+from dataclasses import dataclass, field
+from datetime import date
+from Parsers.parse_medimo import parse_geboortedatum
+from Parsers.dosering import parse_dosering
+
+_AFDELING_RE = re.compile(r"Een overzicht van alle actieve medicatie in afdeling (.+?)\.")
+_STATUS_RE = re.compile(r"^[CZ]\s+")
+_KOLOM_RE = re.compile(r"\s{2,}|\t+")
+# Doseerschema aan het begin van de gebruikskolom, bv. '1-0-0' of '0-0-x' of '0,5-0-1/2'
+_SCHEMA_RE = re.compile(r"^([\dx.,/]+(?:-[\dx.,/]+)+)(?=[\s,]|$)")
+
+_PATIËNT_KOP = ("Dhr. ", "Mevr. ")
+_GEEN_OPMERKING = ("C", "Z", "Dhr.", "Mevr.")
+
+
+@dataclass(slots=True)
+class MedicationLine:
+    status: str                 # "C" (continu) of "Z" (zo nodig)
+    naam: str                   # geneesmiddelnaam zoals in Medimo
+    gebruik: str                # volledige gebruikskolom, bv. '1-0-0 stuks, dagelijks, Continu'
+    schema: str | None          # doseerschema uit de gebruikskolom, bv. '1-0-0'
+    opmerking: str = ""
+    origineel: str = ""         # regel zonder C/Z-prefix
+    dosering: object = None     # Dosering (Parsers.dosering) of None als het gebruik niet te lezen is
+
+    def als_dict(self):
+        """
+        Zelfde vorm als parse_medimo_block, aangevuld met de status en de dosering.
+        """
+        return {
+            "origineel": self.origineel,
+            "clean": self.naam,
+            "gebruik": self.gebruik,
+            "opmerking": self.opmerking,
+            "status": self.status,
+            "dosering": self.dosering,
+        }
+
+
+@dataclass(slots=True)
+class Patient:
+    naam: str                   # volledige kop, bv. 'Mevr. M Curie (07-11-1942)'
+    geboortedatum: date | None
+    regels: list = field(default_factory=list)       # MedicationLine's
+    tekstregels: list = field(default_factory=list)  # alle regels onder de kop (gestript)
+
+    @property
+    def blok(self):
+        """
+        Het patiëntblok als tekst (kop + regels), zoals extract_patient_blocks_uit_tekst dat gaf.
+        """
+        return "\n".join([self.naam] + self.tekstregels).rstrip()
+
+
+def _medicatieregel(regel):
+    gm_regel = _STATUS_RE.sub("", regel)
+    delen = _KOLOM_RE.split(gm_regel)
+    if len(delen) < 2:
+        return None
+    gebruik = delen[1].strip()
+    naam = delen[0].strip()
+    schema = _SCHEMA_RE.match(gebruik)
+    return MedicationLine(
+        status=regel[0],
+        naam=naam,
+        gebruik=gebruik,
+        schema=schema.group(1) if schema else None,
+        origineel=gm_regel,
+        dosering=parse_dosering(gebruik, naam),
+    )
+
+
+class MedimoStream:
+    """
+    Itereer over de patiënten in een Medimo-export. afdeling is bekend zodra de inleiding
+    gelezen is; na afloop is hij "Onbekend" als er geen afdelingsregel was.
+    """
+
+    def __init__(self, regels):
+        self._regels = regels
+        self.afdeling = None
+
+    def __iter__(self):
+        patiënt = None
+        wacht = None  # laatste medicatieregel; de volgende regel kan de opmerking zijn
+
+        for ruw in self._regels:
+            if isinstance(ruw, bytes):
+                ruw = ruw.decode("utf-8")
+            regel = ruw.strip()
+
+            if self.afdeling is None:
+                match = _AFDELING_RE.search(regel)
+                if match:
+                    self.afdeling = match.group(1).strip()
+
+            if regel.startswith(_PATIËNT_KOP):
+                if patiënt is not None:
+                    yield patiënt
+                patiënt = Patient(naam=regel, geboortedatum=parse_geboortedatum(regel))
+                wacht = None
+                continue
+            if patiënt is None:
+                continue  # inleiding vóór de eerste patiënt
+
+            patiënt.tekstregels.append(regel)
+            if wacht is not None:
+                gm, wacht = wacht, None
+                if regel and not regel.startswith(_GEEN_OPMERKING):
+                    gm.opmerking = regel
+                    continue
+
+            if regel.startswith(("C", "Z")):
+                gm = _medicatieregel(regel)
+                if gm is not None:
+                    patiënt.regels.append(gm)
+                    wacht = gm
+
+        if patiënt is not None:
+            yield patiënt
+        if self.afdeling is None:
+            self.afdeling = "Onbekend"
+
+
+def lees_medimo(bron):
+    """
+    bron: tekst (str), of een iterable met regels (tekstbestand, binaire stroom, lijst).
+    Returns: MedimoStream; itereren levert Patient-records op.
+    """
+    if isinstance(bron, str):
+        bron = bron.splitlines()
+    return MedimoStream(bron)
@@ -0,0 +1,136 @@
+from collections import Counter, defaultdict
+
+from Parsers.gstandaard import normaliseer_naam
+
+try:
+    from rapidfuzz import fuzz, process
+except ImportError:
+    fuzz = process = None
+
+# Standaard minimale score (0-100) voor de fuzzy tier
+FUZZY_DREMPEL = 88
+# Aantal kandidaten uit de trigram-index dat met RapidFuzz gescoord wordt
+FUZZY_KANDIDATEN = 40
+# Trigrammen die in meer dan dit deel van de namen voorkomen tellen niet mee als filter
+FUZZY_MAX_DF = 0.02
+
+
+def trigrammen(naam):
+    naam = f"  {naam} "
+    return {naam[i:i + 3] for i in range(len(naam) - 2)}
+
+
+class TrigramIndex:
+    """
+    Karakter-trigram → naam-id's over alle genormaliseerde NMNAAM's. Voor een zoekterm
+    worden alleen de namen met de meeste gedeelde (niet te algemene) trigrammen gescoord
+    met rapidfuzz.process.cdist, zodat een regel ruim onder een milliseconde blijft.
+    """
+
+    def __init__(self, namen, max_df=FUZZY_MAX_DF):
+        self.namen = namen
+        postings = defaultdict(list)
+        for i, naam in enumerate(namen):
+            for tri in trigrammen(naam):
+                postings[tri].append(i)
+        self.postings = dict(postings)
+        self.max_postings = max(50, int(len(namen) * max_df))
+
+    def kandidaten(self, naam, limiet=FUZZY_KANDIDATEN):
+        lijsten = [self.postings[tri] for tri in trigrammen(naam) if tri in self.postings]
+        selectief = [p for p in lijsten if len(p) <= self.max_postings]
+        teller = Counter()
+        for p in (selectief or lijsten):
+            teller.update(p)
+        return [i for i, _ in teller.most_common(limiet)]
+
+    def beste_match(self, naam, drempel=FUZZY_DREMPEL, scorer=None, limiet=FUZZY_KANDIDATEN):
+        """
+        Geeft (naam-id, score) van de beste kandidaat boven de drempel terug, anders (None, None).
+        """
+        ids = self.kandidaten(naam, limiet)
+        if not ids:
+            return None, None
+        keuzes = [self.namen[i] for i in ids]
+        scores = process.cdist([naam], keuzes, scorer=scorer or fuzz.token_sort_ratio,
+                               score_cutoff=drempel, workers=1)[0]
+        beste = int(scores.argmax())
+        if scores[beste] < drempel or scores[beste] == 0:
+            return None, None
+        return ids[beste], float(scores[beste])
+
+class NaamIndex:
+    """
+    Vooraf genormaliseerde BST020T-namen → NMNR, zodat een Medimo-regel met een paar
+    dict-lookups aan een NMNR gekoppeld wordt in plaats van een scan over alle namen.
+
+    Matchvolgorde is gelijk aan de oorspronkelijke lichte_fuzzy_match:
+        1. exacte match op de volledige genormaliseerde naam
+        2. exacte match van het eerste woord op een volledige naam
+    Met fuzzy_drempel komt daar een derde tier bij:
+        3. fuzzy match (trigram-kandidaten, RapidFuzz-score >= fuzzy_drempel)
+    """
+
+    def __init__(self, naam_to_nmnr, fuzzy_drempel=None):
+        self.naam_to_nmnr = naam_to_nmnr
+        self.fuzzy_drempel = fuzzy_drempel
+        self._trigram_index = None
+        self._trigram_nmnrs = None
+        if fuzzy_drempel is not None and process is None:
+            print("Waarschuwing: rapidfuzz niet geïnstalleerd; fuzzy naam-matching staat uit.")
+            self.fuzzy_drempel = None
+
+    @classmethod
+    def from_rows(cls, bst020, fuzzy_drempel=None):
+        naam_to_nmnr = {}
+        for row in bst020:
+            naam_to_nmnr.setdefault(normaliseer_naam(row["NMNAAM"]), row["NMNR"])
+        return cls(naam_to_nmnr, fuzzy_drempel)
+
+    def _get_trigram_index(self):
+        # Pas bij de eerste fuzzy-zoekvraag opbouwen; exacte matches hebben hem niet nodig
+        if self._trigram_index is None:
+            namen = [naam for naam in self.naam_to_nmnr if naam]
+            self._trigram_nmnrs = [self.naam_to_nmnr[naam] for naam in namen]
+            self._trigram_index = TrigramIndex(namen)
+        return self._trigram_index
+
+    def fuzzy_zoek(self, gm_clean, drempel=None):
+        """
+        Geeft (NMNR, score) van de best passende BST020T-naam terug, of (None, None).
+        """
+        drempel = self.fuzzy_drempel if drempel is None else drempel
+        gm_norm = normaliseer_naam(gm_clean)
+        if drempel is None or process is None or not gm_norm:
+            return None, None
+        index = self._get_trigram_index()
+        i, score = index.beste_match(gm_norm, drempel)
+        if i is None:
+            return None, None
+        return self._trigram_nmnrs[i], score
+
+    def zoek(self, gm_clean):
+        """
+        Geeft (NMNR, methode, score) terug; methode is "exact", "eerste_woord", "fuzzy" of None.
+        """
+        gm_norm = normaliseer_naam(gm_clean)
+
+        # Stap 1: Exacte match op de volledige naam
+        nmnr = self.naam_to_nmnr.get(gm_norm)
+        if nmnr:
+            return nmnr, "exact", 100.0
+
+        # Stap 2: Probeer met eerste woord
+        woorden = gm_norm.split()
+        if woorden:
+            nmnr = self.naam_to_nmnr.get(woorden[0])
+            if nmnr:
+                return nmnr, "eerste_woord", 100.0
+
+        # Stap 3: Fuzzy match via trigram-kandidaten (alleen als ingeschakeld)
+        if self.fuzzy_drempel is not None:
+            nmnr, score = self.fuzzy_zoek(gm_clean)
+            if nmnr:
+                return nmnr, "fuzzy", score
+
+        return None, None, None
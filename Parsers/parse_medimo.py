@@ -1,7 +1,10 @@
-import os
-import sqlite3
 import re
 import unicodedata
+from datetime import date
+from Parsers import gstandaard
+from Database import referentie_db
+from Parsers.spk_resolver import SPKodeResolver
+from Parsers.naam_index import NaamIndex, FUZZY_DREMPEL
 
 def load_fixed_width_file(file_path, columns):
     data = []
@@ -11,9 +14,30 @@ def load_fixed_width_file(file_path, columns):
             data.append(row)
     return data
 
+def load_gstandaard(bst_dir=gstandaard.BST_DIR, snapshot_path=gstandaard.SNAPSHOT_PATH,
+                    fuzzy_drempel=FUZZY_DREMPEL):
+    """
+    Leest uit de gecompileerde G-Standaard snapshot: de genormaliseerde BST020T naamindex
+    en BST004T/052T/070T/711T. De snapshot wordt alleen opnieuw opgebouwd als een
+    BST-bestand is gewijzigd. fuzzy_drempel=None zet de fuzzy naam-tier uit.
+    """
+    conn = gstandaard.open_snapshot(bst_dir, snapshot_path)
+    try:
+        naam_index = NaamIndex(gstandaard.load_naam_index(conn), fuzzy_drempel)
+        bst004, bst052, bst070, bst711 = (
+            gstandaard.load_table(conn, tabel)
+            for tabel in ("BST004T", "BST052T", "BST070T", "BST711T")
+        )
+    finally:
+        conn.close()
+    return naam_index, bst004, bst052, bst070, bst711
+
 def extract_patient_blocks(filepath):
     with open(filepath, "r", encoding="utf-8") as f:
         content = f.read()
+    return extract_patient_blocks_uit_tekst(content)
+
+def extract_patient_blocks_uit_tekst(content):
     start = re.search(r"(Dhr\. |Mevr\. )", content)
     if not start:
         return []
@@ -21,6 +45,36 @@ def extract_patient_blocks(filepath):
     raw_blocks = re.split(r'(?=Dhr\. |Mevr\. )', content)
     return [block.strip() for block in raw_blocks if block.strip().startswith(("Dhr.", "Mevr."))]
 
+def extract_afdeling(content):
+    # Afdelingsnaam extraheren
+    afdeling_match = re.search(r"Een overzicht van alle actieve medicatie in afdeling (.+?)\.", content)
+    return afdeling_match.group(1).strip() if afdeling_match else "Onbekend"
+
+def parse_geboortedatum(naamregel):
+    """
+    'Mevr. M Curie (07-11-1942)' → date(1942, 11, 7); None als er geen (geldige) datum staat.
+    """
+    match = re.search(r"\((\d{1,2})-(\d{1,2})-(\d{4})\)", naamregel)
+    if not match:
+        return None
+    dag, maand, jaar = (int(deel) for deel in match.groups())
+    try:
+        return date(jaar, maand, dag)
+    except ValueError:
+        return None
+
+def bereken_leeftijd(geboortedatum, peildatum=None):
+    """
+    Leeftijd in hele jaren op peildatum (standaard vandaag); None als de geboortedatum onbekend is.
+    """
+    if geboortedatum is None:
+        return None
+    peildatum = peildatum or date.today()
+    leeftijd = peildatum.year - geboortedatum.year
+    if (peildatum.month, peildatum.day) < (geboortedatum.month, geboortedatum.day):
+        leeftijd -= 1
+    return leeftijd
+
 def clean_name(name):
     name = unicodedata.normalize('NFKD', name).encode('ASCII', 'ignore').decode('ASCII')
     name = re.sub(r"\(.*?\)", "", name)
@@ -57,127 +111,86 @@ def parse_medimo_block(block):
         i += 1
     return geneesmiddelen
 
-def lichte_fuzzy_match(gm_clean, bst020):
-    gm_norm = clean_name(gm_clean).lower()
+# Laatst gebouwde naamindex, hergebruikt zolang dezelfde BST020T-lijst wordt meegegeven
+_naam_index_cache = {"bst020": None, "index": None}
 
-    # Stap 1: Exacte match op de volledige naam
-    for row in bst020:
-        naam = clean_name(row["NMNAAM"]).lower()
-        if gm_norm == naam:
-            return row["NMNR"]
+def get_naam_index(bst020):
+    if _naam_index_cache["bst020"] is not bst020:
+        _naam_index_cache["index"] = NaamIndex.from_rows(bst020)
+        _naam_index_cache["bst020"] = bst020
+    return _naam_index_cache["index"]
 
-    # Stap 2: Probeer met eerste woord
-    eerste_woord = gm_norm.split()[0]
-    for row in bst020:
-        naam = clean_name(row["NMNAAM"]).lower()
-        if naam == eerste_woord:
-            return row["NMNR"]
+def lichte_fuzzy_match(gm_clean, bst020, naam_index=None):
+    # Exacte match op de volledige naam, daarna op het eerste woord
+    if naam_index is None:
+        naam_index = get_naam_index(bst020)
+    nmnr, _, _ = naam_index.zoek(gm_clean)
+    return nmnr  # None als er geen match is gevonden
 
-    return None  # Geen match gevonden
 
+# Laatst gebouwde resolver, hergebruikt zolang dezelfde BST-lijsten worden meegegeven
+_resolver_cache = {"bronnen": None, "resolver": None}
 
-def match_to_spkode(gm_clean, bst020, bst052, bst004, bst070, bst711, db_spkodes):
-    nmnr = lichte_fuzzy_match(gm_clean, bst020)
+def get_resolver(bst052, bst004, bst070, bst711, db_spkodes):
+    """
+    Geeft een SPKodeResolver voor deze BST-lijsten terug; bouwt de indexen alleen
+    opnieuw als er andere lijsten (of een andere set db_spkodes) worden meegegeven.
+    """
+    bronnen = (bst052, bst004, bst070, bst711, db_spkodes)
+    vorige = _resolver_cache["bronnen"]
+    if vorige is None or any(a is not b for a, b in zip(bronnen, vorige)):
+        _resolver_cache["resolver"] = SPKodeResolver(bst052, bst004, bst070, bst711, db_spkodes)
+        _resolver_cache["bronnen"] = bronnen
+    return _resolver_cache["resolver"]
+
+def match_to_spkode(gm_clean, bst020, bst052, bst004, bst070, bst711, db_spkodes, resolver=None):
+    nmnr = lichte_fuzzy_match(gm_clean, bst020, resolver.naam_index if resolver else None)
     if not nmnr:
         return None, None, None
 
-    mogelijke_spkodes = []
-
-    # 1. Direct via BST711T
-    for row in bst711:
-        if row["GPSTNR"] == nmnr or row["GPNMNR"] == nmnr:
-            mogelijke_spkodes.append((None, row["SPKODE"]))
-
-    # 2. Via PRKODE → GPKODE → SPKODE
-    for row in bst052:
-        if row["PRNMNR"] == nmnr:
-            gpkode = row["GPKODE"]
-            for rij in bst711:
-                if rij["GPKODE"] == gpkode or rij["GSKODE"] == gpkode:
-                    mogelijke_spkodes.append((None, rij["SPKODE"]))
-
-    # 3. Via HPKODE → GPKODE → SPKODE
-    hpkodes = [r["HPKODE"] for r in bst004 if r["ATNMNR"] == nmnr]
-    for hpkode in hpkodes:
-        for row in bst070:
-            if row["HPKODE"] == hpkode:
-                gpkode = row["GPKODE"]
-                for rij in bst711:
-                    if rij["GPKODE"] == gpkode or rij["GSKODE"] == gpkode:
-                        mogelijke_spkodes.append((hpkode, rij["SPKODE"]))
-
-    # Kies eerste SPKode die ook in de database zit
-    for hpk, spk in mogelijke_spkodes:
-        if spk in db_spkodes:
-            return nmnr, hpk, spk
-
-    # Anders neem gewoon eerste beschikbare
-    if mogelijke_spkodes:
-        return nmnr, mogelijke_spkodes[0][0], mogelijke_spkodes[0][1]
-
-    return nmnr, None, None
-
-def get_spkodes_in_db(db_path="geneesmiddelen.db"):
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    c.execute("SELECT DISTINCT SPKode FROM geneesmiddelen")
-    result = [row[0] for row in c.fetchall()]
-    conn.close()
-    return set(result)
-
-def match_to_fk_database(spkode, db_path="geneesmiddelen.db", atc_db_path="ATC_groepen.db"):
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    c.execute("SELECT geneesmiddel, groep, ATC_groep FROM geneesmiddelen WHERE SPKode = ?", (spkode,))
-    result = c.fetchone()
-    conn.close()
-
-    if not result:
-        return None, None, None, None, None  # geneesmiddel, groep, ATC_groep, ATC_omschrijving, Jansen_omschrijving
+    if resolver is None:
+        resolver = get_resolver(bst052, bst004, bst070, bst711, db_spkodes)
 
-    geneesmiddel, groep, atc_groep = result
+    # Volgorde: direct BST711T, dan PRK-pad, dan HPK-pad; voorkeur voor SPKodes in de database
+    return resolver.resolve_nmnr(nmnr)
 
-    if not atc_groep:
-        return geneesmiddel, groep, None, None, None
-
-    atc_conn = sqlite3.connect(atc_db_path)
-    atc_c = atc_conn.cursor()
-    atc_c.execute("SELECT ATC_groep, ATC_omschrijving, Jansen_omschrijving FROM ATC_groepen WHERE ATC_groep = ?", (atc_groep,))
-    atc_result = atc_c.fetchone()
-    atc_conn.close()
+def get_spkodes_in_db(db_path="geneesmiddelen.db"):
+    return referentie_db.zoek_alle_spkodes(db_path)
 
-    if not atc_result:
-        return geneesmiddel, groep, atc_groep, None, None
+def match_to_fk_database_batch(spkodes, db_path="geneesmiddelen.db", atc_db_path="ATC_groepen.db"):
+    """
+    Zoekt voor alle SPKodes in één keer de FK- en ATC-gegevens op.
+    Returns: dict SPKode → (geneesmiddel, groep, ATC_groep, ATC_omschrijving, Jansen_omschrijving)
+    Onbekende SPKodes krijgen (None, None, None, None, None).
+    """
+    fk = referentie_db.zoek_fk_gegevens(spkodes, db_path)
+    atc = referentie_db.zoek_atc_gegevens((atc_groep for _, _, atc_groep in fk.values() if atc_groep), atc_db_path)
+
+    resultaat = {}
+    for spkode in spkodes:
+        if spkode not in fk:
+            resultaat[spkode] = (None, None, None, None, None)
+            continue
+        geneesmiddel, groep, atc_groep = fk[spkode]
+        if not atc_groep:
+            resultaat[spkode] = (geneesmiddel, groep, None, None, None)
+        elif atc_groep not in atc:
+            resultaat[spkode] = (geneesmiddel, groep, atc_groep, None, None)
+        else:
+            resultaat[spkode] = (geneesmiddel, groep, atc_groep) + atc[atc_groep]
+    return resultaat
 
-    atc_groep, atc_omschrijving, jansen_omschrijving = atc_result
-    return geneesmiddel, groep, atc_groep, atc_omschrijving, jansen_omschrijving
+def match_to_fk_database(spkode, db_path="geneesmiddelen.db", atc_db_path="ATC_groepen.db"):
+    # geneesmiddel, groep, ATC_groep, ATC_omschrijving, Jansen_omschrijving
+    return match_to_fk_database_batch([spkode], db_path, atc_db_path)[spkode]
 
 def main():
-    dir_path = "G-Standaard"
-    bst020_path = os.path.join(dir_path, "BST020T")
-    bst004_path = os.path.join(dir_path, "BST004T")
-    bst052_path = os.path.join(dir_path, "BST052T")
-    bst070_path = os.path.join(dir_path, "BST070T")
-    bst711_path = os.path.join(dir_path, "BST711T")
     medimo_path = "Data/medimo_input.txt"
 
-    bst020_cols = [("NMNR", 5, 12), ("NMNAAM", 85, 135)]
-    bst004_cols = [("HPKODE", 13, 21), ("ATNMNR", 21, 28)]
-    bst052_cols = [("PRKODE", 5, 13), ("PRNMNR", 13, 20), ("GPKODE", 20, 28)]
-    bst070_cols = [("HPKODE", 5, 13), ("GPKODE", 29, 37)]
-    bst711_cols = [
-        ("GPKODE", 5, 13), ("GSKODE", 13, 21),
-        ("GPNMNR", 33, 40), ("GPSTNR", 40, 47),
-        ("SPKODE", 104, 112)
-    ]
-
-    bst020 = load_fixed_width_file(bst020_path, bst020_cols)
-    bst004 = load_fixed_width_file(bst004_path, bst004_cols)
-    bst052 = load_fixed_width_file(bst052_path, bst052_cols)
-    bst070 = load_fixed_width_file(bst070_path, bst070_cols)
-    bst711 = load_fixed_width_file(bst711_path, bst711_cols)
+    naam_index, bst004, bst052, bst070, bst711 = load_gstandaard()
 
     db_spkodes = get_spkodes_in_db()
+    resolver = SPKodeResolver(bst052, bst004, bst070, bst711, db_spkodes, naam_index)
 
     patiënten = extract_patient_blocks(medimo_path)
 
@@ -186,10 +199,11 @@ def main():
         print(f"\nPatiënt: {regel1}")
         
         gm_list = parse_medimo_block(patiënt)
-        for gm in gm_list:
-            nmnr, hpkode, spkode = match_to_spkode(gm["clean"], bst020, bst052, bst004, bst070, bst711, db_spkodes)
+        resoluties = [resolver.resolve(gm["clean"]) for gm in gm_list]
+        fk_gegevens = match_to_fk_database_batch([spkode for _, _, spkode in resoluties if spkode])
+        for gm, (nmnr, hpkode, spkode) in zip(gm_list, resoluties):
             fk_naam, fk_groep, atc_groep, atc_omschrijving, jansen_omschrijving = (
-                match_to_fk_database(spkode) if spkode else (None, None, None, None, None)
+                fk_gegevens[spkode] if spkode else (None, None, None, None, None)
             )
             
             status = "✅" if fk_groep else "❌"
@@ -206,49 +220,32 @@ def run_parser():
     """
     Draait het volledige parse proces en retourneert een lijst van patiënt dicts + afdelingsnaam + db_spkodes.
     """
-    dir_path = "G-Standaard"
-    bst020_path = os.path.join(dir_path, "BST020T")
-    bst004_path = os.path.join(dir_path, "BST004T")
-    bst052_path = os.path.join(dir_path, "BST052T")
-    bst070_path = os.path.join(dir_path, "BST070T")
-    bst711_path = os.path.join(dir_path, "BST711T")
     medimo_path = "Data/medimo_input.txt"
 
-    bst020_cols = [("NMNR", 5, 12), ("NMNAAM", 85, 135)]
-    bst004_cols = [("HPKODE", 13, 21), ("ATNMNR", 21, 28)]
-    bst052_cols = [("PRKODE", 5, 13), ("PRNMNR", 13, 20), ("GPKODE", 20, 28)]
-    bst070_cols = [("HPKODE", 5, 13), ("GPKODE", 29, 37)]
-    bst711_cols = [
-        ("GPKODE", 5, 13), ("GSKODE", 13, 21),
-        ("GPNMNR", 33, 40), ("GPSTNR", 40, 47),
-        ("SPKODE", 104, 112)
-    ]
-
-    bst020 = load_fixed_width_file(bst020_path, bst020_cols)
-    bst004 = load_fixed_width_file(bst004_path, bst004_cols)
-    bst052 = load_fixed_width_file(bst052_path, bst052_cols)
-    bst070 = load_fixed_width_file(bst070_path, bst070_cols)
-    bst711 = load_fixed_width_file(bst711_path, bst711_cols)
-    db_spkodes = get_spkodes_in_db()
-
-    with open(medimo_path, "r", encoding="utf-8") as f:
-        content = f.read()
+    from Parsers.medimo_stream import lees_medimo  # medimo_stream importeert deze module
+    from Parsers.samenvoegen import voeg_regels_samen
+    from Parsers.resolutie_cache import ResolutieCache, resolutie_versie, resolveer_namen
 
-    # Afdelingsnaam extraheren
-    afdeling_match = re.search(r"Een overzicht van alle actieve medicatie in afdeling (.+?)\.", content)
-    afdeling = afdeling_match.group(1).strip() if afdeling_match else "Onbekend"
+    naam_index, bst004, bst052, bst070, bst711 = load_gstandaard()
+    db_spkodes = get_spkodes_in_db()
+    resolver = SPKodeResolver(bst052, bst004, bst070, bst711, db_spkodes, naam_index)
+    cache = ResolutieCache(resolutie_versie(
+        gstandaard.get_snapshot_id(gstandaard.SNAPSHOT_PATH), "geneesmiddelen.db", "ATC_groepen.db"
+    ))
 
-    patiënten = extract_patient_blocks(medimo_path)
     resultaat = []
-
-    for patiënt in patiënten:
-        gm_list = parse_medimo_block(patiënt)
-        for gm in gm_list:
-            nmnr, hpkode, spkode = match_to_spkode(gm["clean"], bst020, bst052, bst004, bst070, bst711, db_spkodes)
-            gm["SPKode"] = spkode
-        resultaat.append({"patiënt": patiënt.split("\n")[0].strip(), "geneesmiddelen": gm_list})
-
-    return resultaat, db_spkodes, afdeling
+    # Eén doorgang door het bestand: patiënten en afdelingsnaam tegelijk
+    with open(medimo_path, "r", encoding="utf-8") as f:
+        stream = lees_medimo(f)
+        for patiënt in stream:
+            gm_list = [regel.als_dict() for regel in patiënt.regels]
+            resoluties = resolveer_namen((gm["clean"] for gm in gm_list), resolver, cache)
+            for gm in gm_list:
+                gm["SPKode"] = resoluties[gm["clean"]].spkode
+            resultaat.append({"patiënt": patiënt.naam, "geneesmiddelen": voeg_regels_samen(gm_list)})
+    cache.schrijf()
+
+    return resultaat, db_spkodes, stream.afdeling
 
 if __name__ == "__main__":
     main()
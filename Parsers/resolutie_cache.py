@@ -0,0 +1,220 @@
+"""
+Cache van opgeloste Medimo-productnamen.
+
+In een verpleeghuis komen dezelfde 30–50 producten (paracetamol, macrogol, colecalciferol,
+vaccins) bij bijna elke patiënt voor. Per productnaam (zoals in Medimo, na het opschonen
+van de regel) wordt de volledige resolutie één keer bepaald:
+    NMNR, HPKODE, SPKode, PRK-codes, FK-naam, FK-groep, ATC-groep, ATC-omschrijving, Jansen-omschrijving
+    (plus hoe de naam gevonden is en het aantal kandidaten, voor het runrapport)
+en daarna uit het geheugen gehaald, ook door volgende runs: de cache wordt bewaard in een
+SQLite-bestand naast de snapshot. Dat bestand hoort bij één versie van de referentiedata
+(snapshot-id van de G-Standaard plus grootte/mtime van geneesmiddelen.db en ATC_groepen.db);
+bij een andere versie wordt het geleegd.
+
+Nieuwe resoluties worden in het geheugen verzameld en met schrijf() in één transactie
+weggeschreven.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import NamedTuple
+from Parsers import parse_medimo
+
+RESOLUTIE_PATH = "gstandaard_resolutie.db"
+# Ophogen bij een andere opbouw van Resolutie; het bestand wordt dan opnieuw aangemaakt
+_SCHEMA = 2
+
+_KOLOMMEN = ("naam", "nmnr", "hpkode", "spkode", "prkodes", "fk_naam", "groep", "atc_groep", "atc_omschrijving",
+             "jansen_omschrijving", "methode", "score", "kandidaten")
+
+
+class Resolutie(NamedTuple):
+    nmnr: str | None
+    hpkode: str | None
+    spkode: str | None
+    prkodes: tuple
+    fk_naam: str | None
+    groep: str | None
+    atc_groep: str | None
+    atc_omschrijving: str | None
+    jansen_omschrijving: str | None
+    methode: str | None = None  # NaamIndex: 'exact', 'eerste_woord', 'fuzzy' of None
+    score: float | None = None
+    kandidaten: tuple = (0, 0, 0)  # SPKode-kandidaten via BST711T, BST052T, BST070T
+
+
+def _bestandsversie(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def resolutie_versie(snapshot_id, db_path, atc_db_path):
+    """
+    Versie van alle gegevens waar een resolutie van afhangt, als tekst voor in het cachebestand.
+    """
+    return json.dumps([_SCHEMA, snapshot_id, _bestandsversie(db_path), _bestandsversie(atc_db_path)])
+
+
+class ResolutieCache:
+    """
+    productnaam → Resolutie, in het geheugen en (als pad is opgegeven) in SQLite.
+    hits/misses tellen de lookups sinds het aanmaken.
+    """
+
+    def __init__(self, versie, pad=RESOLUTIE_PATH):
+        self.pad = pad
+        self.versie = versie
+        self._items = {}
+        self._nieuw = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if pad:
+            self._laad()
+
+    def __len__(self):
+        return len(self._items)
+
+    def _verbind(self):
+        conn = sqlite3.connect(self.pad, timeout=30)
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (sleutel TEXT PRIMARY KEY, waarde TEXT)")
+        # Kolommen zonder type: codes komen terug zoals ze zijn opgeslagen (tekst of getal)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS resolutie ({_KOLOMMEN[0]} TEXT PRIMARY KEY, {', '.join(_KOLOMMEN[1:])})")
+        return conn
+
+    def _laad(self):
+        try:
+            conn = self._verbind()
+        except sqlite3.Error as e:
+            print(f"Waarschuwing: resolutiecache {self.pad} niet te openen ({e}); alleen in het geheugen.")
+            self.pad = None
+            return
+        try:
+            with conn:
+                rij = conn.execute("SELECT waarde FROM meta WHERE sleutel = 'versie'").fetchone()
+                if rij is None or rij[0] != self.versie:
+                    # Andere snapshot, database of opbouw: oude resoluties gelden niet meer
+                    conn.execute("DROP TABLE resolutie")
+                    conn.execute(f"CREATE TABLE resolutie ({_KOLOMMEN[0]} TEXT PRIMARY KEY, {', '.join(_KOLOMMEN[1:])})")
+                    conn.execute("INSERT OR REPLACE INTO meta VALUES ('versie', ?)", (self.versie,))
+                    return
+            for naam, *velden in conn.execute(f"SELECT {', '.join(_KOLOMMEN)} FROM resolutie"):
+                velden[3] = tuple(json.loads(velden[3]))
+                velden[-1] = tuple(json.loads(velden[-1]))
+                self._items[naam] = Resolutie(*velden)
+        finally:
+            conn.close()
+
+    def zoek(self, naam):
+        """
+        Resolutie of None (dan bepalen en met bewaar toevoegen).
+        """
+        with self._lock:
+            resolutie = self._items.get(naam)
+            if resolutie is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return resolutie
+
+    def bewaar(self, naam, resolutie):
+        with self._lock:
+            self._items[naam] = resolutie
+            self._nieuw[naam] = resolutie
+
+    def schrijf(self):
+        """
+        Nieuwe resoluties sinds de vorige schrijf() naar het SQLite-bestand.
+        """
+        with self._lock:
+            nieuw, self._nieuw = self._nieuw, {}
+        if not nieuw or not self.pad:
+            return
+        rijen = [(naam, *r[:3], json.dumps(list(r.prkodes)), *r[4:-1], json.dumps(list(r.kandidaten)))
+                 for naam, r in nieuw.items()]
+        try:
+            conn = self._verbind()
+            try:
+                with conn:
+                    rij = conn.execute("SELECT waarde FROM meta WHERE sleutel = 'versie'").fetchone()
+                    if rij is not None and rij[0] != self.versie:
+                        return  # intussen door een nieuwere versie overgenomen
+                    conn.execute("INSERT OR REPLACE INTO meta VALUES ('versie', ?)", (self.versie,))
+                    conn.executemany(
+                        f"INSERT OR REPLACE INTO resolutie ({', '.join(_KOLOMMEN)}) VALUES ({', '.join('?' * len(_KOLOMMEN))})",
+                        rijen
+                    )
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Waarschuwing: resolutiecache niet bijgewerkt ({e}).")
+
+    def ververs(self, versie):
+        """
+        Leegt de cache als de referentiedata intussen een andere versie heeft.
+        """
+        if versie == self.versie:
+            return
+        with self._lock:
+            self.versie = versie
+            self._items.clear()
+            self._nieuw.clear()
+        if self.pad:
+            self._laad()
+
+    def statistiek(self):
+        return {"items": len(self._items), "hits": self.hits, "misses": self.misses}
+
+
+def resolveer_namen(namen, resolver, cache, db_path="geneesmiddelen.db", atc_db_path="ATC_groepen.db", tijden=None):
+    """
+    productnaam → Resolutie voor alle (verschillende) namen. Namen die niet in de cache
+    staan worden opgelost met de SPKodeResolver en in één batch in de FK/ATC-databases
+    opgezocht; het resultaat gaat de cache in.
+    tijden: optioneel dict dat per naam de bron ('cache'/'resolutie') en de tijd per stap
+    (ms) krijgt; de FK/ATC-batch wordt gelijk over de opgeloste namen verdeeld.
+    """
+    resoluties = {}
+    ontbrekend = {}
+    for naam in dict.fromkeys(namen):
+        t0 = time.perf_counter()
+        resolutie = cache.zoek(naam)
+        t1 = time.perf_counter()
+        if resolutie is not None:
+            resoluties[naam] = resolutie
+            if tijden is not None:
+                tijden[naam] = {"bron": "cache", "cache_ms": (t1 - t0) * 1000}
+            continue
+
+        nmnr, methode, score = resolver.naam_index.zoek(naam)
+        t2 = time.perf_counter()
+        _, hpkode, spkode = resolver.resolve_nmnr(nmnr) if nmnr else (None, None, None)
+        prkodes = resolver.prkodes(nmnr, spkode)
+        t3 = time.perf_counter()
+        ontbrekend[naam] = (nmnr, hpkode, spkode, prkodes, methode, score, resolver.kandidaat_aantallen(nmnr))
+        if tijden is not None:
+            tijden[naam] = {"bron": "resolutie", "cache_ms": (t1 - t0) * 1000,
+                            "naam_index_ms": (t2 - t1) * 1000, "spkode_ms": (t3 - t2) * 1000}
+
+    t0 = time.perf_counter()
+    fk_gegevens = parse_medimo.match_to_fk_database_batch(
+        [waarden[2] for waarden in ontbrekend.values() if waarden[2]], db_path, atc_db_path
+    )
+    fk_ms = (time.perf_counter() - t0) * 1000 / max(len(ontbrekend), 1)
+    for naam, (nmnr, hpkode, spkode, prkodes, methode, score, kandidaten) in ontbrekend.items():
+        resolutie = Resolutie(
+            nmnr, hpkode, spkode, prkodes,
+            *(fk_gegevens[spkode] if spkode else (None, None, None, None, None)),
+            methode, score, kandidaten
+        )
+        cache.bewaar(naam, resolutie)
+        resoluties[naam] = resolutie
+        if tijden is not None:
+            tijden[naam]["fk_ms"] = fk_ms
+    return resoluties
@@ -0,0 +1,57 @@
+"""
+Samenvoegen van medicatieregels per product.
+
+Medimo zet hetzelfde product vaak meerdere keren onder een patiënt: Clozapine 1-0-0 en
+0-4-0, of Macrogol als C (continu) en als Z (zo nodig). Na de resolutie worden regels met
+dezelfde SPKode (of, zonder SPKode, dezelfde naam) samengevoegd tot één regel met:
+    - gebruik en opmerkingen van alle regels onder elkaar (dubbele weggelaten); hebben de
+      regels verschillende productnamen (andere sterkte onder dezelfde SPKode), dan staat
+      elke gebruiksregel achter zijn eigen productnaam
+    - status 'C', 'Z' of 'C/Z'
+    - de gecombineerde dosering (combineer_doseringen): de continue regels opgeteld, het
+      zo-nodigdeel apart in zo_nodig_schema; None bij twee precies gelijke regels
+    - PRKodes van alle regels
+    - 'regels': de oorspronkelijke regels
+De regelcontroles en het rapport werken daarna met één regel per product, zodat een
+product niet als dubbelmedicatie met zichzelf wordt gemeld.
+"""
+
+from Parsers.dosering import combineer_doseringen
+
+
+def _product_sleutel(gm):
+    if gm.get("SPKode"):
+        return ("SPK", gm["SPKode"])
+    return ("naam", " ".join(gm["clean"].lower().split()))
+
+
+def _uniek(waarden):
+    return list(dict.fromkeys(w for w in waarden if w))
+
+
+def voeg_regels_samen(gm_list):
+    """
+    gm_list: geresolveerde regels (dicts uit als_dict/parse_medimo_block, met 'SPKode').
+    Returns: één dict per product, in de volgorde waarin het product voor het eerst voorkomt.
+    """
+    per_product = {}
+    for gm in gm_list:
+        per_product.setdefault(_product_sleutel(gm), []).append(gm)
+
+    samengevoegd = []
+    for regels in per_product.values():
+        gm = dict(regels[0])
+        if len(regels) > 1:
+            gm["origineel"] = "\n".join(_uniek(r["origineel"] for r in regels))
+            if len(_uniek(r["clean"] for r in regels)) > 1:
+                gm["gebruik"] = "\n".join(_uniek(f"{r['clean']}: {r['gebruik']}" for r in regels))
+            else:
+                gm["gebruik"] = "\n".join(_uniek(r["gebruik"] for r in regels))
+            gm["opmerking"] = "\n".join(_uniek(r["opmerking"] for r in regels))
+            gm["status"] = "/".join(sorted(_uniek(r.get("status") for r in regels)))
+            gm["dosering"] = combineer_doseringen([r.get("dosering") for r in regels])
+            if "PRKodes" in gm:
+                gm["PRKodes"] = tuple(_uniek(prk for r in regels for prk in r["PRKodes"]))
+        gm["regels"] = regels
+        samengevoegd.append(gm)
+    return samengevoegd
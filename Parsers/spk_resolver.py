@@ -0,0 +1,131 @@
+from collections import defaultdict
+
+
+class SPKodeResolver:
+    """
+    Bouwt eenmalig hash-indexen over BST052T/004T/070T/711T, zodat het koppelen van een
+    NMNR aan een SPKode een paar dict-lookups kost in plaats van geneste scans.
+
+    Volgorde van kandidaten is gelijk aan de oorspronkelijke match_to_spkode:
+        1. Direct via BST711T (GPSTNR/GPNMNR == NMNR)
+        2. Via PRKODE → GPKODE → SPKODE (BST052T)
+        3. Via HPKODE → GPKODE → SPKODE (BST004T + BST070T)
+    De eerste kandidaat die ook in geneesmiddelen.db staat wint, anders de eerste kandidaat.
+
+    Met een NaamIndex kan ook direct op Medimo-naam worden opgelost via resolve().
+    prkodes() geeft de PRK-codes van een opgeloste regel (voor o.a. dubbelmedicatie),
+    kandidaat_aantallen() het aantal kandidaten per pad (voor het runrapport).
+    """
+
+    def __init__(self, bst052, bst004, bst070, bst711, db_spkodes, naam_index=None):
+        self.db_spkodes = db_spkodes
+        self.naam_index = naam_index
+
+        # BST711T: rijnummers in bestandsvolgorde, een rij komt maximaal één keer per sleutel voor
+        self.spkodes = [row["SPKODE"] for row in bst711]
+        self.nmnr_to_rows = defaultdict(list)
+        self.gpk_to_rows = defaultdict(list)
+        for i, row in enumerate(bst711):
+            for nmnr in {row["GPSTNR"], row["GPNMNR"]}:
+                self.nmnr_to_rows[nmnr].append(i)
+            for gpk in {row["GPKODE"], row["GSKODE"]}:
+                self.gpk_to_rows[gpk].append(i)
+
+        self.spk_to_gpk = defaultdict(list)
+        for row in bst711:
+            self.spk_to_gpk[row["SPKODE"]].append(row["GPKODE"])
+
+        self.prnmnr_to_gpk = defaultdict(list)
+        self.prnmnr_to_prk = defaultdict(list)
+        self.gpk_to_prk = defaultdict(list)
+        for row in bst052:
+            self.prnmnr_to_gpk[row["PRNMNR"]].append(row["GPKODE"])
+            if row.get("PRKODE"):
+                self.prnmnr_to_prk[row["PRNMNR"]].append(row["PRKODE"])
+                self.gpk_to_prk[row["GPKODE"]].append(row["PRKODE"])
+
+        self.atnmnr_to_hpk = defaultdict(list)
+        for row in bst004:
+            self.atnmnr_to_hpk[row["ATNMNR"]].append(row["HPKODE"])
+
+        self.hpk_to_gpk = defaultdict(list)
+        for row in bst070:
+            self.hpk_to_gpk[row["HPKODE"]].append(row["GPKODE"])
+
+        # Alleen lezen vanaf hier: voorkom dat lookups lege lijsten toevoegen
+        for index in (self.nmnr_to_rows, self.gpk_to_rows, self.spk_to_gpk, self.prnmnr_to_gpk, self.prnmnr_to_prk,
+                      self.gpk_to_prk, self.atnmnr_to_hpk, self.hpk_to_gpk):
+            index.default_factory = None
+
+    def kandidaten(self, nmnr):
+        """
+        Levert (HPKODE, SPKODE) kandidaten in de vaste voorkeursvolgorde.
+        """
+        spkodes = self.spkodes
+
+        # 1. Direct via BST711T
+        for i in self.nmnr_to_rows.get(nmnr, ()):
+            yield None, spkodes[i]
+
+        # 2. Via PRKODE → GPKODE → SPKODE
+        for gpkode in self.prnmnr_to_gpk.get(nmnr, ()):
+            for i in self.gpk_to_rows.get(gpkode, ()):
+                yield None, spkodes[i]
+
+        # 3. Via HPKODE → GPKODE → SPKODE
+        for hpkode in self.atnmnr_to_hpk.get(nmnr, ()):
+            for gpkode in self.hpk_to_gpk.get(hpkode, ()):
+                for i in self.gpk_to_rows.get(gpkode, ()):
+                    yield hpkode, spkodes[i]
+
+    def kandidaat_aantallen(self, nmnr):
+        """
+        Aantal SPKode-kandidaten per pad van kandidaten(): (BST711T, BST052T, BST070T).
+        """
+        if not nmnr:
+            return 0, 0, 0
+        n711 = len(self.nmnr_to_rows.get(nmnr, ()))
+        n052 = sum(len(self.gpk_to_rows.get(gpkode, ())) for gpkode in self.prnmnr_to_gpk.get(nmnr, ()))
+        n070 = sum(
+            len(self.gpk_to_rows.get(gpkode, ()))
+            for hpkode in self.atnmnr_to_hpk.get(nmnr, ())
+            for gpkode in self.hpk_to_gpk.get(hpkode, ())
+        )
+        return n711, n052, n070
+
+    def resolve_nmnr(self, nmnr):
+        """
+        Geeft (nmnr, hpkode, spkode) terug, met dezelfde voorkeur als match_to_spkode.
+        """
+        eerste = None
+        for hpk, spk in self.kandidaten(nmnr):
+            # Kies eerste SPKode die ook in de database zit
+            if spk in self.db_spkodes:
+                return nmnr, hpk, spk
+            if eerste is None:
+                eerste = (hpk, spk)
+
+        # Anders neem gewoon eerste beschikbare
+        if eerste is not None:
+            return nmnr, eerste[0], eerste[1]
+
+        return nmnr, None, None
+
+    def prkodes(self, nmnr, spkode):
+        """
+        PRK-codes bij een opgeloste regel: direct via de PRK-naam (BST052T), anders alle
+        PRK's van de GPK's onder de gekozen SPKode. Lege tuple als niets bekend is.
+        """
+        prks = self.prnmnr_to_prk.get(nmnr, ()) if nmnr else ()
+        if not prks and spkode:
+            prks = [prk for gpk in self.spk_to_gpk.get(spkode, ()) for prk in self.gpk_to_prk.get(gpk, ())]
+        return tuple(dict.fromkeys(prks))
+
+    def resolve(self, gm_clean):
+        """
+        Medimo-naam → (nmnr, hpkode, spkode) via de NaamIndex en de SPKode-indexen.
+        """
+        nmnr, _, _ = self.naam_index.zoek(gm_clean)
+        if not nmnr:
+            return None, None, None
+        return self.resolve_nmnr(nmnr)
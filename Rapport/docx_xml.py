@@ -0,0 +1,461 @@
+"""
+Snelle opbouw van het Word-document.
+
+Het geraamte (marges, logo in de koptekst, hoofdtitel) wordt met python-docx gemaakt, zodat
+stijlen en koptekst gelijk blijven. De patiëntsecties worden als WordprocessingML-tekst
+opgebouwd uit vaste fragmenten; daarmee vervalt het per-cel werk van python-docx
+(table.add_row().cells), dat kwadratisch is in het aantal rijen.
+
+Het document wordt gestreamd: word/document.xml gaat patiënt voor patiënt de zip in, naar een
+bestand of direct naar een HTTP-antwoord (docx_stream). Het geheugengebruik hangt daardoor
+niet af van de grootte van de afdeling.
+
+De XML is gelijk aan wat python-docx zelf schrijft: navy headings (kleur 000080), ingeklapte
+headings met <w15:collapsed/> (zie _COLLAPSED en _heading) en tabellen in 'Table Grid'.
+"""
+
+import io
+import os
+import re
+import zipfile
+import multiprocessing
+from collections import defaultdict
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from xml.sax.saxutils import escape
+from docx import Document
+from docx.shared import RGBColor, Cm, Emu
+from lxml import etree
+from Rapport.sectie_cache import DATUM_TEKEN
+
+# De fragmenten komen los in word/document.xml; w: is daar gedeclareerd, w15: niet
+_COLLAPSED = '<w15:collapsed xmlns:w15="http://schemas.microsoft.com/office/word/2012/wordml"/>'
+# Tekens die niet in XML 1.0 mogen (python-docx weigert ze ook)
+_ONGELDIG_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_NAVY = "000080"
+
+# ---------------------------
+# Fragmenten
+# ---------------------------
+
+def _t(tekst):
+    ruimte = ' xml:space="preserve"' if tekst != tekst.strip() else ""
+    return f"<w:t{ruimte}>{escape(_ONGELDIG_RE.sub('', tekst))}</w:t>"
+
+def _run(tekst, vet=False, kleur=None):
+    """
+    Eén w:r; '\\n' wordt een regeleinde en '\\t' een tab, zoals bij run.text in python-docx.
+    """
+    rpr = ""
+    if vet or kleur:
+        rpr = "<w:rPr>" + ("<w:b/>" if vet else "") + (f'<w:color w:val="{kleur}"/>' if kleur else "") + "</w:rPr>"
+    delen = []
+    for i, regel in enumerate(tekst.split("\n")):
+        if i:
+            delen.append("<w:br/>")
+        for j, stuk in enumerate(regel.split("\t")):
+            if j:
+                delen.append("<w:tab/>")
+            if stuk:
+                delen.append(_t(stuk))
+    return f"<w:r>{rpr}{''.join(delen)}</w:r>"
+
+def _paragraaf(*runs):
+    return f"<w:p>{''.join(runs)}</w:p>"
+
+def _heading(tekst, niveau, ingeklapt=False):
+    collapsed = _COLLAPSED if ingeklapt else ""
+    return (f'<w:p><w:pPr><w:pStyle w:val="Heading{niveau}"/>{collapsed}</w:pPr>'
+            f"{_run(tekst, kleur=_NAVY)}</w:p>")
+
+def _tabel(headers, rijen, breedte):
+    """
+    headers: kolomkoppen (vet); rijen: lijsten met celteksten; breedte: tekstbreedte in EMU.
+    """
+    kolom = Emu(breedte // len(headers)).twips
+    tcpr = f'<w:tcPr><w:tcW w:type="dxa" w:w="{kolom}"/></w:tcPr>'
+    delen = [
+        '<w:tbl><w:tblPr><w:tblStyle w:val="TableGrid"/><w:tblW w:type="auto" w:w="0"/>'
+        '<w:tblLook w:firstColumn="1" w:firstRow="1" w:lastColumn="0" w:lastRow="0" '
+        'w:noHBand="0" w:noVBand="1" w:val="04A0"/></w:tblPr><w:tblGrid>',
+        f'<w:gridCol w:w="{kolom}"/>' * len(headers),
+        "</w:tblGrid><w:tr>",
+    ]
+    for header in headers:
+        delen.append(f"<w:tc>{tcpr}{_paragraaf(_run(header, vet=True))}</w:tc>")
+    delen.append("</w:tr>")
+    for rij in rijen:
+        delen.append("<w:tr>")
+        for cel in rij:
+            delen.append(f"<w:tc>{tcpr}{_paragraaf(_run(cel))}</w:tc>")
+        delen.append("</w:tr>")
+    delen.append("</w:tbl>")
+    return "".join(delen)
+
+def _label(label, waarde):
+    return _paragraaf(_run(label, vet=True), _run(waarde))
+
+# ---------------------------
+# Patiëntsectie
+# ---------------------------
+
+def patiënt_xml(patiënt, vandaag, breedte):
+    """
+    WordprocessingML (zonder omhullend element) voor één patiënt.
+    """
+    delen = [_heading(patiënt["naam"], 2)]
+
+    # Arts, apotheker, datum, eGFR
+    egfr = patiënt.get("egfr")
+    egfr_tekst = f"{egfr:g} ml/min/1,73m²" if egfr is not None else ""
+    runs = []
+    for label, value in [("Arts:", ""), ("Apotheker:", ""), ("Datum:", vandaag), ("eGFR:", egfr_tekst)]:
+        runs.append(_run(f"{label} ", vet=True))
+        runs.append(_run(f"{value}\n"))
+    delen.append(_paragraaf(*runs))
+
+    # STOPP criteria
+    delen.append(_heading("Mogelijke STOPP-criteria:", 3, ingeklapt=True))
+    if patiënt["stopp"]:
+        delen.append(_tabel(
+            ["Criteriumcode", "Categorie", "Beschrijving", "Argument", "Getriggerd door"],
+            [[item['id'], item['category'], item['description'], item['argument'], item['triggering_medicines']]
+             for item in patiënt["stopp"]],
+            breedte
+        ))
+    else:
+        delen.append(_paragraaf(_run("Geen STOPP-criteria getriggerd.")))
+
+    # START criteria
+    delen.append(_heading("Mogelijke START-criteria:", 3, ingeklapt=True))
+    if patiënt.get("start"):
+        delen.append(_tabel(
+            ["Criteriumcode", "Categorie", "Beschrijving", "Argument", "Ontbrekend middel"],
+            [[item['id'], item['category'], item['description'], item['argument'], item['triggering_medicines']]
+             for item in patiënt["start"]],
+            breedte
+        ))
+    else:
+        delen.append(_paragraaf(_run("Geen START-criteria getriggerd.")))
+
+    # Dubbelmedicatie
+    delen.append(_heading("Mogelijke dubbelmedicatie:", 3, ingeklapt=True))
+    if patiënt["dubbelmedicatie"]:
+        rijen = []
+        for item in patiënt["dubbelmedicatie"]:
+            # Robuuste behandeling van middelen
+            middelen = item.get('middelen', [])
+            if isinstance(middelen, list):
+                geneesmiddelen_text = ", ".join(str(middel) for middel in middelen if middel)
+            elif isinstance(middelen, str):
+                geneesmiddelen_text = middelen
+            else:
+                geneesmiddelen_text = str(middelen) if middelen else "Geen middelen"
+            rijen.append([
+                str(item['groep']) if item['groep'] else "Onbekend",
+                geneesmiddelen_text if geneesmiddelen_text else "Geen middelen",
+            ])
+        delen.append(_tabel(["Groep", "Geneesmiddelen"], rijen, breedte))
+    else:
+        delen.append(_paragraaf(_run("Geen dubbelmedicatie gevonden.")))
+
+    # Interacties
+    delen.append(_heading("Mogelijke interacties:", 3, ingeklapt=True))
+    if patiënt.get("interacties") is None:
+        # Lege interactietabel: 'geen interacties' zou een controle suggereren die niet is gedaan
+        delen.append(_paragraaf(_run(
+            "Interactiecontrole niet beschikbaar (geen interactietabellen in de G-Standaard levering)."
+        )))
+    elif patiënt["interacties"]:
+        delen.append(_tabel(
+            ["Geneesmiddel", "Geneesmiddel", "Interactie"],
+            [[item['middel_a'], item['middel_b'], item['tekst']] for item in patiënt["interacties"]],
+            breedte
+        ))
+    else:
+        delen.append(_paragraaf(_run("Geen interacties gevonden.")))
+
+    # ACB-score
+    delen.append(_heading("Anticholinerge belastingscore (ACB-score):", 3, ingeklapt=True))
+    score, interpretatie, middelen_met_bijdrage = patiënt["acb"]
+    delen.append(_label("Totale score: ", f"{score} ({interpretatie})"))
+    if middelen_met_bijdrage:
+        delen.append(_paragraaf(_run("Bijdragende geneesmiddelen:", vet=True)))
+        delen.append(_tabel(
+            ["Geneesmiddel", "ACB-Score"],
+            [[middel_info['middel'], str(middel_info['score'])] for middel_info in middelen_met_bijdrage],
+            breedte
+        ))
+    else:
+        delen.append(_paragraaf(_run("Geen bijdragende middelen.")))
+
+    # Medicatieoverzicht per groep
+    delen.append(_heading("Medicatieoverzicht:", 3))
+    groepen_dict = defaultdict(list)
+    for gm in patiënt["geneesmiddelen"]:
+        jansen_omschrijving = gm["jansen_omschrijving"] if gm["jansen_omschrijving"] else "Overig"
+        groepen_dict[jansen_omschrijving].append(gm)
+
+    gesorteerde_keys = sorted(groepen_dict.keys(), key=lambda k: (k == "Overig", k.lower()))
+    for jansen_omschrijving in gesorteerde_keys:
+        delen.append(_heading(jansen_omschrijving, 4))
+        delen.append(_tabel(
+            ["Geneesmiddel", "Geneesmiddelgroep", "Gebruik", "Opmerking Medimo"],
+            [[gm["clean"], gm["groep"] if gm["groep"] else "-", gm["gebruik"], gm["opmerking"]]
+             for gm in groepen_dict[jansen_omschrijving]],
+            breedte
+        ))
+        delen.append(_paragraaf(_run("Eerder besproken:", vet=True)))
+        delen.append(_paragraaf(_run("Opmerking apotheker:", vet=True)))
+        delen.append(_paragraaf(_run("Opmerking arts:\n", vet=True)))
+
+    return "".join(delen)
+
+# ---------------------------
+# Runrapport
+# ---------------------------
+
+def rapport_xml(rapport, breedte):
+    """
+    Bijlage met het runrapport (RunRapport.als_dict()) op een nieuwe pagina: samenvatting,
+    tijd per stap en één rij per Medimo-regel.
+    """
+    samenvatting = rapport["samenvatting"]
+    per_niveau = ", ".join(f"{niveau}: {aantal}" for niveau, aantal in samenvatting["per_niveau"].items())
+    delen = [
+        '<w:p><w:r><w:br w:type="page"/></w:r></w:p>',
+        _heading("Resolutierapport", 2),
+        _label("Regels: ", str(samenvatting["regels"])),
+        _label("Gevonden op: ", per_niveau),
+        _label("Met SPKode: ", str(samenvatting["met_spkode"])),
+        _label("In geneesmiddelen.db: ", str(samenvatting["in_database"])),
+        _label("Daarvan zonder groep: ", str(samenvatting["geen_groep"])),
+        _label("Uit cache: ", str(samenvatting["uit_cache"])),
+        _label("Tijd per stap: ", ", ".join(f"{stap} {seconden:.2f}s" for stap, seconden in rapport["stappen_s"].items())),
+    ]
+    rijen = []
+    for regel in rapport["regels"]:
+        kandidaten = regel["kandidaten"]
+        rijen.append([
+            regel["patiënt"],
+            regel["regel"],
+            regel["niveau"],
+            f"{kandidaten['BST711T']}/{kandidaten['BST052T']}/{kandidaten['BST070T']}",
+            str(regel["spkode"] or "-"),
+            regel["bron"] or "-",
+            f"{sum(regel['tijden_ms'].values()):.2f}",
+        ])
+    delen.append(_tabel(
+        ["Patiënt", "Regel", "Niveau", "Kandidaten (711/052/070)", "SPKode", "Bron", "Tijd (ms)"], rijen, breedte
+    ))
+    return "".join(delen)
+
+# ---------------------------
+# Document
+# ---------------------------
+
+def maak_document(afdeling, logo_path):
+    """
+    Geraamte via python-docx: marges, logo rechts in de koptekst en de hoofdtitel.
+    """
+    doc = Document()
+
+    # Marges en logo
+    try:
+        section = doc.sections[0]
+        section.top_margin = Cm(2.54)
+        section.bottom_margin = Cm(2.54)
+        section.left_margin = Cm(2.54)
+        section.right_margin = Cm(2.54)
+
+        header = section.header
+        header_para = header.paragraphs[0] if header.paragraphs else header.add_paragraph()
+        header_para.alignment = 2  # Rechts uitlijnen
+        run = header_para.add_run()
+        if os.path.exists(logo_path):
+            run.add_picture(logo_path, width=Cm(4))
+        else:
+            print(f"Waarschuwing: Logo niet gevonden op {logo_path}")
+    except Exception as e:
+        print(f"Waarschuwing: Fout bij toevoegen van logo: {str(e)}")
+
+    # Hoofdtitel
+    doc.add_heading(f"Medicatiebeoordeling - Afdeling {afdeling}", level=1)
+    doc.paragraphs[-1].runs[0].font.color.rgb = RGBColor(0x00, 0x00, 0x80)
+    return doc
+
+def tekstbreedte(doc):
+    """
+    Breedte tussen de marges in EMU (zoals python-docx die over tabelkolommen verdeelt).
+    """
+    return doc._block_width
+
+# ---------------------------
+# Streaming
+# ---------------------------
+
+_MARKER = "PATIENTEN"
+
+class _Stroom:
+    """
+    Niet-seekbaar schrijfdoel voor zipfile: verzamelt geschreven bytes tot ze worden opgehaald.
+    """
+
+    def __init__(self):
+        self._delen = []
+
+    def write(self, data):
+        self._delen.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def ophalen(self):
+        data = b"".join(self._delen)
+        self._delen.clear()
+        return data
+
+def _document_delen(doc):
+    """
+    Splitst word/document.xml van het geraamte in (kop, staart): de patiëntsecties komen
+    ertussen, vóór de sectie-eigenschappen.
+    """
+    body = doc.element.body
+    marker = etree.Comment(_MARKER)
+    if body.sectPr is not None:
+        body.sectPr.addprevious(marker)
+    else:
+        body.append(marker)
+    xml = etree.tostring(doc.element, encoding="UTF-8", standalone=True)
+    body.remove(marker)
+    kop, staart = xml.split(f"<!--{_MARKER}-->".encode("ascii"))
+    return kop, staart
+
+# Onder dit aantal patiënten weegt het opstarten van een procespool niet op tegen de winst
+MIN_PATIËNTEN_PARALLEL = 20
+
+def _patiënt_bytes(patiënt, vandaag, breedte):
+    return patiënt_xml(patiënt, vandaag, breedte).encode("utf-8")
+
+def _niets():
+    return None
+
+def maak_render_pool(workers):
+    """
+    Procespool voor het renderen van patiëntsecties, bedoeld om één keer te maken (bij het
+    starten van de engine) en daarna voor elk document te hergebruiken. De workers worden
+    meteen gestart: met fork gebeurt dat dan vanuit de thread die de pool maakt, vóórdat er
+    job- of requestthreads zijn, en niet later vanuit een proces met meerdere threads (een
+    fork kan dan blijven hangen op een lock van een andere thread).
+    None bij workers <= 1: dan wordt in het eigen proces gerenderd.
+    """
+    if not workers or workers <= 1:
+        return None
+    context = None
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    pool.submit(_niets).result()  # met fork start de eerste submit alle workers tegelijk
+    return pool
+
+def _render_fragmenten(patiënten, breedte, pool=None):
+    """
+    Rendert patiënten met DATUM_TEKEN als datum, in de oorspronkelijke volgorde. Met een pool
+    (maak_render_pool) en genoeg patiënten gebeurt dat in de workers; map levert de resultaten
+    op volgorde.
+    """
+    if pool is None or len(patiënten) < MIN_PATIËNTEN_PARALLEL:
+        for patiënt in patiënten:
+            yield _patiënt_bytes(patiënt, DATUM_TEKEN, breedte)
+        return
+
+    chunksize = max(1, len(patiënten) // (4 * (os.cpu_count() or 1)))
+    yield from pool.map(_patiënt_bytes, patiënten, repeat(DATUM_TEKEN), repeat(breedte), chunksize=chunksize)
+
+def _patiënt_fragmenten(patiënten_data, vandaag, breedte, pool=None, cache=None):
+    """
+    Geeft de gecodeerde XML per patiënt in de oorspronkelijke volgorde. Secties die in de
+    cache staan (sleutel in patiënt["cache_sleutel"]) worden niet opnieuw gerenderd; nieuwe
+    secties worden na het renderen in de cache gezet. De datum wordt pas hier ingevuld.
+    """
+    sleutels = [patiënt.get("cache_sleutel") if cache is not None else None for patiënt in patiënten_data]
+    gecached = [cache.xml(sleutel) if sleutel else None for sleutel in sleutels]
+    gerenderd = _render_fragmenten(
+        [patiënt for patiënt, xml in zip(patiënten_data, gecached) if xml is None], breedte, pool
+    )
+
+    datum_teken = DATUM_TEKEN.encode("utf-8")
+    datum = escape(vandaag).encode("utf-8")
+    for sleutel, xml in zip(sleutels, gecached):
+        if xml is None:
+            xml = next(gerenderd)
+            if sleutel:
+                cache.bewaar_xml(sleutel, xml)
+        yield xml.replace(datum_teken, datum)
+
+def _schrijf_docx(patiënten_data, afdeling, doel, logo_path, pool=None, cache=None, rapport=None):
+    """
+    Schrijft het docx-pakket naar doel (pad of file-like, ook niet-seekbaar).
+    Alleen het geraamte staat als Document in het geheugen; word/document.xml wordt per
+    patiënt gecomprimeerd weggeschreven. Generator: geeft na elke patiënt en na het
+    afsluiten van de zip de beurt terug.
+    pool: optionele render-pool (maak_render_pool); None = in dit proces renderen.
+    cache: optionele SectieCache met eerder gerenderde secties.
+    rapport: optioneel RunRapport, als bijlage na de patiënten.
+    """
+    doc = maak_document(afdeling, logo_path)
+    vandaag = datetime.today().strftime("%d-%m-%Y")
+    breedte = tekstbreedte(doc)
+    kop, staart = _document_delen(doc)
+
+    geraamte = io.BytesIO()
+    doc.save(geraamte)
+    with zipfile.ZipFile(geraamte) as bron, zipfile.ZipFile(doel, "w", zipfile.ZIP_DEFLATED) as zf:
+        for info in bron.infolist():
+            if info.filename != "word/document.xml":
+                zf.writestr(info.filename, bron.read(info.filename), zipfile.ZIP_DEFLATED)
+                continue
+            with zf.open("word/document.xml", "w") as f:
+                f.write(kop)
+                for fragment in _patiënt_fragmenten(patiënten_data, vandaag, breedte, pool, cache):
+                    f.write(fragment)
+                    yield
+                if rapport is not None:
+                    f.write(rapport_xml(rapport.als_dict(), breedte).encode("utf-8"))
+                f.write(staart)
+    yield
+
+def docx_stream(patiënten_data, afdeling, logo_path=os.path.join("Data", "logo_apotheek_rgb.jpg"), pool=None,
+                cache=None, rapport=None):
+    """
+    Generator met de bytes van het Word-document, per patiënt een stuk; bedoeld voor een
+    gestreamd HTTP-antwoord (bv. flask.Response).
+    """
+    stroom = _Stroom()
+    for _ in _schrijf_docx(patiënten_data, afdeling, stroom, logo_path, pool, cache, rapport):
+        stuk = stroom.ophalen()
+        if stuk:
+            yield stuk
+
+def genereer_word_document(patiënten_data, afdeling, uitvoer=None, logo_path=os.path.join("Data", "logo_apotheek_rgb.jpg"),
+                           pool=None, cache=None, rapport=None):
+    """
+    Bouwt het Word-document. uitvoer: pad of file-like object (bv. BytesIO);
+    zonder uitvoer wordt Output/MedicatieReview_{afdeling}.docx geschreven.
+    pool: optionele render-pool (maak_render_pool); None = in dit proces renderen.
+    cache: optionele SectieCache met eerder gerenderde secties.
+    rapport: optioneel RunRapport, als bijlage na de patiënten.
+    """
+    if uitvoer is not None:
+        for _ in _schrijf_docx(patiënten_data, afdeling, uitvoer, logo_path, pool, cache, rapport):
+            pass
+        return uitvoer
+
+    os.makedirs("Output", exist_ok=True)
+    doc_path = f"Output/MedicatieReview_{afdeling}.docx"
+    for _ in _schrijf_docx(patiënten_data, afdeling, doc_path, logo_path, pool, cache, rapport):
+        pass
+    print(f"Word-document opgeslagen als: {doc_path}")
+    return doc_path
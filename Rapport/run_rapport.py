@@ -0,0 +1,88 @@
+"""
+Runrapport: hoe goed en hoe snel zijn de Medimo-regels van een run opgelost.
+
+Per regel (zoals in Medimo, vóór het samenvoegen per product):
+    - patiënt, productnaam en gebruik
+    - niveau waarop de naam gevonden is: 'exact', 'eerste_woord', 'fuzzy' of 'geen'
+    - aantal SPKode-kandidaten via BST711T, BST052T en BST070T
+    - gekozen NMNR/HPKODE/SPKode, of die SPKode in geneesmiddelen.db staat en of het middel
+      daar een groep heeft
+    - bron ('cache' of 'resolutie') en de tijd per stap in ms
+Daarnaast de totale tijd per stap van de run (parsen, resolutie, evaluatie, renderen) en
+een samenvatting per niveau. Het rapport gaat als JSON naar een bestand en kan als
+bijlage achter in het Word-document worden opgenomen (docx_xml.rapport_xml).
+"""
+
+import json
+import time
+from contextlib import contextmanager
+
+NIVEAUS = ("exact", "eerste_woord", "fuzzy", "geen")
+
+
+class RunRapport:
+    def __init__(self):
+        self.afdeling = None
+        self.regels = []
+        self.stappen = {}  # stap → seconden
+
+    @contextmanager
+    def stap(self, naam):
+        """
+        Telt de duur van het blok op bij stap naam.
+        """
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stappen[naam] = self.stappen.get(naam, 0.0) + time.perf_counter() - t0
+
+    def voeg_regel_toe(self, patiënt, gm, resolutie, in_database, tijden=None):
+        """
+        gm: regel uit als_dict; resolutie: Resolutie (resolutie_cache); tijden: zie resolveer_namen.
+        in_database: de SPKode staat in geneesmiddelen.db (ReviewEngine.db_spkodes).
+        """
+        n711, n052, n070 = resolutie.kandidaten
+        tijden = dict(tijden or {})
+        bron = tijden.pop("bron", None)
+        self.regels.append({
+            "patiënt": patiënt,
+            "regel": gm["clean"],
+            "gebruik": gm["gebruik"],
+            "niveau": resolutie.methode or "geen",
+            "score": resolutie.score,
+            "kandidaten": {"BST711T": n711, "BST052T": n052, "BST070T": n070},
+            "nmnr": resolutie.nmnr,
+            "hpkode": resolutie.hpkode,
+            "spkode": resolutie.spkode,
+            "in_database": in_database,
+            "geen_groep": in_database and resolutie.groep is None,
+            "bron": bron,
+            "tijden_ms": {stap: round(ms, 3) for stap, ms in tijden.items()},
+        })
+
+    def samenvatting(self):
+        per_niveau = {niveau: 0 for niveau in NIVEAUS}
+        for regel in self.regels:
+            per_niveau[regel["niveau"]] += 1
+        return {
+            "regels": len(self.regels),
+            "per_niveau": per_niveau,
+            "met_spkode": sum(1 for regel in self.regels if regel["spkode"]),
+            "in_database": sum(1 for regel in self.regels if regel["in_database"]),
+            "geen_groep": sum(1 for regel in self.regels if regel["geen_groep"]),
+            "uit_cache": sum(1 for regel in self.regels if regel["bron"] == "cache"),
+        }
+
+    def als_dict(self):
+        return {
+            "afdeling": self.afdeling,
+            "samenvatting": self.samenvatting(),
+            "stappen_s": {stap: round(seconden, 4) for stap, seconden in self.stappen.items()},
+            "regels": self.regels,
+        }
+
+    def schrijf_json(self, pad):
+        with open(pad, "w", encoding="utf-8") as f:
+            json.dump(self.als_dict(), f, ensure_ascii=False, indent=2)
+        return pad
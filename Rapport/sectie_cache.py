@@ -0,0 +1,113 @@
+"""
+Cache van geanalyseerde en gerenderde patiëntsecties.
+
+Afdelingen worden om de paar weken opnieuw beoordeeld en bij de meeste patiënten is de
+medicatie niet veranderd. Per patiënt wordt daarom een vingerafdruk gemaakt van:
+    - de genormaliseerde regels van het Medimo-blok (kop met naam + medicatieregels)
+    - eGFR en leeftijd (bepalen welke criteria van toepassing zijn)
+    - de versie van de regels en referentiedata (START_STOPP.json, acb.json, G-Standaard
+      snapshot, geneesmiddelen.db / ATC_groepen.db)
+Bij een treffer worden resolutie, regelevaluatie en renderen overgeslagen.
+
+Per sleutel worden de analyse (gepickled, zodat elke treffer een eigen kopie krijgt) en de
+gerenderde XML bewaard. De XML bevat DATUM_TEKEN in plaats van de datum; die wordt bij het
+samenvoegen ingevuld. Verwijderen gaat op LRU-volgorde zodra de totale grootte boven max_bytes komt.
+"""
+
+import re
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Plaatshouder voor de datum in gecachte XML (private-use tekens, komen niet in Medimo-tekst voor)
+DATUM_TEKEN = "\ue000DATUM\ue000"
+
+# Zelfde kolomscheiding als parse_medimo_block: twee of meer spaties of tabs
+_KOLOM_RE = re.compile(r"\s{2,}|\t+")
+
+
+def sectie_sleutel(blok, egfr, leeftijd, versie):
+    """
+    Vingerafdruk van één patiëntblok. Witruimte rond regels en de breedte van kolomscheidingen
+    tellen niet mee; lege regels wel (parse_medimo_block gebruikt ze als scheiding).
+    """
+    regels = [_KOLOM_RE.sub("\t", regel.strip()) for regel in blok.strip().split("\n")]
+    h = hashlib.sha256()
+    h.update(repr((versie, egfr, leeftijd)).encode("utf-8"))
+    for regel in regels:
+        h.update(b"\n")
+        h.update(regel.encode("utf-8"))
+    return h.hexdigest()
+
+
+class SectieCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()  # sleutel → [analyse (pickle), xml of None]
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def grootte(self):
+        return self._bytes
+
+    def analyse(self, sleutel):
+        """
+        Gecachte patiëntgegevens (nieuwe kopie) of None.
+        """
+        with self._lock:
+            item = self._items.get(sleutel)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(sleutel)
+            self.hits += 1
+            data = item[0]
+        return pickle.loads(data)
+
+    def bewaar_analyse(self, sleutel, patiënt):
+        data = pickle.dumps(patiënt, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            oud = self._items.pop(sleutel, None)
+            if oud is not None:
+                self._bytes -= len(oud[0]) + len(oud[1] or b"")
+            self._items[sleutel] = [data, None]
+            self._bytes += len(data)
+            self._verwijder_oudste()
+
+    def xml(self, sleutel):
+        """
+        Gerenderde XML (met DATUM_TEKEN) of None.
+        """
+        with self._lock:
+            item = self._items.get(sleutel)
+            if item is None or item[1] is None:
+                return None
+            self._items.move_to_end(sleutel)
+            return item[1]
+
+    def bewaar_xml(self, sleutel, xml):
+        with self._lock:
+            item = self._items.get(sleutel)
+            if item is None:
+                return  # analyse is inmiddels verwijderd; XML alleen heeft geen zin
+            self._bytes += len(xml) - len(item[1] or b"")
+            item[1] = xml
+            self._items.move_to_end(sleutel)
+            self._verwijder_oudste()
+
+    def _verwijder_oudste(self):
+        while self._bytes > self.max_bytes and self._items:
+            _, (data, xml) = self._items.popitem(last=False)
+            self._bytes -= len(data) + len(xml or b"")
+
+    def leeg(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
@@ -0,0 +1,287 @@
+"""
+Gecompileerde STOPP/START-regels.
+
+START_STOPP.json wordt één keer ingelezen en omgezet naar inverted indexes:
+    stof  → criteria (substances)
+    groep → criteria (group_codes)
+    stof/groep → (criterium, onderdeel-bit) voor combinatiecriteria (X=1, Y=2, Z=4)
+Een patiënt raakt daardoor alleen de STOP-criteria die zijn middelen kunnen triggeren.
+De uitvoer is gelijk aan die van de oorspronkelijke lus in check_stopp_criteria.
+
+START-criteria (omissies) gebruiken dezelfde velden:
+    combination_x/y/z → indicatie: middelen/groepen die aanwezig moeten zijn
+                        (geen indicatie opgegeven → altijd van toepassing)
+    substances/group_codes → aanbevolen middel: het criterium triggert als geen ervan gebruikt wordt
+
+Leeftijd en eGFR worden per criterium vooraf omgezet naar één predicaat(leeftijd, egfr):
+    - onbekende leeftijd (None) → leeftijdsgrens wordt niet toegepast
+    - onbekende eGFR (None)     → criteria die een eGFR vereisen worden overgeslagen
+"""
+
+import os
+import json
+import operator
+import threading
+from collections import defaultdict
+
+EGFR_OPERATOREN = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+def _altijd(leeftijd, egfr):
+    return True
+
+def context_voorwaarden(criterion):
+    """
+    Geeft (age_min, egfr_operator, egfr_waarde) terug; None waar het criterium geen eis stelt.
+    """
+    age_min = criterion.get("age_min", 0) if criterion.get("requires_age", False) else None
+
+    op, egfr_waarde = None, None
+    if criterion.get("requires_egfr", False):
+        op = criterion.get("egfr_operator")
+        if op not in EGFR_OPERATOREN or criterion.get("egfr_value") is None:
+            raise ValueError(f"Criterium {criterion['id']}: ongeldige eGFR-voorwaarde ({op!r}, {criterion.get('egfr_value')!r})")
+        egfr_waarde = float(criterion["egfr_value"])
+    return age_min, op, egfr_waarde
+
+def maak_predicaat(criterion):
+    """
+    Zet requires_age/age_min en requires_egfr/egfr_operator/egfr_value om naar één functie.
+    """
+    age_min, op, egfr_waarde = context_voorwaarden(criterion)
+    egfr_test = EGFR_OPERATOREN[op] if op else None
+
+    if age_min is None and egfr_test is None:
+        return _altijd
+
+    def predicaat(leeftijd, egfr):
+        if age_min is not None and leeftijd is not None and leeftijd < age_min:
+            return False
+        if egfr_test is not None and (egfr is None or not egfr_test(egfr, egfr_waarde)):
+            return False
+        return True
+
+    return predicaat
+
+
+class GecompileerdCriterium:
+    __slots__ = (
+        "volgnummer", "id", "type", "category", "description", "argument",
+        "substances", "group_codes", "combi_delen", "combi_onderdelen", "combi_vereist", "heeft_combi",
+        "age_min", "egfr_operator", "egfr_waarde", "van_toepassing",
+    )
+
+    def __init__(self, volgnummer, criterion):
+        self.volgnummer = volgnummer
+        self.id = criterion["id"]
+        self.type = criterion["type"]
+        self.category = criterion["category"]
+        self.description = criterion["description"]
+        self.argument = criterion["argument"]
+        self.substances = frozenset(criterion["substances"])
+        self.group_codes = frozenset(criterion["group_codes"])
+
+        combi_x = criterion.get("combination_x", []) or []
+        combi_y = criterion.get("combination_y", []) or []
+        combi_z = criterion.get("combination_z", []) or []
+        self.combi_delen = ((combi_x, 1), (combi_y, 2), (combi_z, 4))
+        # Volgorde X + Y + Z bewaren: bepaalt of een onderdeel als stof of als groep telt
+        self.combi_onderdelen = tuple(combi_x + combi_y + combi_z)
+        self.heeft_combi = bool(combi_x or combi_y or combi_z)
+        if self.type == "START":
+            # Indicatie: elk opgegeven onderdeel moet geraakt zijn (0 = geen indicatie nodig)
+            self.combi_vereist = sum(bit for deel, bit in self.combi_delen if deel)
+        elif combi_x and combi_y and combi_z:
+            self.combi_vereist = 7
+        elif combi_x and combi_y:
+            self.combi_vereist = 3
+        else:
+            self.combi_vereist = 0  # geen geldige combinatie → kan niet via combinatie triggeren
+
+        self.age_min, self.egfr_operator, self.egfr_waarde = context_voorwaarden(criterion)
+        self.van_toepassing = maak_predicaat(criterion)
+
+    def _middelen_van_onderdelen(self, gevonden, alle_middelen, alle_groepen, groep_to_middelen):
+        for onderdeel in self.combi_onderdelen:
+            if onderdeel in alle_middelen:
+                gevonden.add(onderdeel)
+            elif onderdeel in alle_groepen:
+                gevonden.update(groep_to_middelen[onderdeel])
+        return gevonden
+
+    def gematchte_middelen(self, alle_middelen, alle_groepen, groep_to_middelen, combi_match):
+        """
+        STOP: middelen die dit criterium triggeren (stof-, groeps- en combinatiematch).
+        """
+        # Directe stofmatch
+        matched_middelen = set(self.substances & alle_middelen)
+
+        # Groepsmatch
+        for gr in self.group_codes & alle_groepen:
+            matched_middelen.update(groep_to_middelen[gr])
+
+        # Combinatiematch
+        if combi_match:
+            self._middelen_van_onderdelen(matched_middelen, alle_middelen, alle_groepen, groep_to_middelen)
+        return matched_middelen
+
+    def indicatie_middelen(self, alle_middelen, alle_groepen, groep_to_middelen):
+        """
+        START: middelen die de indicatie vormen.
+        """
+        return self._middelen_van_onderdelen(set(), alle_middelen, alle_groepen, groep_to_middelen)
+
+
+def groepeer(middel_to_groep):
+    """
+    {middel: groep} → (alle_middelen, alle_groepen, groep_to_middelen)
+    """
+    alle_middelen = set(middel_to_groep)
+    groep_to_middelen = defaultdict(list)
+    for middel, groep in middel_to_groep.items():
+        if groep:
+            groep_to_middelen[groep].append(middel)
+    return alle_middelen, set(groep_to_middelen), groep_to_middelen
+
+
+class StoppRegels:
+    def __init__(self, criteria):
+        self.criteria = [GecompileerdCriterium(i, c) for i, c in enumerate(criteria)]
+        self.start_criteria = [crit for crit in self.criteria if crit.type == "START"]
+
+        self.stof_index = defaultdict(list)
+        self.groep_index = defaultdict(list)
+        self.combi_index = defaultdict(list)
+        for crit in self.criteria:
+            if crit.type not in ("STOP", "START"):
+                continue
+            # STOP: triggerende middelen, START: aanbevolen middelen
+            for sub in crit.substances:
+                self.stof_index[sub].append(crit.volgnummer)
+            for gr in crit.group_codes:
+                self.groep_index[gr].append(crit.volgnummer)
+            # STOP: combinatie-onderdelen, START: indicatie-onderdelen
+            if crit.combi_vereist:
+                for deel, bit in crit.combi_delen:
+                    for onderdeel in set(deel):
+                        self.combi_index[onderdeel].append((crit.volgnummer, bit))
+
+        # Alleen lezen vanaf hier
+        for index in (self.stof_index, self.groep_index, self.combi_index):
+            index.default_factory = None
+
+    def evalueer(self, middel_to_groep, leeftijd, egfr=None, soort="STOP"):
+        """
+        middel_to_groep: {middel (lowercase): groep of None}
+        leeftijd, egfr: patiëntcontext; None = onbekend
+        soort: "STOP" of "START"
+        Returns: lijst van getriggerde criteria (zelfde dicts als check_stopp_criteria)
+        """
+        alle_middelen, alle_groepen, groep_to_middelen = groepeer(middel_to_groep)
+
+        if soort == "START":
+            return self._evalueer_start(alle_middelen, alle_groepen, groep_to_middelen, leeftijd, egfr)
+
+        kandidaten = set()
+        for middel in alle_middelen:
+            kandidaten.update(self.stof_index.get(middel, ()))
+        for groep in alle_groepen:
+            kandidaten.update(self.groep_index.get(groep, ()))
+
+        # Combinatie: per criterium de bits van de geraakte onderdelen verzamelen
+        combi_masker = defaultdict(int)
+        for token in alle_middelen | alle_groepen:
+            for volgnummer, bit in self.combi_index.get(token, ()):
+                combi_masker[volgnummer] |= bit
+        kandidaten.update(combi_masker)
+
+        triggered_criteria = []
+        for volgnummer in sorted(kandidaten):
+            crit = self.criteria[volgnummer]
+            if crit.type != "STOP" or not crit.van_toepassing(leeftijd, egfr):
+                continue
+
+            combi_match = crit.combi_vereist and combi_masker.get(volgnummer, 0) == crit.combi_vereist
+            matched_middelen = crit.gematchte_middelen(alle_middelen, alle_groepen, groep_to_middelen, combi_match)
+            if matched_middelen:
+                triggered_criteria.append(formatteer_trigger(crit, matched_middelen))
+
+        return triggered_criteria
+
+    def _evalueer_start(self, alle_middelen, alle_groepen, groep_to_middelen, leeftijd, egfr):
+        combi_masker = defaultdict(int)
+        for token in alle_middelen | alle_groepen:
+            for volgnummer, bit in self.combi_index.get(token, ()):
+                combi_masker[volgnummer] |= bit
+
+        triggered_criteria = []
+        for crit in self.start_criteria:
+            if not crit.van_toepassing(leeftijd, egfr):
+                continue
+            if combi_masker.get(crit.volgnummer, 0) & crit.combi_vereist != crit.combi_vereist:
+                continue
+            # Aanbevolen middel al aanwezig → geen omissie
+            if crit.substances & alle_middelen or crit.group_codes & alle_groepen:
+                continue
+
+            indicatie_middelen = crit.indicatie_middelen(alle_middelen, alle_groepen, groep_to_middelen)
+            triggered_criteria.append(formatteer_start_trigger(crit, indicatie_middelen))
+        return triggered_criteria
+
+
+def formatteer_start_trigger(crit, indicatie_middelen):
+    ontbreekt = " / ".join(sorted(crit.substances | crit.group_codes))
+    triggering_text = f"Ontbreekt: {ontbreekt}" if ontbreekt else "Ontbreekt"
+    if indicatie_middelen:
+        triggering_text += f" (indicatie: {', '.join(sorted(indicatie_middelen))})"
+
+    return {
+        "id": crit.id,
+        "category": crit.category,
+        "description": crit.description,
+        "argument": crit.argument,
+        "triggering_medicines": triggering_text
+    }
+
+
+def formatteer_trigger(crit, matched_middelen):
+    # Controle op combinatie
+    if len(matched_middelen) > 1 and crit.heeft_combi:
+        triggering_text = f"Combinatie: {' + '.join(sorted(matched_middelen))}"
+    else:
+        triggering_text = ", ".join(sorted(matched_middelen))
+
+    return {
+        "id": crit.id,
+        "category": crit.category,
+        "description": crit.description,
+        "argument": crit.argument,
+        "triggering_medicines": triggering_text
+    }
+
+
+def compileer_criteria(criteria):
+    return StoppRegels(criteria)
+
+
+# Gecompileerde regels per JSON-bestand; opnieuw compileren als het bestand wijzigt
+_regels_cache = {}
+_regels_lock = threading.Lock()
+
+def laad_regels(json_path='START_STOP/START_STOPP.json'):
+    st = os.stat(json_path)
+    sleutel = os.path.abspath(json_path)
+    versie = (st.st_size, st.st_mtime_ns)
+    with _regels_lock:
+        gecached = _regels_cache.get(sleutel)
+        if gecached is None or gecached[0] != versie:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                criteria = json.load(f)['criteria']
+            gecached = (versie, compileer_criteria(criteria))
+            _regels_cache[sleutel] = gecached
+    return gecached[1]
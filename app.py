@@ -1,53 +1,136 @@
 # app.py
 import os
 import io
-import glob
 import time
-import tempfile
-import shutil
+import uuid
 import traceback
 import threading
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
 
-from flask import Flask, request, send_file, jsonify, render_template_string
+from itertools import chain
+
+from flask import Flask, Response, request, send_file, jsonify, render_template_string
 
 # -------------------------------------------------
 # Config
 # -------------------------------------------------
 PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
-OUTPUT_DIR = os.path.join(PROJECT_ROOT, "Output")
-DATA_DIR = os.path.join(PROJECT_ROOT, "Data")
-ORIGINAL_MEDIMO = os.path.join(DATA_DIR, "medimo_input.txt")
+DOCX_MIMETYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# Jobs: aantal gelijktijdige verwerkingen, max. aantal openstaande jobs en bewaartijd (s) van resultaten
+JOB_WORKERS = int(os.environ.get("MEDREVIEW_JOB_WORKERS", "2"))
+JOB_MAX_OPEN = int(os.environ.get("MEDREVIEW_JOB_MAX_OPEN", "20"))
+JOB_RESULT_TTL = int(os.environ.get("MEDREVIEW_JOB_RESULT_TTL", "3600"))
+# Processen voor het renderen van de patiëntsecties (1 = in het requestproces); één pool, bij het starten
+# gemaakt en gedeeld door alle requests. Jobs renderen altijd in hun eigen thread.
+RENDER_WORKERS = int(os.environ.get("MEDREVIEW_RENDER_WORKERS", "1"))
+# Maximale grootte (MB) van de cache met geanalyseerde en gerenderde patiëntsecties (0 = uit)
+CACHE_MB = int(os.environ.get("MEDREVIEW_CACHE_MB", "64"))
 
 # Importeer jouw bestaande main.py (moet in dezelfde root liggen)
 import importlib
-main_mod = importlib.import_module("main")  # jouw main.py met main()
+main_mod = importlib.import_module("main")  # jouw main.py met ReviewEngine
 
-# Eén globale lock om race-conditions te voorkomen als meerdere users tegelijk posten
-WRITE_LOCK = threading.Lock()
+# Pipeline één keer opbouwen bij het starten: G-Standaard indexen, regels en DB-caches
+# (geneesmiddelen.db + ATC_groepen.db in het geheugen; herlaadt zelf bij wijziging)
+ENGINE = main_mod.ReviewEngine(PROJECT_ROOT, render_workers=RENDER_WORKERS, cache_mb=CACHE_MB)
 
 # Flask - serveer /static/* uit ./Data zodat het logo zichtbaar is
 app = Flask(__name__, static_folder="Data", static_url_path="/static")
 
+# Begrensde workerpool voor /api/jobs; job-status in het geheugen (per proces)
+JOB_POOL = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="review-job")
+JOBS = {}
+JOBS_LOCK = threading.Lock()
+
 
 # -------------------------------------------------
-# Helpers
+# Jobs
 # -------------------------------------------------
-def _latest_docx_after(path: str, t0: float) -> Optional[str]:
-    """Geef het nieuwste .docx-pad terug dat is aangepast ná tijdstip t0."""
-    if not os.path.isdir(path):
-        return None
-    candidates = []
-    for p in glob.glob(os.path.join(path, "*.docx")):
-        try:
-            if os.path.getmtime(p) >= t0:
-                candidates.append(p)
-        except FileNotFoundError:
-            pass
-    if not candidates:
-        return None
-    candidates.sort(key=os.path.getmtime, reverse=True)
-    return candidates[0]
+def _ruim_jobs_op_locked():
+    """Verwijder afgeronde jobs waarvan het resultaat ouder is dan JOB_RESULT_TTL (JOBS_LOCK vasthouden)."""
+    grens = time.time() - JOB_RESULT_TTL
+    for job_id in [j for j, job in JOBS.items() if job["afgerond_op"] and job["afgerond_op"] < grens]:
+        del JOBS[job_id]
+
+
+def _ruim_jobs_op():
+    with JOBS_LOCK:
+        _ruim_jobs_op_locked()
+
+
+def _ruim_periodiek_op():
+    """Achtergrondthread: ruimt verlopen resultaten ook op als er geen requests binnenkomen."""
+    while True:
+        time.sleep(max(1, min(JOB_RESULT_TTL, 60)))
+        _ruim_jobs_op()
+
+
+def _zoek_job(job_id):
+    """Kopie van de job (zodat de worker hem intussen kan bijwerken), of None als onbekend of verlopen."""
+    with JOBS_LOCK:
+        _ruim_jobs_op_locked()
+        job = JOBS.get(job_id)
+        return dict(job) if job is not None else None
+
+
+def _werk_job_bij(job_id, **velden):
+    with JOBS_LOCK:
+        job = JOBS.get(job_id)
+        if job is not None:
+            job.update(velden)
+
+
+threading.Thread(target=_ruim_periodiek_op, name="review-job-opruimer", daemon=True).start()
+
+
+def _job_status(job):
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "afdeling": job["afdeling"],
+        "patiënten_klaar": job["patiënten_klaar"],
+        "patiënten_totaal": job["patiënten_totaal"],
+        "laatste_patiënt": job["laatste_patiënt"],
+        "detail": job["detail"],
+    }
+
+
+def _lees_egfr(j):
+    """
+    Optioneel veld "egfr": {naam: eGFR}. Geeft (dict of None, foutmelding of None) terug.
+    """
+    egfr = j.get("egfr")
+    if egfr is None:
+        return None, None
+    if not isinstance(egfr, dict):
+        return None, "Veld 'egfr' moet een object {naam: waarde} zijn."
+    try:
+        return {str(naam): float(waarde) for naam, waarde in egfr.items() if waarde is not None}, None
+    except (TypeError, ValueError):
+        return None, "Ongeldige eGFR-waarde; verwacht een getal per patiënt."
+
+
+def _voer_job_uit(job_id: str, medimo_text: str, egfr_per_patiënt=None):
+    _werk_job_bij(job_id, status="bezig")
+
+    def voortgang(klaar, totaal, naam):
+        _werk_job_bij(job_id, patiënten_klaar=klaar, patiënten_totaal=totaal, laatste_patiënt=naam)
+
+    try:
+        patiënten_data, afdeling = ENGINE.analyseer(medimo_text, voortgang, egfr_per_patiënt)
+        _werk_job_bij(job_id, afdeling=afdeling)
+        buffer = io.BytesIO()
+        # Serieel: de jobs lopen al parallel in JOB_POOL
+        ENGINE.render(patiënten_data, afdeling, buffer, parallel=False)
+        # Resultaat, status en afgerond_op in één keer: een lezer ziet nooit 'klaar' zonder bytes
+        _werk_job_bij(
+            job_id, resultaat=buffer.getvalue(), bestandsnaam=main_mod.ReviewEngine.bestandsnaam(afdeling),
+            status="klaar", afgerond_op=time.time()
+        )
+    except Exception as e:
+        traceback.print_exc()
+        _werk_job_bij(job_id, detail=f"Fout tijdens verwerken: {e}", status="fout", afgerond_op=time.time())
 
 
 # -------------------------------------------------
@@ -634,12 +717,36 @@ Etc..."></textarea>
       setStatus('Verwerken van medicatie gegevens...', 'info');
 
       try{
-        const resp = await fetch('/api/run', {
+        const start = await fetch('/api/jobs', {
           method:'POST',
           headers: {'Content-Type':'application/json'},
           body: JSON.stringify({ medimo_text: text })
         });
+        const job = await start.json().catch(()=> ({}));
+        if(!start.ok){
+          throw new Error(job?.detail || start.statusText);
+        }
+
+        // Pollen tot de job klaar is (of faalt)
+        while(true){
+          await new Promise(r => setTimeout(r, 1000));
+          const st = await fetch(job.status_url);
+          const data = await st.json().catch(()=> ({}));
+          if(!st.ok){
+            throw new Error(data?.detail || st.statusText);
+          }
+          if(data.status === 'fout'){
+            throw new Error(data.detail || 'Verwerking mislukt.');
+          }
+          if(data.status === 'klaar'){
+            break;
+          }
+          if(data.patiënten_totaal){
+            setStatus(`Verwerken van medicatie gegevens... ${data.patiënten_klaar}/${data.patiënten_totaal} patiënten`, 'info');
+          }
+        }
 
+        const resp = await fetch(job.result_url);
         if(!resp.ok){
           const data = await resp.json().catch(()=> ({}));
           const det = data?.detail || resp.statusText;
@@ -698,80 +805,120 @@ def index():
 @app.post("/api/run")
 def run_pipeline():
     """
-    - Maakt tijdelijke kopie met user-input
-    - Vervangt Data/medimo_input.txt atomisch (met lock)
-    - Draait main.main()
-    - Stuurt nieuwste .docx terug
-    - Herstelt altijd het originele bestand (of verwijdert als er geen origineel was)
+    - Verwerkt de aangeleverde Medimo-tekst volledig in het geheugen (geen gedeelde bestanden of locks)
+    - Optioneel "egfr": {naam: eGFR} voor eGFR-afhankelijke criteria
+    - Met Content-Type text/plain is de body zelf de Medimo-export; die wordt dan als stroom
+      regel voor regel geparsed (zonder eGFR)
+    - Streamt het Word-document patiënt voor patiënt naar de client (geen volledig document in het geheugen)
+    Meerdere afdelingen kunnen zo veilig tegelijk verwerkt worden.
     """
-    backup_path = None
-    temp_new = None
-    t0 = time.time()
-
     try:
-        j = request.get_json(force=True, silent=False) or {}
-        medimo_text = j.get("medimo_text", "")
-        if not medimo_text.strip():
-            return jsonify({"detail": "Geen medimo_text aangeleverd."}), 400
-
-        # 1) Tijdelijke file met inhoud
-        with tempfile.NamedTemporaryFile("w", delete=False, suffix=".txt", encoding="utf-8") as tmp:
-            tmp.write(medimo_text)
-            temp_new = tmp.name
-
-        # 2) Met lock: backup + atomisch vervangen
-        with WRITE_LOCK:
-            os.makedirs(DATA_DIR, exist_ok=True)
-            if os.path.exists(ORIGINAL_MEDIMO):
-                with tempfile.NamedTemporaryFile(delete=False) as bak:
-                    backup_path = bak.name
-                shutil.copy2(ORIGINAL_MEDIMO, backup_path)
-            os.replace(temp_new, ORIGINAL_MEDIMO)
-            temp_new = None  # eigendom overgedragen
-
-        # 3) Draai jouw pipeline
-        main_mod.main()
-
-        # 4) Vind nieuwste docx sinds starttijd
-        time.sleep(0.2)  # kleine FS-pauze
-        latest = _latest_docx_after(OUTPUT_DIR, t0)
-        if not latest:
-            files = sorted(glob.glob(os.path.join(OUTPUT_DIR, "*.docx")), key=os.path.getmtime, reverse=True)
-            latest = files[0] if files else None
-
-        if not latest:
-            return jsonify({"detail": "Geen .docx-output gevonden in Output/."}), 500
-
-        return send_file(
-            latest,
-            mimetype="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            as_attachment=True,
-            download_name=os.path.basename(latest)
+        if request.mimetype == "text/plain":
+            medimo_text, egfr_per_patiënt = request.stream, None
+        else:
+            j = request.get_json(force=True, silent=False) or {}
+            medimo_text = j.get("medimo_text", "")
+            if not medimo_text.strip():
+                return jsonify({"detail": "Geen medimo_text aangeleverd."}), 400
+            egfr_per_patiënt, fout = _lees_egfr(j)
+            if fout:
+                return jsonify({"detail": fout}), 400
+
+        patiënten_data, afdeling = ENGINE.analyseer(medimo_text, egfr_per_patiënt=egfr_per_patiënt)
+        if not patiënten_data and request.mimetype == "text/plain":
+            return jsonify({"detail": "Geen patiënten gevonden in de aangeleverde tekst."}), 400
+        stukken = ENGINE.render_stream(patiënten_data, afdeling)
+        # Eerste stuk vooraf: fouten in het geraamte geven zo nog een nette 500
+        eerste = next(stukken)
+
+        response = Response(chain([eerste], stukken), mimetype=DOCX_MIMETYPE)
+        response.headers.set(
+            "Content-Disposition", "attachment", filename=main_mod.ReviewEngine.bestandsnaam(afdeling)
         )
+        return response
 
     except Exception as e:
         traceback.print_exc()
         return jsonify({"detail": f"Fout tijdens verwerken: {e}"}), 500
 
-    finally:
-        # 5) Herstel altijd het originele bestand
-        try:
-            with WRITE_LOCK:
-                if backup_path and os.path.exists(backup_path):
-                    os.replace(backup_path, ORIGINAL_MEDIMO)  # restore origineel
-                    backup_path = None
-                else:
-                    # Er was geen origineel: verwijder tijdelijke vervanger
-                    if os.path.exists(ORIGINAL_MEDIMO):
-                        os.remove(ORIGINAL_MEDIMO)
-        except Exception:
-            traceback.print_exc()
-        # Opruimen als temp_new niet gebruikt/overgezet is
-        if temp_new and os.path.exists(temp_new):
-            try:
-                os.remove(temp_new)
-            except Exception:
-                traceback.print_exc()
+
+@app.post("/api/jobs")
+def maak_job():
+    """
+    Start een verwerking op de achtergrond en geeft direct een job-id terug.
+    Status: GET /api/jobs/<id>, resultaat: GET /api/jobs/<id>/result
+    """
+    j = request.get_json(force=True, silent=False) or {}
+    medimo_text = j.get("medimo_text", "")
+    if not medimo_text.strip():
+        return jsonify({"detail": "Geen medimo_text aangeleverd."}), 400
+    egfr_per_patiënt, fout = _lees_egfr(j)
+    if fout:
+        return jsonify({"detail": fout}), 400
+
+    with JOBS_LOCK:
+        _ruim_jobs_op_locked()
+        open_jobs = sum(1 for job in JOBS.values() if job["status"] in ("wachtrij", "bezig"))
+        if open_jobs >= JOB_MAX_OPEN:
+            return jsonify({"detail": "Te veel openstaande verwerkingen, probeer het later opnieuw."}), 503
+        job_id = uuid.uuid4().hex
+        JOBS[job_id] = {
+            "id": job_id,
+            "status": "wachtrij",
+            "afdeling": None,
+            "patiënten_klaar": 0,
+            "patiënten_totaal": None,
+            "laatste_patiënt": None,
+            "detail": None,
+            "resultaat": None,
+            "bestandsnaam": None,
+            "afgerond_op": None,
+        }
+
+    JOB_POOL.submit(_voer_job_uit, job_id, medimo_text, egfr_per_patiënt)
+    return jsonify({
+        "job_id": job_id,
+        "status_url": f"/api/jobs/{job_id}",
+        "result_url": f"/api/jobs/{job_id}/result",
+    }), 202
+
+
+@app.get("/api/jobs/<job_id>")
+def job_status(job_id):
+    job = _zoek_job(job_id)
+    if job is None:
+        return jsonify({"detail": "Onbekende of verlopen job."}), 404
+    return jsonify(_job_status(job))
+
+
+@app.get("/api/jobs/<job_id>/result")
+def job_resultaat(job_id):
+    job = _zoek_job(job_id)
+    if job is None:
+        return jsonify({"detail": "Onbekende of verlopen job."}), 404
+    if job["status"] == "fout":
+        return jsonify(_job_status(job)), 500
+    if job["status"] != "klaar":
+        return jsonify(_job_status(job)), 409
+
+    return send_file(
+        io.BytesIO(job["resultaat"]),
+        mimetype=DOCX_MIMETYPE,
+        as_attachment=True,
+        download_name=job["bestandsnaam"]
+    )
+
+
+@app.get("/api/cache")
+def cache_statistiek():
+    sectie_cache = ENGINE.sectie_cache
+    return jsonify({
+        "resolutie": ENGINE.resolutie_cache.statistiek(),
+        "secties": None if sectie_cache is None else {
+            "items": len(sectie_cache), "bytes": sectie_cache.grootte,
+            "hits": sectie_cache.hits, "misses": sectie_cache.misses,
+        },
+    })
 
 
 # -------------------------------------------------
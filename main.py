@@ -1,252 +1,502 @@
+import io
+import re
+import json
 import os
-from collections import defaultdict
-from datetime import datetime
-from docx import Document
-from docx.shared import RGBColor, Cm
-from docx.oxml.ns import qn
-from docx.oxml import OxmlElement, parse_xml
+import gc
+import glob
+import time
+import argparse
+import contextlib
+import threading
+import multiprocessing
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
 from Parsers import parse_medimo
-from START_STOP.check_start_stop import check_stopp_criteria
-from Anticholinerge_Score.check_acb import bereken_acb_score
-from Dubbelmedicatie.check_dubbelmedicatie import check_dubbelmedicatie
+from Parsers.medimo_stream import lees_medimo, Patient
+from Parsers.samenvoegen import voeg_regels_samen
+from Parsers.resolutie_cache import ResolutieCache, RESOLUTIE_PATH, resolutie_versie, resolveer_namen
+from Parsers.spk_resolver import SPKodeResolver
+from Database import referentie_cache
+from START_STOP.regel_engine import laad_regels
+from Anticholinerge_Score.check_acb import laad_acb_tabel
+from Afdeling.evalueer_afdeling import evalueer_afdeling
+from Dubbelmedicatie.dubbelmedicatie_index import laad_dubbelmedicatie_index, check_dubbelmedicatie_gstandaard
+from Interacties.check_interacties import laad_interactie_tabel, regel_codes, check_interacties
+from Rapport.docx_xml import genereer_word_document, docx_stream, maak_render_pool
+from Rapport.sectie_cache import SectieCache, sectie_sleutel
+from Rapport.run_rapport import RunRapport
+from Parsers import gstandaard
+
+def zoek_egfr(egfr_per_patiënt, naam):
+    """
+    eGFR voor de patiënt met deze Medimo-kop, bv. 'Mevr. M Curie (07-11-1942)'.
+    Eerst op de volledige kop, daarna op de naam zonder geboortedatum; None als onbekend.
+    """
+    if not egfr_per_patiënt:
+        return None
+    egfr = egfr_per_patiënt.get(naam)
+    if egfr is None:
+        egfr = egfr_per_patiënt.get(re.sub(r"\s*\(.*?\)\s*$", "", naam))
+    return float(egfr) if egfr is not None else None
+
+def regelversie(json_path):
+    """
+    (version, last_modified) uit een regelbestand zoals START_STOPP.json of acb.json.
+    """
+    with open(json_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data.get("version"), data.get("last_modified")
 
-def maak_in_klapbare_heading(paragraph, text):
-    run = paragraph.add_run(text)
-    rPr = run._r.get_or_add_rPr()
-    rStyle = OxmlElement('w:rStyle')
-    rStyle.set(qn('w:val'), 'Heading3')
-    rPr.append(rStyle)
+def bestandsversie(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
 
-def collapse_heading(paragraph, collapsed=True):
+def laad_egfr_bestand(pad):
     """
-    Zet 'Collapsed by default' op een heading-paragraaf (Word 2013+).
-    paragraph: python-docx Paragraph die al een Heading-stijl heeft.
+    Leest een JSON-bestand {naam: eGFR} voor gebruik met analyseer/review.
     """
-    p = paragraph._p
-    pPr = p.get_or_add_pPr()
+    with open(pad, "r", encoding="utf-8") as f:
+        return {naam: float(waarde) for naam, waarde in json.load(f).items()}
 
-    # Verwijder bestaande w15:collapsed nodes (als je herhaald aanroept)
-    for child in list(pPr):
-        if child.tag == '{http://schemas.microsoft.com/office/word/2012/wordml}collapsed':
-            pPr.remove(child)
+class ReviewEngine:
+    """
+    Pipeline die eenmalig alle referentiedata laadt (G-Standaard indexen, STOPP- en
+    ACB-regels, FK/ATC-cache) en daarna per review alleen parseert en rendert.
+
+    basis_dir: map waartegen de standaardpaden (G-Standaard, databases, regels) gelden.
+    render_workers: aantal processen voor het renderen van de patiëntsecties (None = in dit proces);
+        de procespool wordt één keer bij het starten gemaakt en voor elk document hergebruikt.
+    cache_mb: maximale grootte van de cache met geanalyseerde en gerenderde patiëntsecties (0 = uit).
+    """
 
-    if collapsed:
-        node = parse_xml(
-            r'<w15:collapsed xmlns:w15="http://schemas.microsoft.com/office/word/2012/wordml"/>'
+    def __init__(self, basis_dir="", render_workers=None, cache_mb=64):
+        pad = lambda *delen: os.path.join(basis_dir, *delen)
+        self.basis_dir = basis_dir
+        self.render_workers = render_workers
+        self.render_pool = maak_render_pool(render_workers)
+        self.sectie_cache = SectieCache(cache_mb * 1024 * 1024) if cache_mb else None
+        self.db_path = pad("geneesmiddelen.db")
+        self.atc_db_path = pad("ATC_groepen.db")
+        self.logo_path = pad("Data", "logo_apotheek_rgb.jpg")
+        self.output_dir = pad("Output")
+
+        naam_index, bst004, bst052, bst070, bst711 = parse_medimo.load_gstandaard(
+            pad("G-Standaard"), pad("gstandaard_snapshot.db")
         )
-        pPr.append(node)
-
-def genereer_word_document(patiënten_data, afdeling):
-    doc = Document()
-
-    # Marges en logo
-    try:
-        section = doc.sections[0]
-        section.top_margin = Cm(2.54)
-        section.bottom_margin = Cm(2.54)
-        section.left_margin = Cm(2.54)
-        section.right_margin = Cm(2.54)
-
-        header = section.header
-        header_para = header.paragraphs[0] if header.paragraphs else header.add_paragraph()
-        header_para.alignment = 2  # Rechts uitlijnen
-        run = header_para.add_run()
-        logo_path = os.path.join("Data", "logo_apotheek_rgb.jpg")
-        if os.path.exists(logo_path):
-            run.add_picture(logo_path, width=Cm(4))
-        else:
-            print(f"Waarschuwing: Logo niet gevonden op {logo_path}")
-    except Exception as e:
-        print(f"Waarschuwing: Fout bij toevoegen van logo: {str(e)}")
-
-    # Hoofdtitel
-    doc.add_heading(f"Medicatiebeoordeling - Afdeling {afdeling}", level=1)
-    doc.paragraphs[-1].runs[0].font.color.rgb = RGBColor(0x00, 0x00, 0x80)
-
-    vandaag = datetime.today().strftime("%d-%m-%Y")
-
-    for patiënt in patiënten_data:
-        heading = doc.add_heading(f"{patiënt['naam']}", level=2)
-        heading.runs[0].font.color.rgb = RGBColor(0x00, 0x00, 0x80)
-
-        # Arts, apotheker, datum, eGFR
-        para = doc.add_paragraph()
-        for label, value in [("Arts:", ""), ("Apotheker:", ""), ("Datum:", vandaag), ("eGFR:", "")]:
-            run = para.add_run(f"{label} ")
-            run.bold = True
-            para.add_run(f"{value}\n")
-
-        # STOPP criteria
-        heading = doc.add_heading("Mogelijke STOPP-criteria:", level=3)
-        heading.runs[0].font.color.rgb = RGBColor(0x00, 0x00, 0x80)
-        collapse_heading(heading, True)
-
-        if patiënt["stopp"]:
-            table = doc.add_table(rows=1, cols=5)
-            table.style = 'Table Grid'
-            hdr_cells = table.rows[0].cells
-            headers = ["Criteriumcode", "Categorie", "Beschrijving", "Argument", "Getriggerd door"]
-            for i, text in enumerate(headers):
-                run = hdr_cells[i].paragraphs[0].add_run(text)
-                run.bold = True
-
-            for item in patiënt["stopp"]:
-                row_cells = table.add_row().cells
-                row_cells[0].text = item['id']
-                row_cells[1].text = item['category']
-                row_cells[2].text = item['description']
-                row_cells[3].text = item['argument']
-                row_cells[4].text = item['triggering_medicines']
+        self.referentie_cache = referentie_cache.laad_referentie_cache(self.db_path, self.atc_db_path)
+        # SPKodes in geneesmiddelen.db en de resolver die ze gebruikt; opnieuw opgebouwd als de
+        # database wijzigt (zie ververs_referentie)
+        self._gstandaard = (bst052, bst004, bst070, bst711, naam_index)
+        self._referentie_lock = threading.Lock()
+        self._db_versie = bestandsversie(self.db_path)
+        self.db_spkodes = parse_medimo.get_spkodes_in_db(self.db_path)
+        self.resolver = SPKodeResolver(bst052, bst004, bst070, bst711, self.db_spkodes, naam_index)
+        self.snapshot_path = pad("gstandaard_snapshot.db")
+        # Productnaam → volledige resolutie, bewaard tussen runs
+        self.resolutie_cache = ResolutieCache(self.resolutie_versie(), pad(RESOLUTIE_PATH))
+        self.dubbelmedicatie_index = laad_dubbelmedicatie_index(
+            pad("G-Standaard"), pad("gstandaard_snapshot.db"), pad("gstandaard_dubbelmedicatie.idx")
+        )
+        self.interactie_tabel = laad_interactie_tabel(pad("G-Standaard"), pad("gstandaard_snapshot.db"))
+
+        self.stopp_regels = laad_regels(pad("START_STOP", "START_STOPP.json"))
+        self.acb_tabel = laad_acb_tabel(pad("Anticholinerge_Score", "acb.json"), self.db_path)
+
+        # Versie van regels en referentiedata; onderdeel van elke cachesleutel
+        self.regel_versie = (
+            regelversie(pad("START_STOP", "START_STOPP.json")),
+            regelversie(pad("Anticholinerge_Score", "acb.json")),
+            gstandaard.get_snapshot_id(pad("gstandaard_snapshot.db")),
+        )
+
+    def cache_versie(self):
+        """
+        Regelversies plus de huidige versie van de databases (die kunnen tussendoor wijzigen).
+        """
+        return self.regel_versie + (bestandsversie(self.db_path), bestandsversie(self.atc_db_path))
+
+    def ververs_referentie(self):
+        """
+        Aan het begin van elke analyse: is geneesmiddelen.db gewijzigd, dan worden de
+        ReferentieCache, db_spkodes en de SPKodeResolver samen opnieuw opgebouwd, en
+        resoluties van de oude versie vervallen (ResolutieCache.ververs).
+        """
+        versie = bestandsversie(self.db_path)
+        if versie != self._db_versie:
+            with self._referentie_lock:
+                if versie != self._db_versie:
+                    self.referentie_cache.ververs_indien_gewijzigd()
+                    bst052, bst004, bst070, bst711, naam_index = self._gstandaard
+                    db_spkodes = parse_medimo.get_spkodes_in_db(self.db_path)
+                    self.resolver = SPKodeResolver(bst052, bst004, bst070, bst711, db_spkodes, naam_index)
+                    self.db_spkodes = db_spkodes
+                    self._db_versie = versie
+        self.resolutie_cache.ververs(self.resolutie_versie())
+
+    def resolutie_versie(self):
+        return resolutie_versie(gstandaard.get_snapshot_id(self.snapshot_path), self.db_path, self.atc_db_path)
+
+    def _resolveer_regels(self, record, rapport=None):
+        """
+        Regels van een Patient-record als dicts, met per verschillende naam de Resolutie.
+        Met een RunRapport komt elke regel (met bron en tijden) in het rapport; bij een naam
+        die eerder bij deze patiënt voorkwam zijn bron en tijden leeg.
+        """
+        gm_list = [regel.als_dict() for regel in record.regels]
+        tijden = {} if rapport is not None else None
+        resoluties = resolveer_namen(
+            (gm["clean"] for gm in gm_list), self.resolver, self.resolutie_cache, self.db_path, self.atc_db_path,
+            tijden
+        )
+        if rapport is not None:
+            for gm in gm_list:
+                resolutie = resoluties[gm["clean"]]
+                rapport.voeg_regel_toe(
+                    record.naam, gm, resolutie, bool(resolutie.spkode) and resolutie.spkode in self.db_spkodes,
+                    tijden.pop(gm["clean"], None)
+                )
+        return gm_list, resoluties
+
+    def _resolveer_patiënt(self, record, egfr=None, rapport=None):
+        """
+        Koppelt elke regel van een Patient-record (medimo_stream) aan SPKode, FK- en ATC-gegevens.
+        Returns: (patiëntgegevens, invoer voor evalueer_afdeling)
+        """
+        if not isinstance(record, Patient):
+            raise TypeError(f"Patient-record (medimo_stream) verwacht, geen {type(record).__name__}")
+        naam = record.naam
+        geboortedatum = record.geboortedatum
+        leeftijd = parse_medimo.bereken_leeftijd(geboortedatum)  # None → leeftijdsgrens vervalt
+        # Eén resolutie per verschillende naam (uit de resolutiecache); daarna één regel per product
+        gm_list, resoluties = self._resolveer_regels(record, rapport)
+        for gm in gm_list:
+            resolutie = resoluties[gm["clean"]]
+            gm["SPKode"] = resolutie.spkode
+            gm["HPKode"] = resolutie.hpkode
+            gm["PRKodes"] = resolutie.prkodes
+            gm["groep"] = resolutie.groep
+            gm["atc_groep"] = resolutie.atc_groep
+            gm["atc_omschrijving"] = resolutie.atc_omschrijving
+            gm["jansen_omschrijving"] = resolutie.jansen_omschrijving
+        middelen_clean = voeg_regels_samen(gm_list)
+
+        # FK-naam als die er is, anders de naam uit Medimo
+        medicatielijst = [resoluties[gm["clean"]].fk_naam or gm["clean"] for gm in middelen_clean]
+
+        patiënt = {
+            "naam": naam,
+            "geboortedatum": geboortedatum,
+            "leeftijd": leeftijd,
+            "egfr": egfr,
+            "geneesmiddelen": middelen_clean,
+        }
+        invoer = {
+            "medicatielijst": medicatielijst,
+            "spkodes": [gm["SPKode"] for gm in middelen_clean],
+            "prkodes": [gm["PRKodes"] for gm in middelen_clean],
+            "interactiecodes": [regel_codes(gm["HPKode"], gm["PRKodes"]) for gm in middelen_clean],
+            "doseringen": [gm["dosering"] for gm in middelen_clean],
+            "leeftijd": leeftijd,
+            "egfr": egfr,
+        }
+        return patiënt, invoer
+
+    def evalueer(self, patiënten, invoer):
+        """
+        STOPP/START, ACB en dubbelmedicatie voor alle patiënten in één keer (matrixevaluatie);
+        de resultaten worden aan de patiëntgegevens toegevoegd.
+        Dubbelmedicatie volgens de G-Standaard (PRK-paren) komt na die op Kompas-groep;
+        interacties worden per patiënt in de HPK/PRK-paartabel opgezocht (None als de levering
+        geen interactietabellen bevat: dan is de controle niet uitgevoerd).
+        """
+        resultaten = evalueer_afdeling(invoer, self.stopp_regels, self.acb_tabel, self.db_path)
+        for patiënt, patiënt_invoer, resultaat in zip(patiënten, invoer, resultaten):
+            resultaat["dubbelmedicatie"] += check_dubbelmedicatie_gstandaard(
+                patiënt_invoer["medicatielijst"], patiënt_invoer["prkodes"], self.dubbelmedicatie_index
+            )
+            resultaat["interacties"] = check_interacties(
+                patiënt_invoer["medicatielijst"], patiënt_invoer["interactiecodes"], self.interactie_tabel
+            ) if len(self.interactie_tabel) else None
+            patiënt.update(resultaat)
+        return patiënten
+
+    def analyseer_patiënt(self, blok, egfr=None):
+        """
+        blok: patiëntblok als Medimo-tekst (kop 'Dhr. '/'Mevr. ' plus regels) of een Patient-record.
+        egfr: eGFR van deze patiënt (ml/min/1,73m²) of None als onbekend.
+        """
+        record = blok
+        if isinstance(blok, str):
+            record = next(iter(lees_medimo(blok)), None)
+            if record is None:
+                raise ValueError("Geen patiëntkop ('Dhr. ' of 'Mevr. ') gevonden in het blok.")
+        self.ververs_referentie()
+        patiënt, invoer = self._resolveer_patiënt(record, egfr)
+        self.resolutie_cache.schrijf()
+        return self.evalueer([patiënt], [invoer])[0]
+
+    def analyseer(self, medimo_text, voortgang=None, egfr_per_patiënt=None, rapport=None):
+        """
+        medimo_text: Medimo-export als tekst, of een stroom met regels (bestand, request-body).
+        voortgang: optionele callback(klaar, totaal, naam) die na elke patiënt wordt aangeroepen.
+        egfr_per_patiënt: optioneel {naam: eGFR}; naam zoals in de Medimo-kop, met of zonder geboortedatum.
+        rapport: optioneel RunRapport dat per regel de resolutie en per stap de tijd bijhoudt.
+        Returns: (patiënten_data, afdeling)
+        """
+        stap = rapport.stap if rapport is not None else (lambda naam: contextlib.nullcontext())
+        with stap("parsen"):
+            stream = lees_medimo(medimo_text)
+            records = list(stream)  # één doorgang; het aantal is nodig voor de voortgang
+        afdeling = stream.afdeling
+        if rapport is not None:
+            rapport.afdeling = afdeling
+        if voortgang:
+            voortgang(0, len(records), None)
+
+        self.ververs_referentie()
+        versie = self.cache_versie() if self.sectie_cache is not None else None
+        patiënten_data = []
+        nieuw, invoer = [], []
+        for record in records:
+            egfr = zoek_egfr(egfr_per_patiënt, record.naam)
+
+            # Ongewijzigde patiënt: analyse (en straks de gerenderde sectie) uit de cache
+            patiënt = sleutel = None
+            if self.sectie_cache is not None:
+                leeftijd = parse_medimo.bereken_leeftijd(record.geboortedatum)
+                sleutel = sectie_sleutel(record.blok, egfr, leeftijd, versie)
+                patiënt = self.sectie_cache.analyse(sleutel)
+            with stap("resolutie"):
+                if patiënt is None:
+                    patiënt, patiënt_invoer = self._resolveer_patiënt(record, egfr, rapport)
+                    patiënt["cache_sleutel"] = sleutel
+                    nieuw.append(patiënt)
+                    invoer.append(patiënt_invoer)
+                elif rapport is not None:
+                    self._resolveer_regels(record, rapport)  # sectie uit de cache; alleen voor het rapport
+
+            patiënten_data.append(patiënt)
+            if voortgang:
+                voortgang(len(patiënten_data), len(records), patiënt["naam"])
+
+        self.resolutie_cache.schrijf()
+
+        # Regels voor alle nieuwe patiënten tegelijk
+        with stap("evaluatie"):
+            self.evalueer(nieuw, invoer)
+        if self.sectie_cache is not None:
+            for patiënt in nieuw:
+                self.sectie_cache.bewaar_analyse(patiënt["cache_sleutel"], patiënt)
+        return patiënten_data, afdeling
+
+    @staticmethod
+    def bestandsnaam(afdeling):
+        return f"MedicatieReview_{afdeling}.docx"
+
+    def render(self, patiënten_data, afdeling, uitvoer=None, rapport=None, parallel=True):
+        """
+        rapport: optioneel RunRapport; wordt als bijlage achter in het document opgenomen.
+        parallel: False = niet in de render-pool maar in deze thread (bv. vanuit een jobthread).
+        """
+        return genereer_word_document(patiënten_data, afdeling, uitvoer, logo_path=self.logo_path,
+                                      pool=self.render_pool if parallel else None, cache=self.sectie_cache,
+                                      rapport=rapport)
+
+    def render_stream(self, patiënten_data, afdeling, rapport=None, parallel=True):
+        """
+        Generator met de bytes van het Word-document, patiënt voor patiënt.
+        """
+        return docx_stream(patiënten_data, afdeling, logo_path=self.logo_path,
+                           pool=self.render_pool if parallel else None, cache=self.sectie_cache, rapport=rapport)
+
+    def sluit(self):
+        """
+        Stopt de render-pool (als die er is).
+        """
+        if self.render_pool is not None:
+            self.render_pool.shutdown()
+            self.render_pool = None
+
+    def review(self, medimo_text, egfr_per_patiënt=None):
+        """
+        Medimo-tekst → bytes van het Word-document.
+        """
+        patiënten_data, afdeling = self.analyseer(medimo_text, egfr_per_patiënt=egfr_per_patiënt)
+        buffer = io.BytesIO()
+        self.render(patiënten_data, afdeling, buffer)
+        return buffer.getvalue()
+
+    @staticmethod
+    def rapportnaam(afdeling):
+        return f"Resolutierapport_{afdeling}.json"
+
+    def review_bestand(self, medimo_path, egfr_per_patiënt=None, rapport=False, rapport_docx=False):
+        """
+        Verwerkt een Medimo-export en schrijft Output/MedicatieReview_{afdeling}.docx.
+        rapport: ook Output/Resolutierapport_{afdeling}.json schrijven (zie RunRapport).
+        rapport_docx: het runrapport ook als bijlage in het document opnemen.
+        """
+        run_rapport = RunRapport() if rapport or rapport_docx else None
+        with open(medimo_path, "r", encoding="utf-8") as f:
+            medimo_text = f.read()
+        patiënten_data, afdeling = self.analyseer(medimo_text, egfr_per_patiënt=egfr_per_patiënt, rapport=run_rapport)
+        os.makedirs(self.output_dir, exist_ok=True)
+        doc_path = os.path.join(self.output_dir, self.bestandsnaam(afdeling))
+        if run_rapport is None:
+            self.render(patiënten_data, afdeling, doc_path)
         else:
-            doc.add_paragraph("Geen STOPP-criteria getriggerd.")
-
-        # Dubbelmedicatie
-        heading = doc.add_heading("Mogelijke dubbelmedicatie:", level=3)
-        heading.runs[0].font.color.rgb = RGBColor(0x00, 0x00, 0x80)
-        collapse_heading(heading, True)
-
-        if patiënt["dubbelmedicatie"]:
-            table = doc.add_table(rows=1, cols=2)
-            table.style = 'Table Grid'
-            hdr_cells = table.rows[0].cells
-            headers = ["Groep", "Geneesmiddelen"]
-            for i, text in enumerate(headers):
-                run = hdr_cells[i].paragraphs[0].add_run(text)
-                run.bold = True
-
-            for item in patiënt["dubbelmedicatie"]:
-                row_cells = table.add_row().cells
-                row_cells[0].text = str(item['groep']) if item['groep'] else "Onbekend"
-                
-                # Robuuste behandeling van middelen
-                middelen = item.get('middelen', [])
-                if isinstance(middelen, list):
-                    geneesmiddelen_text = ", ".join(str(middel) for middel in middelen if middel)
-                elif isinstance(middelen, str):
-                    geneesmiddelen_text = middelen
-                else:
-                    geneesmiddelen_text = str(middelen) if middelen else "Geen middelen"
-                    
-                row_cells[1].text = geneesmiddelen_text if geneesmiddelen_text else "Geen middelen"
+            with run_rapport.stap("renderen"):
+                self.render(patiënten_data, afdeling, doc_path, run_rapport if rapport_docx else None)
+        if rapport:
+            rapport_path = run_rapport.schrijf_json(os.path.join(self.output_dir, self.rapportnaam(afdeling)))
+            print(f"Resolutierapport opgeslagen als: {rapport_path}")
+        stat = self.resolutie_cache.statistiek()
+        print(f"Resolutiecache: {stat['hits']} hits, {stat['misses']} misses ({stat['items']} producten)")
+        print(f"Word-document opgeslagen als: {doc_path}")
+        return doc_path
+
+# ---------------------------
+# Batchmodus: meerdere afdelingen parallel
+# ---------------------------
+
+# Engine van dit proces; bij fork erven de workers die van het ouderproces (copy-on-write)
+_BATCH_ENGINE = None
+
+def _init_batch_worker(basis_dir):
+    global _BATCH_ENGINE
+    if _BATCH_ENGINE is None:
+        # Alleen bij 'spawn' (bv. Windows): dan bouwt elke worker zijn eigen engine
+        _BATCH_ENGINE = ReviewEngine(basis_dir)
+
+def _verwerk_batch_bestand(medimo_path, naam, egfr_per_patiënt=None, rapport=False, rapport_docx=False):
+    """
+    naam: uniek deel van de uitvoernamen binnen de batch (zie _uitvoernamen), niet de afdeling:
+    twee exports van dezelfde (of een onbekende) afdeling overschrijven elkaar zo niet.
+    """
+    t0 = time.perf_counter()
+    engine = _BATCH_ENGINE
+    run_rapport = RunRapport() if rapport or rapport_docx else None
+    with open(medimo_path, "r", encoding="utf-8") as f:
+        medimo_text = f.read()
+    with contextlib.redirect_stdout(io.StringIO()):
+        patiënten_data, afdeling = engine.analyseer(medimo_text, egfr_per_patiënt=egfr_per_patiënt, rapport=run_rapport)
+        os.makedirs(engine.output_dir, exist_ok=True)
+        doc_path = os.path.join(engine.output_dir, engine.bestandsnaam(naam))
+        if run_rapport is None:
+            engine.render(patiënten_data, afdeling, doc_path)
         else:
-            doc.add_paragraph("Geen dubbelmedicatie gevonden.")
-        
-        # ACB-score
-        heading = doc.add_heading("Anticholinerge belastingscore (ACB-score):", level=3)
-        heading.runs[0].font.color.rgb = RGBColor(0x00, 0x00, 0x80)
-        collapse_heading(heading, True)
-
-        score, interpretatie, middelen_met_bijdrage = patiënt["acb"]
-
-        para = doc.add_paragraph()
-        run = para.add_run("Totale score: ")
-        run.bold = True
-        para.add_run(f"{score} ({interpretatie})")
-
-        if middelen_met_bijdrage:
-            para = doc.add_paragraph()
-            run = para.add_run("Bijdragende geneesmiddelen:")
-            run.bold = True
-            
-            table = doc.add_table(rows=1, cols=2)
-            table.style = 'Table Grid'
-            hdr_cells = table.rows[0].cells
-            headers = ["Geneesmiddel", "ACB-Score"]
-            for i, text in enumerate(headers):
-                run = hdr_cells[i].paragraphs[0].add_run(text)
-                run.bold = True
-
-            for middel_info in middelen_met_bijdrage:
-                row_cells = table.add_row().cells
-                row_cells[0].text = middel_info['middel']
-                row_cells[1].text = str(middel_info['score'])
+            with run_rapport.stap("renderen"):
+                engine.render(patiënten_data, afdeling, doc_path, run_rapport if rapport_docx else None)
+    if rapport:
+        run_rapport.schrijf_json(os.path.join(engine.output_dir, engine.rapportnaam(naam)))
+
+    # Medimo-regels zoals aangeleverd, niet de samengevoegde productregels
+    regels = [regel for patiënt in patiënten_data for gm in patiënt["geneesmiddelen"] for regel in gm["regels"]]
+    return {
+        "bestand": medimo_path,
+        "afdeling": afdeling,
+        "document": doc_path,
+        "patiënten": len(patiënten_data),
+        "regels": len(regels),
+        "gematcht": sum(1 for gm in regels if gm["groep"]),
+        "seconden": time.perf_counter() - t0,
+    }
+
+def verzamel_medimo_bestanden(paden):
+    """
+    Mappen → alle .txt-bestanden erin; overige argumenten worden als glob-patroon behandeld.
+    """
+    bestanden = []
+    for pad in paden:
+        if os.path.isdir(pad):
+            bestanden.extend(sorted(glob.glob(os.path.join(pad, "*.txt"))))
         else:
-            doc.add_paragraph("Geen bijdragende middelen.")
-
-        # Medicatieoverzicht per groep
-        heading = doc.add_heading("Medicatieoverzicht:", level=3)
-        heading.runs[0].font.color.rgb = RGBColor(0x00, 0x00, 0x80)
-
-        groepen_dict = defaultdict(list)
-        for gm in patiënt["geneesmiddelen"]:
-            jansen_omschrijving = gm["jansen_omschrijving"] if gm["jansen_omschrijving"] else "Overig"
-            groepen_dict[jansen_omschrijving].append(gm)
-
-        gesorteerde_keys = sorted(groepen_dict.keys(), key=lambda k: (k == "Overig", k.lower()))
-
-        for jansen_omschrijving in gesorteerde_keys:
-            middelen = groepen_dict[jansen_omschrijving]
-            heading = doc.add_heading(f"{jansen_omschrijving}", level=4)
-            heading.runs[0].font.color.rgb = RGBColor(0x00, 0x00, 0x80)
-
-            table = doc.add_table(rows=1, cols=4)
-            table.style = 'Table Grid'
-            hdr_cells = table.rows[0].cells
-            headers = ["Geneesmiddel", "Geneesmiddelgroep", "Gebruik", "Opmerking Medimo"]
-            for i, text in enumerate(headers):
-                run = hdr_cells[i].paragraphs[0].add_run(text)
-                run.bold = True
-
-            for gm in middelen:
-                row_cells = table.add_row().cells
-                row_cells[0].text = gm["clean"]
-                row_cells[1].text = gm["groep"] if gm["groep"] else "-"
-                row_cells[2].text = gm["gebruik"]
-                row_cells[3].text = gm["opmerking"]
-
-            para = doc.add_paragraph()
-            run = para.add_run("Eerder besproken:")
-            run.bold = True
-            para = doc.add_paragraph()
-            run = para.add_run("Opmerking apotheker:")
-            run.bold = True
-            para = doc.add_paragraph()
-            run = para.add_run("Opmerking arts:\n")
-            run.bold = True
-
-    os.makedirs("Output", exist_ok=True)
-    doc_path = f"Output/MedicatieReview_{afdeling}.docx"
-    doc.save(doc_path)
-    print(f"Word-document opgeslagen als: {doc_path}")
-
-def main():
-    data, db_spkodes, afdeling = parse_medimo.run_parser()
-
-    patiënten_data = []
-    for patiënt in data:
-        naam = patiënt["patiënt"]
-
-        middelen_clean = []
-        medicatielijst = []
-        for gm in patiënt["geneesmiddelen"]:
-            fk_naam, fk_groep, atc_groep, atc_omschrijving, jansen_omschrijving = parse_medimo.match_to_fk_database(
-                gm["SPKode"], atc_db_path="ATC_groepen.db"
-            ) if gm["SPKode"] else (None, None, None, None, None)
-            
-            gm["groep"] = fk_groep
-            gm["atc_groep"] = atc_groep
-            gm["atc_omschrijving"] = atc_omschrijving
-            gm["jansen_omschrijving"] = jansen_omschrijving
-
-            # Alleen toevoegen aan medicatielijst als een herkenbare naam beschikbaar is
-            medicatielijst.append(fk_naam if fk_naam else gm["clean"])
-            middelen_clean.append(gm)
-
-        leeftijd = 75  # Of dynamisch uitlezen indien beschikbaar
-        stopp = check_stopp_criteria(medicatielijst, leeftijd)
-        acb_score, interpretatie, middelen_met_bijdrage = bereken_acb_score(medicatielijst)
-        acb = (acb_score, interpretatie, middelen_met_bijdrage)
-        dubbel = check_dubbelmedicatie(medicatielijst)
-
-        patiënten_data.append({
-            "naam": naam,
-            "geneesmiddelen": middelen_clean,
-            "stopp": stopp,
-            "acb": acb,
-            "dubbelmedicatie": dubbel
-        })
+            bestanden.extend(sorted(glob.glob(pad)))
+    return list(dict.fromkeys(bestanden))
 
-    genereer_word_document(patiënten_data, afdeling)
+def _uitvoernamen(bestanden):
+    """
+    Naam per invoerbestand voor de uitvoer: de bestandsnaam zonder extensie, met _2, _3, ...
+    als dezelfde naam in meerdere mappen voorkomt.
+    """
+    namen = []
+    gezien = set()
+    for pad in bestanden:
+        basis = os.path.splitext(os.path.basename(pad))[0]
+        naam, n = basis, 1
+        while naam.lower() in gezien:
+            n += 1
+            naam = f"{basis}_{n}"
+        gezien.add(naam.lower())
+        namen.append(naam)
+    return namen
+
+def batch(paden, workers=None, basis_dir="", egfr_per_patiënt=None, rapport=False, rapport_docx=False):
+    """
+    Verwerkt meerdere Medimo-exports in een procespool. De referentiedata wordt één keer
+    in het ouderproces geladen en via fork gedeeld met de workers. De documenten heten naar
+    het invoerbestand (MedicatieReview_{bestand}.docx), zodat parallelle exports van dezelfde
+    afdeling elkaar niet overschrijven.
+    """
+    global _BATCH_ENGINE
+    bestanden = verzamel_medimo_bestanden(paden)
+    if not bestanden:
+        print("Geen Medimo-exports gevonden.")
+        return []
+
+    t0 = time.perf_counter()
+    _BATCH_ENGINE = ReviewEngine(basis_dir)
+    print(f"Referentiedata geladen in {time.perf_counter() - t0:.2f}s; {len(bestanden)} afdeling(en) verwerken...")
+
+    context = None
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+        gc.freeze()  # geladen indexen niet meer door de GC laten aanraken → minder gekopieerde pagina's
+
+    resultaten = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_batch_worker, initargs=(basis_dir,)) as pool:
+        for resultaat in pool.map(_verwerk_batch_bestand, bestanden, _uitvoernamen(bestanden), repeat(egfr_per_patiënt), repeat(rapport),
+                                  repeat(rapport_docx)):
+            resultaten.append(resultaat)
+            matchrate = resultaat["gematcht"] / resultaat["regels"] * 100 if resultaat["regels"] else 0.0
+            print(f"  {resultaat['afdeling']:<30} {resultaat['patiënten']:>4} patiënten  "
+                  f"{resultaat['gematcht']:>4}/{resultaat['regels']:<4} regels gematcht ({matchrate:5.1f}%)  "
+                  f"{resultaat['seconden']:6.2f}s  → {resultaat['document']}")
+
+    totaal_regels = sum(r["regels"] for r in resultaten)
+    totaal_gematcht = sum(r["gematcht"] for r in resultaten)
+    matchrate = totaal_gematcht / totaal_regels * 100 if totaal_regels else 0.0
+    print(f"Klaar: {len(resultaten)} afdeling(en), {totaal_gematcht}/{totaal_regels} regels gematcht "
+          f"({matchrate:.1f}%) in {time.perf_counter() - t0:.2f}s")
+    return resultaten
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Voorbereiding medicatiebeoordeling op basis van Medimo-export(s).")
+    parser.add_argument("--batch", nargs="+", metavar="PAD",
+                        help="Map(pen) of glob-patroon(en) met Medimo-exports; één document per exportbestand")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Aantal processen in batchmodus (standaard: aantal CPU's)")
+    parser.add_argument("--render-workers", type=int, default=None,
+                        help="Aantal processen voor het renderen van de patiëntsecties (alleen zonder --batch)")
+    parser.add_argument("--egfr", metavar="BESTAND",
+                        help="JSON-bestand met eGFR per patiënt, bv. {\"Mevr. M Curie\": 42}")
+    parser.add_argument("--rapport", action="store_true",
+                        help="Schrijf per afdeling Output/Resolutierapport_{afdeling}.json (resolutie en tijd per regel)")
+    parser.add_argument("--rapport-docx", action="store_true",
+                        help="Neem het resolutierapport ook als bijlage op in het Word-document")
+    args = parser.parse_args(argv)
+
+    egfr_per_patiënt = laad_egfr_bestand(args.egfr) if args.egfr else None
+    if args.batch:
+        batch(args.batch, args.workers, egfr_per_patiënt=egfr_per_patiënt, rapport=args.rapport,
+              rapport_docx=args.rapport_docx)
+    else:
+        engine = ReviewEngine(render_workers=args.render_workers)
+        try:
+            engine.review_bestand("Data/medimo_input.txt", egfr_per_patiënt, args.rapport, args.rapport_docx)
+        finally:
+            engine.sluit()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()